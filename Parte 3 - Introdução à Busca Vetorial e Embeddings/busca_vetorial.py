@@ -4,15 +4,289 @@ Sistema de Busca Vetorial Interativo
 Parte 3: Introdução à Busca Vetorial e Embeddings
 """
 
-from sentence_transformers import SentenceTransformer
-from elasticsearch import Elasticsearch
+from elasticsearch import (ConnectionError, ConnectionTimeout, Elasticsearch,
+                           NotFoundError)
+from concurrent.futures import ThreadPoolExecutor
 import sys
+import threading
 import time
 import logging
 
+from cache_consultas import CacheLRU, NormalizadorConsultas, normalizar_consulta
+from cache_respostas import CacheRespostas
+from fusao_rrf import resposta_rrf
+from inicio_rapido import CONSULTAS_AQUECIMENTO, ModeloPreguicoso, carregar_modelo
+from knn_exato import KnnExato
+from mapeamento import (CAMPOS_VETORES, campo_precisao_total, meta_do_indice,
+                        reranquear, vetor_consulta)
+from metricas import (METRICAS_NULAS, iniciar_servidor_metricas, metricas_padrao,
+                      serializadores_medidos)
+from reducao_dimensional import ProjecaoPCA, projecao_do_meta
+from respostas_enxutas import (FILTRO_BUSCA, FILTRO_MSEARCH, garantir_hits,
+                               opcoes_cliente)
+from servidor_embeddings import ServidorEmbeddings
+from vizinhos_precomputados import CAMPOS_EXIBICAO, INDICE_VIZINHOS, TabelaVizinhos
+
+
+CAMPOS_RETORNO = ["titulo", "conteudo", "categoria", "data_publicacao"]
+
+
+def corpo_similaridade(query_embedding, campo="conteudo_embedding", k=5):
+    """Monta o corpo da busca kNN por similaridade"""
+    return {
+        "knn": {
+            "field": campo,
+            "query_vector": query_embedding,
+            "k": k,
+            "num_candidates": max(50, k)
+        },
+        "size": k,
+        "_source": CAMPOS_RETORNO
+    }
+
+
+def corpo_lexical(query, k=50):
+    """Monta o corpo da busca textual (BM25) usada como perna da fusão RRF"""
+    return {
+        "query": {
+            "multi_match": {
+                "query": query,
+                "fields": ["titulo^2", "conteudo"]
+            }
+        },
+        "size": k,
+        "_source": CAMPOS_RETORNO
+    }
+
+
+def corpo_quantizado(query_vector, campo="conteudo_embedding", k=5,
+                     fator_oversampling=4, quantizacao="byte"):
+    """Monta a primeira fase da busca em índice quantizado
+
+    Pede `k * fator_oversampling` candidatos ao HNSW quantizado, já trazendo
+    os vetores float32 para o reranqueamento no cliente.
+    """
+    candidatos = k * fator_oversampling
+    return {
+        "knn": {
+            "field": campo,
+            "query_vector": query_vector,
+            "k": candidatos,
+            "num_candidates": max(50, 2 * candidatos)
+        },
+        "size": candidatos,
+        "_source": CAMPOS_RETORNO + [campo_precisao_total(campo, quantizacao)]
+    }
+
+
+def corpo_hibrida(query_embedding, categoria=None, k=5):
+    """Monta o corpo da busca híbrida (kNN com filtro de categoria)"""
+    body = {
+        "knn": {
+            "field": "conteudo_embedding",
+            "query_vector": query_embedding,
+            "k": k,
+            "num_candidates": 100
+        },
+        "_source": CAMPOS_RETORNO
+    }
+
+    # O filtro entra no próprio kNN: o HNSW só considera documentos da
+    # categoria, então voltam k resultados (se a categoria tiver k documentos)
+    if categoria:
+        body["knn"]["filter"] = {"term": {"categoria": categoria}}
+
+    return body
+
+
+def corpo_combinada(query, query_embedding, boost_vetorial=1.0,
+                    boost_textual=1.0, k=10):
+    """Monta o corpo da busca combinada (vetorial + textual)"""
+    return {
+        "query": {
+            "bool": {
+                "should": [
+                    {
+                        "multi_match": {
+                            "query": query,
+                            "fields": ["titulo^2", "conteudo"],
+                            "boost": boost_textual
+                        }
+                    }
+                ]
+            }
+        },
+        "knn": {
+            "field": "conteudo_embedding",
+            "query_vector": query_embedding,
+            "k": k,
+            "num_candidates": 100,
+            "boost": boost_vetorial
+        },
+        "_source": CAMPOS_RETORNO
+    }
+
+
+def corpo_vetorial(query_embedding, campo="conteudo_embedding", k=5,
+                   quantizacao=None, fator_oversampling=4):
+    """Corpo da busca por similaridade: direta ou com oversampling se quantizado"""
+    if quantizacao:
+        return corpo_quantizado(
+            vetor_consulta(query_embedding, quantizacao), campo=campo, k=k,
+            fator_oversampling=fator_oversampling, quantizacao=quantizacao)
+    return corpo_similaridade(query_embedding, campo=campo, k=k)
+
+
+def corpo_recomendacao(embedding, doc_id, k=3):
+    """Monta o corpo do kNN de recomendação, excluindo o próprio documento
+
+    Traz só os campos guardados na tabela de vizinhos (CAMPOS_EXIBICAO), para
+    que a recomendação tenha o mesmo formato com ou sem a tabela.
+    """
+    return {
+        "knn": {
+            "field": "conteudo_embedding",
+            "query_vector": embedding,
+            "k": k + 1,
+            "num_candidates": 50
+        },
+        "query": {
+            "bool": {
+                "must_not": [
+                    {"term": {"_id": doc_id}}
+                ]
+            }
+        },
+        "_source": list(CAMPOS_EXIBICAO)
+    }
+
+
+def rota_categoria(roteamento, categoria):
+    """Valor de _routing de uma busca filtrada (None consulta todos os shards)"""
+    if roteamento and categoria:
+        return categoria
+    return None
+
+
+def campos_documento(source_enxuto):
+    """Campos do _source lidos para recomendar a partir de um documento
+
+    Sem os vetores no _source, o embedding é recalculado do conteúdo.
+    """
+    return ["conteudo"] if source_enxuto else ["conteudo_embedding"]
+
+
+def busca_por_id(doc_id, campos):
+    """Parâmetros do es.search que acham um documento pelo id em todos os shards
+
+    Em índice roteado por categoria, o shard do documento não pode ser
+    calculado só pelo id, então o get não serve.
+    """
+    return {"query": {"ids": {"values": [doc_id]}}, "size": 1, "source": campos}
+
+
+def documento_encontrado(response, doc_id):
+    """O hit de uma busca_por_id, ou ValueError se o documento não existir"""
+    hits = response["hits"]["hits"]
+    if not hits:
+        raise ValueError(f"Documento {doc_id} não encontrado")
+    return hits[0]
+
+
+def chaves_pernas(query, consulta_normalizada, nome_modelo, janela_lexical,
+                  janela_vetorial, campo):
+    """Chaves de cache das pernas lexical e vetorial da busca RRF
+
+    O analisador standard do multi_match já ignora a caixa, então a perna
+    lexical sempre usa a consulta em minúsculas; a vetorial usa a
+    normalização do modelo (`consulta_normalizada`).
+    """
+    return (("lexical", normalizar_consulta(query, minusculas=True), janela_lexical),
+            ("vetorial", nome_modelo, consulta_normalizada, janela_vetorial, campo))
+
+
+class OpcoesCache:
+    """Caches da BuscaVetorial: embeddings de consulta, pernas RRF e respostas
+
+    `respostas=True` ativa o cache de respostas completas (cache_respostas.py),
+    em memória e, com `respostas_dir`, também em disco.
+    """
+
+    def __init__(self, max_itens=10000, ttl=3600, max_mb=64, pernas_itens=2000,
+                 pernas_ttl=60, respostas=False, respostas_dir=None,
+                 respostas_intervalo=1.0):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.max_mb = max_mb
+        self.pernas_itens = pernas_itens
+        self.pernas_ttl = pernas_ttl
+        self.respostas = respostas
+        self.respostas_dir = respostas_dir
+        self.respostas_intervalo = respostas_intervalo
+
+
+class OpcoesModoDegradado:
+    """kNN exato em memória usado quando o Elasticsearch está inacessível
+
+    `busca_local=True` carrega a cópia do índice na inicialização; `knn_local`
+    recebe um KnnExato já carregado (ex.: de exportar_vetores.py).
+    """
+
+    def __init__(self, busca_local=False, knn_local=None):
+        self.busca_local = busca_local
+        self.knn_local = knn_local
+
+
+class OpcoesMetricas:
+    """Histogramas do Prometheus (`ativas`), endpoint /metrics e logs por busca"""
+
+    def __init__(self, ativas=False, porta=None, log_detalhado=False):
+        self.ativas = ativas
+        self.porta = porta
+        self.log_detalhado = log_detalhado
+
+
+class OpcoesInicio:
+    """Início rápido (modelo em segundo plano) e aquecimento
+
+    Com `aquecer=None`, o aquecimento acompanha `rapido`.
+    """
+
+    def __init__(self, rapido=False, aquecer=None, consultas_aquecimento=None):
+        self.rapido = rapido
+        self.aquecer = aquecer
+        self.consultas_aquecimento = consultas_aquecimento
+
+
+def caches_consulta(opcoes):
+    """Caches de embeddings de consulta e de pernas RRF descritos por um OpcoesCache"""
+    embeddings = CacheLRU(max_itens=opcoes.max_itens, ttl=opcoes.ttl,
+                          max_bytes=opcoes.max_mb * 1024 * 1024)
+    pernas = CacheLRU(max_itens=opcoes.pernas_itens, ttl=opcoes.pernas_ttl)
+    return embeddings, pernas
+
+
+def metricas_do_servico(opcoes):
+    """Métricas descritas por um OpcoesMetricas, expondo /metrics se houver porta"""
+    metricas = METRICAS_NULAS
+    if opcoes.ativas or opcoes.porta:
+        metricas = metricas_padrao()
+    if opcoes.porta:
+        iniciar_servidor_metricas(opcoes.porta)
+    return metricas
+
 
 class BuscaVetorial:
-    def __init__(self):
+    def __init__(self, nome_modelo='all-MiniLM-L6-v2', cache=None, degradado=None,
+                 metricas=None, inicio=None, micro_lotes=False, janela_ms=5.0,
+                 max_lote=64, fator_oversampling=4, arquivo_reducao=None,
+                 workers_pernas=4, respostas_enxutas=False):
+        self._inicio = time.perf_counter()
+        cache = cache or OpcoesCache()
+        degradado = degradado or OpcoesModoDegradado()
+        metricas = metricas or OpcoesMetricas()
+        inicio = inicio or OpcoesInicio()
+
         # Configurar logging
         logging.basicConfig(
             level=logging.INFO,
@@ -23,138 +297,469 @@ class BuscaVetorial:
 
         self.logger.info("Inicializando sistema de busca vetorial")
 
-        # Inicializar modelo e Elasticsearch
-        self.logger.info("Carregando modelo SentenceTransformer")
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.nome_modelo = nome_modelo
+        self._iniciar_modelo(inicio.rapido)
+
+        # Com micro-lotes, encodes simultâneos (de várias threads) são agrupados
+        # em um único forward; senão o modelo é chamado diretamente
+        self.servidor_embeddings = None
+        self.codificador = self.model
+        if micro_lotes:
+            self.servidor_embeddings = ServidorEmbeddings(
+                self.model, janela_ms=janela_ms, max_lote=max_lote)
+            self.codificador = self.servidor_embeddings
+
+        self._executor_pernas = ThreadPoolExecutor(
+            max_workers=workers_pernas, thread_name_prefix="perna")
+
+        # Modo enxuto: filter_path nas buscas e (de)serialização com orjson
+        self.respostas_enxutas = respostas_enxutas
+
+        self._iniciar_metricas(metricas)
 
         self.logger.info("Conectando ao Elasticsearch")
+        opcoes = opcoes_cliente(respostas_enxutas)
+        if self.metricas is not METRICAS_NULAS:
+            # O parse da resposta acontece dentro do cliente: só é medível no serializador
+            opcoes["serializers"] = serializadores_medidos(opcoes.get("serializers"))
         self.es = Elasticsearch(
-            [{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
+            [{'host': 'localhost', 'port': 9200, 'scheme': 'http'}], **opcoes)
+
+        self._iniciar_caches(cache)
+
+        # kNN exato em memória usado quando o Elasticsearch está inacessível
+        self.knn_local = degradado.knn_local
+        # Modo de quantização do índice (lido do _meta do mapeamento)
+        self.quantizacao = None
+        self.fator_oversampling = fator_oversampling
+        # Projeção aplicada aos embeddings de consulta (a mesma da ingestão)
+        self.projecao = None
+        # Campo usado como _routing no índice (None = roteamento padrão por _id)
+        self.roteamento = None
+        # Índice sem os vetores no _source (mapeamento com source enxuto)
+        self.source_enxuto = False
+        # Vizinhos pré-calculados (vizinhos_precomputados.py), se a tabela existir
+        self.tabela_vizinhos = None
 
         # Verificar conexão
-        if not self.es.ping():
+        cluster_disponivel = self.es.ping()
+        if cluster_disponivel:
+            self._ler_indice(arquivo_reducao, degradado.busca_local)
+        else:
+            self._entrar_modo_degradado(arquivo_reducao)
+
+        self._pronto_em = time.perf_counter()
+        self.logger.info(f"Sistema pronto para uso em {self._pronto_em - self._inicio:.2f}s")
+
+        self._iniciar_aquecimento(inicio, cluster_disponivel)
+
+    def _iniciar_modelo(self, rapido):
+        """Carrega o modelo ou, no início rápido, dispara a carga em segundo plano
+
+        No início rápido, o import do torch e a carga dos pesos rodam enquanto
+        o cluster é consultado; a primeira busca só espera se a carga não
+        terminou.
+        """
+        if rapido:
+            self.logger.info("Carregando modelo SentenceTransformer em segundo plano")
+            self.model = ModeloPreguicoso(self.nome_modelo)
+            self._modelo_pronto_em = None
+        else:
+            self.logger.info("Carregando modelo SentenceTransformer")
+            self.model = carregar_modelo(self.nome_modelo)
+            self._modelo_pronto_em = time.perf_counter()
+
+        # Chaves de cache ignoram a caixa só se o tokenizador for uncased
+        self.normalizar_consulta = NormalizadorConsultas(self.model)
+
+    def _iniciar_caches(self, opcoes):
+        """Cria os caches de embeddings, de pernas RRF e, se pedido, de respostas"""
+        # Cache de embeddings de consulta compartilhado por todas as buscas e
+        # resultados de cada perna da busca RRF, cacheados separadamente: a
+        # mesma perna lexical serve a janelas vetoriais diferentes e vice-versa
+        self.cache_embeddings, self.cache_pernas = caches_consulta(opcoes)
+
+        # Respostas completas de buscar_por_similaridade, busca_hibrida e
+        # busca_combinada, invalidadas quando a geração do índice muda
+        self.cache_respostas = None
+        if opcoes.respostas:
+            self.cache_respostas = CacheRespostas(
+                self.es, "artigos_vetorial", diretorio=opcoes.respostas_dir,
+                intervalo_geracao=opcoes.respostas_intervalo,
+                normalizar=self.normalizar_consulta)
+
+    def _iniciar_metricas(self, opcoes):
+        """Histogramas do Prometheus por estágio e, com `porta`, o /metrics"""
+        # Encode, requisição, took, parse, hits e caches
+        self.metricas = metricas_do_servico(opcoes)
+        # Logs por busca custam vazão: só com log_detalhado=True
+        self.log_detalhado = opcoes.log_detalhado
+
+    def _ler_indice(self, arquivo_reducao, busca_local):
+        """Lê do _meta do índice a quantização, o roteamento e a projeção"""
+        meta = meta_do_indice(self.es, "artigos_vetorial")
+        self.quantizacao = meta.get("quantizacao")
+        self.roteamento = meta.get("roteamento")
+        self.source_enxuto = bool(meta.get("source_enxuto"))
+        self.projecao = projecao_do_meta(meta, arquivo_reducao)
+        if self.projecao is not None:
+            self.logger.info(
+                f"Índice com redução dimensional: consultas projetadas de "
+                f"{self.projecao.dims_entrada} para {self.projecao.dims} dimensões")
+        if self.quantizacao:
+            self.logger.info(
+                f"Índice quantizado ({self.quantizacao}): buscas por similaridade "
+                f"reranqueiam {self.fator_oversampling}x candidatos")
+        if self.es.indices.exists(index=INDICE_VIZINHOS):
+            self.tabela_vizinhos = TabelaVizinhos(self.es, "artigos_vetorial")
+            self.logger.info("Recomendações usarão a tabela de vizinhos pré-calculados")
+        if busca_local and self.knn_local is None:
+            self.logger.info("Carregando vetores para o kNN exato local")
+            self.knn_local = KnnExato.carregar_do_indice(self.es)
+
+    def _entrar_modo_degradado(self, arquivo_reducao):
+        """Sem cluster, segue só com o kNN exato local (ou encerra se não houver)"""
+        if self.knn_local is None:
             self.logger.error("Não foi possível conectar ao Elasticsearch")
             sys.exit(1)
-
-        self.logger.info("Sistema pronto para uso")
+        self.logger.warning(
+            "Elasticsearch indisponível: buscas por similaridade usarão o kNN exato local")
+        if arquivo_reducao:
+            self.projecao = ProjecaoPCA.carregar(arquivo_reducao)
+
+    def _iniciar_aquecimento(self, opcoes, cluster_disponivel):
+        """Dispara o aquecimento em segundo plano, se pedido
+
+        Encodes e buscas kNN representativas trazem o modelo, o page cache e
+        o grafo HNSW para a memória antes do tráfego.
+        """
+        self._aquecimento_em = None
+        self._aquecimento = threading.Event()
+        aquecer = opcoes.rapido if opcoes.aquecer is None else opcoes.aquecer
+        if aquecer and cluster_disponivel:
+            threading.Thread(
+                target=self.aquecer,
+                args=(opcoes.consultas_aquecimento or CONSULTAS_AQUECIMENTO,),
+                name="aquecimento", daemon=True).start()
+        else:
+            self._aquecimento.set()
+
+    @property
+    def tempos_inicio(self):
+        """Segundos desde o início da construção até cada etapa já concluída"""
+        pronto_modelo = getattr(self.model, "pronto_em", self._modelo_pronto_em)
+        etapas = {"construcao": self._pronto_em, "modelo": pronto_modelo,
+                  "aquecimento": self._aquecimento_em}
+        return {etapa: instante - self._inicio for etapa, instante in etapas.items()
+                if instante is not None}
+
+    def aquecer(self, consultas=CONSULTAS_AQUECIMENTO, k=10):
+        """Roda encodes e buscas kNN representativas, fora dos caches e das métricas
+
+        Cada consulta é buscada em todos os campos vetoriais, com
+        `request_cache=False`, para que as estruturas de todos eles sejam
+        lidas de verdade.
+        """
+        inicio = time.perf_counter()
+        try:
+            for consulta in consultas:
+                embedding = self._projetar(self.codificador.encode(consulta)).tolist()
+                for campo in CAMPOS_VETORES:
+                    self.es.search(index="artigos_vetorial",
+                                   body=self._corpo_similaridade(embedding, campo=campo, k=k),
+                                   filter_path=["took"], request_cache=False)
+            self.logger.info(
+                f"Aquecimento concluído: {len(consultas)} consultas em "
+                f"{time.perf_counter() - inicio:.2f}s")
+        except Exception as e:
+            self.logger.warning(f"Aquecimento interrompido: {e}")
+        finally:
+            self._aquecimento_em = time.perf_counter()
+            self._aquecimento.set()
+
+    def aguardar_aquecimento(self, timeout=None):
+        """Bloqueia até o aquecimento terminar (True) ou o timeout expirar (False)"""
+        return self._aquecimento.wait(timeout)
+
+    def _embedding_consulta(self, query):
+        """Gera o embedding da consulta, reaproveitando o cache quando possível"""
+        chave = (self.nome_modelo, self.normalizar_consulta(query))
+        embedding = self.cache_embeddings.obter(chave)
+        self.metricas.observar_cache("embeddings", embedding is not None)
+        if embedding is None:
+            with self.metricas.medir_encode("consulta"):
+                embedding = self._projetar(self.codificador.encode(query))
+            self.cache_embeddings.inserir(chave, embedding)
+        return embedding.tolist()
+
+    def _projetar(self, embeddings):
+        """Aplica a redução dimensional do índice, se houver"""
+        if self.projecao is None:
+            return embeddings
+        return self.projecao.aplicar(embeddings)
+
+    def _embeddings_consultas(self, queries):
+        """Gera os embeddings de várias consultas com uma única chamada ao modelo"""
+        chaves = [(self.nome_modelo, self.normalizar_consulta(q)) for q in queries]
+        embeddings = [self.cache_embeddings.obter(chave) for chave in chaves]
+        for embedding in embeddings:
+            self.metricas.observar_cache("embeddings", embedding is not None)
+
+        # Consultas repetidas no lote são codificadas uma única vez
+        faltantes = {}
+        for i, (chave, embedding) in enumerate(zip(chaves, embeddings)):
+            if embedding is None:
+                faltantes.setdefault(chave, []).append(i)
+
+        if faltantes:
+            grupos = list(faltantes.values())
+            with self.metricas.medir_encode("lote"):
+                novos = self._projetar(
+                    self.codificador.encode([queries[g[0]] for g in grupos]))
+            for chave, grupo, embedding in zip(faltantes, grupos, novos):
+                self.cache_embeddings.inserir(chave, embedding)
+                for i in grupo:
+                    embeddings[i] = embedding
+
+        return [embedding.tolist() for embedding in embeddings]
 
     def buscar_por_similaridade(self, query, campo="conteudo_embedding", k=5):
         """Busca por similaridade usando embeddings"""
-        self.logger.info(f"Buscando por: '{query}'")
+        if self.log_detalhado:
+            self.logger.info(f"Buscando por: '{query}'")
 
+        inicio = time.perf_counter()
+        try:
+            response = self._com_cache(
+                "similaridade", query, {"campo": campo, "k": k},
+                lambda: self._similaridade_es(query, campo, k))
+        except (ConnectionError, ConnectionTimeout) as e:
+            if self.knn_local is None or self.knn_local.campo != campo:
+                raise
+            # Modo degradado: mesma resposta, calculada sobre a cópia local
+            self.logger.warning(f"Elasticsearch inacessível ({e}); usando kNN exato local")
+            response = self.knn_local.resposta(self._embedding_consulta(query), k=k)
+
+        if self.log_detalhado:
+            self.logger.info(f"Tempo total: {time.perf_counter() - inicio:.3f}s")
+            self.logger.info(
+                f"Encontrados {len(response['hits']['hits'])} resultados")
+
+        return response
+
+    def _similaridade_es(self, query, campo, k):
+        """Busca kNN no Elasticsearch, reranqueada se o índice for quantizado"""
         # Gerar embedding da consulta
-        inicio = time.time()
-        query_embedding = self.model.encode(query).tolist()
-        tempo_embedding = time.time() - inicio
+        inicio = time.perf_counter()
+        query_embedding = self._embedding_consulta(query)
+        tempo_embedding = time.perf_counter() - inicio
 
         # Executar busca kNN
-        inicio_busca = time.time()
-        response = self.es.search(
-            index="artigos_vetorial",
-            body={
-                "knn": {
-                    "field": campo,
-                    "query_vector": query_embedding,
-                    "k": k,
-                    "num_candidates": 50
-                },
-                "_source": ["titulo", "conteudo", "categoria", "data_publicacao"]
-            }
-        )
-        tempo_busca = time.time() - inicio_busca
+        inicio_busca = time.perf_counter()
+        response = self._buscar(
+            "similaridade",
+            body=self._corpo_similaridade(query_embedding, campo=campo, k=k))
+        if self.quantizacao:
+            reranquear(response, query_embedding, campo, k, self.quantizacao)
+        tempo_busca = time.perf_counter() - inicio_busca
+
+        if self.log_detalhado:
+            self.logger.info(f"Tempo de embedding: {tempo_embedding:.3f}s")
+            self.logger.info(f"Tempo de busca: {tempo_busca:.3f}s")
+        return response
+
+    def _com_cache(self, metodo, query, parametros, executar):
+        """Executa a busca passando pelo cache de respostas, se ativo"""
+        if self.cache_respostas is None:
+            return executar()
+
+        executadas = []
 
-        self.logger.info(f"Tempo de embedding: {tempo_embedding:.3f}s")
-        self.logger.info(f"Tempo de busca: {tempo_busca:.3f}s")
-        self.logger.info(
-            f"Encontrados {len(response['hits']['hits'])} resultados")
+        def executar_registrando():
+            executadas.append(metodo)
+            return executar()
 
+        response = self.cache_respostas.buscar(
+            metodo, query, {"modelo": self.nome_modelo, **parametros},
+            executar_registrando)
+        self.metricas.observar_cache("respostas", not executadas)
         return response
 
     def busca_hibrida(self, query, categoria=None, k=5):
         """Busca híbrida combinando vetorial com filtros"""
-        query_embedding = self.model.encode(query).tolist()
-
-        # Construir consulta híbrida
-        body = {
-            "knn": {
-                "field": "conteudo_embedding",
-                "query_vector": query_embedding,
-                "k": k,
-                "num_candidates": 100
-            },
-            "_source": ["titulo", "conteudo", "categoria", "data_publicacao"]
-        }
-
-        # Adicionar filtro de categoria se especificado
-        if categoria:
-            body["query"] = {
-                "bool": {
-                    "filter": [
-                        {"term": {"categoria": categoria}}
-                    ]
-                }
-            }
+        def busca():
+            query_embedding = self._embedding_consulta(query)
+            body = corpo_hibrida(vetor_consulta(query_embedding, self.quantizacao),
+                                 categoria=categoria, k=k)
+            return self._buscar("hibrida", body=body,
+                                routing=rota_categoria(self.roteamento, categoria))
 
-        response = self.es.search(index="artigos_vetorial", body=body)
-        return response
+        return self._com_cache("hibrida", query, {"categoria": categoria, "k": k},
+                               busca)
 
     def busca_combinada(self, query, boost_vetorial=1.0, boost_textual=1.0, k=10):
         """Busca combinada (vetorial + textual)"""
-        query_embedding = self.model.encode(query).tolist()
-
-        body = {
-            "query": {
-                "bool": {
-                    "should": [
-                        {
-                            "multi_match": {
-                                "query": query,
-                                "fields": ["titulo^2", "conteudo"],
-                                "boost": boost_textual
-                            }
-                        }
-                    ]
-                }
-            },
-            "knn": {
-                "field": "conteudo_embedding",
-                "query_vector": query_embedding,
-                "k": k,
-                "num_candidates": 100,
-                "boost": boost_vetorial
-            },
-            "_source": ["titulo", "conteudo", "categoria", "data_publicacao"]
-        }
-
-        return self.es.search(index="artigos_vetorial", body=body)
+        def busca():
+            query_embedding = vetor_consulta(self._embedding_consulta(query),
+                                             self.quantizacao)
+            body = corpo_combinada(query, query_embedding, boost_vetorial=boost_vetorial,
+                                   boost_textual=boost_textual, k=k)
+            return self._buscar("combinada", body=body)
+
+        parametros = {"boost_vetorial": boost_vetorial, "boost_textual": boost_textual,
+                      "k": k}
+        return self._com_cache("combinada", query, parametros, busca)
+
+    def busca_rrf(self, query, k=10, janela_lexical=50, janela_vetorial=50,
+                  constante_rrf=60, campo="conteudo_embedding"):
+        """Busca híbrida com as pernas textual e vetorial fundidas por RRF
+
+        A perna lexical (multi_match) roda no pool de pernas enquanto esta
+        thread gera o embedding e executa a perna kNN, então a latência é a
+        da perna mais lenta. Cada perna traz os `janela_*` melhores
+        documentos, fica em cache por conta própria e a fusão usa só as
+        posições, sem misturar as escalas de BM25 e cosseno.
+        """
+        inicio = time.perf_counter()
+        chave_lexical, chave_vetorial = chaves_pernas(
+            query, self.normalizar_consulta(query), self.nome_modelo,
+            janela_lexical, janela_vetorial, campo)
+        lexical = self._executor_pernas.submit(
+            self._perna, chave_lexical,
+            lambda: self._buscar("rrf_lexical",
+                                 body=corpo_lexical(query, k=janela_lexical)))
+
+        def busca_vetorial():
+            query_embedding = self._embedding_consulta(query)
+            response = self._buscar(
+                "rrf_vetorial",
+                body=self._corpo_similaridade(query_embedding, campo=campo,
+                                              k=janela_vetorial))
+            if self.quantizacao:
+                reranquear(response, query_embedding, campo, janela_vetorial,
+                           self.quantizacao)
+            return response
+
+        vetorial = self._perna(chave_vetorial, busca_vetorial)
+
+        pernas = {"lexical": lexical.result(), "vetorial": vetorial}
+        tempo_total = time.perf_counter() - inicio
+        if self.log_detalhado:
+            self.logger.info(
+                f"RRF: {len(pernas['lexical'])} hits lexicais e "
+                f"{len(pernas['vetorial'])} vetoriais fundidos em {tempo_total:.3f}s")
+
+        return resposta_rrf(pernas, k=k, constante=constante_rrf,
+                            took=int(tempo_total * 1000))
+
+    def _perna(self, chave, executar):
+        """Hits de uma perna da busca RRF, do cache ou do Elasticsearch"""
+        hits = self.cache_pernas.obter(chave)
+        self.metricas.observar_cache(f"perna_{chave[0]}", hits is not None)
+        if hits is None:
+            hits = executar()["hits"]["hits"]
+            self.cache_pernas.inserir(chave, hits)
+        return hits
+
+    def buscar_lote(self, consultas, tipo="similaridade", **parametros):
+        """Executa várias buscas com um único encode e uma única requisição _msearch
+
+        Cada consulta pode ser uma string ou um dicionário com "query" e,
+        opcionalmente, "tipo" ("similaridade", "hibrida" ou "combinada") e os
+        mesmos parâmetros do método correspondente. Os resultados voltam na
+        ordem de entrada; uma sub-consulta com falha retorna {"erro": ...}
+        sem derrubar as demais.
+        """
+        especificacoes = []
+        for consulta in consultas:
+            if isinstance(consulta, str):
+                consulta = {"query": consulta}
+            especificacao = {"tipo": tipo, **parametros, **consulta}
+            especificacoes.append(especificacao)
+
+        embeddings = self._embeddings_consultas(
+            [e["query"] for e in especificacoes])
+
+        resultados = [None] * len(especificacoes)
+        searches = []
+        posicoes = []
+        for i, (especificacao, embedding) in enumerate(zip(especificacoes, embeddings)):
+            try:
+                body = self._corpo_por_tipo(especificacao, embedding)
+            except (TypeError, ValueError) as e:
+                resultados[i] = {"erro": str(e)}
+                continue
+            cabecalho = {}
+            rota = rota_categoria(self.roteamento, especificacao.get("categoria"))
+            if especificacao["tipo"] == "hibrida" and rota:
+                cabecalho["routing"] = rota
+            searches.extend([cabecalho, body])
+            posicoes.append(i)
+
+        if searches:
+            inicio = time.perf_counter()
+            try:
+                response = self.es.msearch(
+                    index="artigos_vetorial", searches=searches,
+                    filter_path=FILTRO_MSEARCH if self.respostas_enxutas else None)
+            except Exception:
+                self.metricas.observar_erro("lote")
+                raise
+            self.metricas.observar_msearch("lote", time.perf_counter() - inicio, response)
+            for i, item in zip(posicoes, response["responses"]):
+                if "error" in item:
+                    self.logger.error(
+                        f"Erro na consulta {i} do lote: {item['error']}")
+                    resultados[i] = {"erro": item["error"],
+                                     "status": item.get("status")}
+                else:
+                    resultados[i] = garantir_hits(item)
+                    if self.quantizacao and especificacoes[i]["tipo"] == "similaridade":
+                        reranquear(item, embeddings[i],
+                                   especificacoes[i].get("campo", "conteudo_embedding"),
+                                   especificacoes[i].get("k", 5), self.quantizacao)
+
+        return resultados
+
+    def _corpo_similaridade(self, query_embedding, campo="conteudo_embedding", k=5):
+        """Corpo da busca por similaridade com a quantização do índice"""
+        return corpo_vetorial(query_embedding, campo=campo, k=k,
+                              quantizacao=self.quantizacao,
+                              fator_oversampling=self.fator_oversampling)
+
+    def _corpo_por_tipo(self, especificacao, query_embedding):
+        parametros = {c: v for c, v in especificacao.items()
+                      if c not in ("tipo", "query")}
+        tipo = especificacao["tipo"]
+        if tipo == "similaridade":
+            return self._corpo_similaridade(query_embedding, **parametros)
+        query_vector = vetor_consulta(query_embedding, self.quantizacao)
+        if tipo == "hibrida":
+            return corpo_hibrida(query_vector, **parametros)
+        if tipo == "combinada":
+            return corpo_combinada(especificacao["query"], query_vector,
+                                   **parametros)
+        raise ValueError(f"Tipo de busca desconhecido: {tipo}")
 
     def recomendar_similar(self, doc_id, k=3):
         """Recomenda documentos similares baseado em um documento específico"""
         try:
+            # Com a tabela, uma leitura por id substitui o get do vetor + kNN;
+            # documentos ainda fora da tabela seguem pelo caminho abaixo
+            if self.tabela_vizinhos is not None:
+                inicio = time.perf_counter()
+                vizinhos = self.tabela_vizinhos.recomendar(doc_id, k)
+                self.metricas.observar_busca("vizinhos", time.perf_counter() - inicio)
+                if vizinhos is not None:
+                    return vizinhos
+
             # Obter documento original
-            doc = self.es.get(index="artigos_vetorial", id=doc_id)
-            embedding = doc['_source']['conteudo_embedding']
+            doc = self._obter_documento(doc_id)
+            embedding = self._vetor_documento(doc)
 
             # Buscar similares (excluindo o próprio documento)
-            response = self.es.search(
-                index="artigos_vetorial",
-                body={
-                    "knn": {
-                        "field": "conteudo_embedding",
-                        "query_vector": embedding,
-                        "k": k + 1,
-                        "num_candidates": 50
-                    },
-                    "query": {
-                        "bool": {
-                            "must_not": [
-                                {"term": {"_id": doc_id}}
-                            ]
-                        }
-                    },
-                    "_source": ["titulo", "conteudo", "categoria", "data_publicacao"]
-                }
-            )
+            response = self._buscar("recomendacao",
+                                    body=corpo_recomendacao(embedding, doc_id, k))
 
             return response['hits']['hits'][:k]
 
@@ -162,6 +767,72 @@ class BuscaVetorial:
             self.logger.error(f"Erro ao buscar recomendações: {e}")
             return []
 
+    def _buscar(self, operacao, **parametros):
+        """es.search no índice, com filter_path no modo de respostas enxutas
+
+        `operacao` rotula as métricas da requisição (duração, took, parse, hits).
+        """
+        inicio = time.perf_counter()
+        try:
+            response = self.es.search(
+                index="artigos_vetorial",
+                filter_path=FILTRO_BUSCA if self.respostas_enxutas else None,
+                **parametros)
+        except Exception:
+            self.metricas.observar_erro(operacao)
+            raise
+        response = garantir_hits(response)
+        self.metricas.observar_busca(operacao, time.perf_counter() - inicio, response)
+        return response
+
+    def _obter_documento(self, doc_id):
+        """Busca um documento pelo id, trazendo do _source só o necessário"""
+        campos = campos_documento(self.source_enxuto)
+        if not self.roteamento:
+            inicio = time.perf_counter()
+            try:
+                doc = self.es.get(index="artigos_vetorial", id=doc_id,
+                                  source_includes=campos)
+            except NotFoundError:
+                self.metricas.observar_busca("documento", time.perf_counter() - inicio)
+                raise
+            except Exception:
+                self.metricas.observar_erro("documento")
+                raise
+            self.metricas.observar_busca("documento", time.perf_counter() - inicio)
+            return doc
+
+        return documento_encontrado(
+            self._buscar("documento", **busca_por_id(doc_id, campos)), doc_id)
+
+    def _vetor_documento(self, doc):
+        """Vetor de consulta de um documento lido por _obter_documento"""
+        fonte = doc['_source']
+        if 'conteudo_embedding' in fonte:
+            return fonte['conteudo_embedding']
+        with self.metricas.medir_encode("documento"):
+            embedding = self._projetar(self.codificador.encode(fonte['conteudo']))
+        return vetor_consulta(embedding.tolist(), self.quantizacao)
+
+    def estatisticas_cache(self):
+        """Mostra a taxa de acerto do cache de embeddings de consulta"""
+        stats = self.cache_embeddings.estatisticas()
+        print("\nCACHE DE EMBEDDINGS DE CONSULTA")
+        print("="*50)
+        print(f"Itens em cache: {stats['itens']} ({stats['bytes']} bytes)")
+        print(f"Acertos: {stats['acertos']} | Faltas: {stats['faltas']}")
+        print(f"Taxa de acerto: {stats['taxa_acerto']:.1%}")
+
+        if self.cache_respostas is not None:
+            stats = self.cache_respostas.estatisticas()
+            print("\nCACHE DE RESPOSTAS")
+            print("="*50)
+            print(f"Itens em memória: {stats['itens_memoria']} ({stats['bytes_memoria']} bytes)")
+            print(f"Acertos: {stats['acertos_memoria']} em memória, "
+                  f"{stats['acertos_disco']} em disco | Faltas: {stats['faltas']}")
+            print(f"Invalidações: {stats['invalidacoes']} (geração {stats['geracao']})")
+            print(f"Taxa de acerto: {stats['taxa_acerto']:.1%}")
+
     def exibir_resultados(self, response):
         """Exibe os resultados de forma formatada"""
         hits = response['hits']['hits']
@@ -191,18 +862,20 @@ class BuscaVetorial:
         try:
             stats = self.es.indices.stats(index="artigos_vetorial")
             count = self.es.count(index="artigos_vetorial")
+            # Com alias, a resposta vem com o nome do índice concreto
+            total = next(iter(stats['indices'].values()))['total']
 
             print("\nESTATÍSTICAS DO ÍNDICE")
             print("="*50)
             print(f"Total de documentos: {count['count']}")
             print(
-                f"Tamanho do índice: {stats['indices']['artigos_vetorial']['total']['store']['size_in_bytes']} bytes")
+                f"Tamanho do índice: {total['store']['size_in_bytes']} bytes")
             print(
-                f"Total de consultas: {stats['indices']['artigos_vetorial']['total']['search']['query_total']}")
+                f"Total de consultas: {total['search']['query_total']}")
 
-            if stats['indices']['artigos_vetorial']['total']['search']['query_total'] > 0:
-                tempo_medio = stats['indices']['artigos_vetorial']['total']['search']['query_time_in_millis'] / \
-                    stats['indices']['artigos_vetorial']['total']['search']['query_total']
+            if total['search']['query_total'] > 0:
+                tempo_medio = total['search']['query_time_in_millis'] / \
+                    total['search']['query_total']
                 print(f"Tempo médio de consulta: {tempo_medio:.2f}ms")
 
         except Exception as e:
@@ -220,11 +893,12 @@ def menu_interativo():
         print("1. Busca por similaridade")
         print("2. Busca híbrida (com filtros)")
         print("3. Busca combinada (vetorial + textual)")
-        print("4. Recomendações baseadas em documento")
-        print("5. Estatísticas do índice")
-        print("6. Sair")
+        print("4. Busca híbrida RRF (textual + vetorial)")
+        print("5. Recomendações baseadas em documento")
+        print("6. Estatísticas do índice")
+        print("7. Sair")
 
-        opcao = input("\nEscolha uma opção (1-6): ").strip()
+        opcao = input("\nEscolha uma opção (1-7): ").strip()
 
         if opcao == "1":
             query = input("Digite sua consulta: ").strip()
@@ -251,6 +925,12 @@ def menu_interativo():
                 busca.exibir_resultados(resultados)
 
         elif opcao == "4":
+            query = input("Digite sua consulta: ").strip()
+            if query:
+                resultados = busca.busca_rrf(query)
+                busca.exibir_resultados(resultados)
+
+        elif opcao == "5":
             doc_id = input("Digite o ID do documento (1-8): ").strip()
             if doc_id.isdigit():
                 recomendacoes = busca.recomendar_similar(doc_id)
@@ -261,10 +941,11 @@ def menu_interativo():
                         score = rec['_score']
                         print(f"   {i}. {doc['titulo']} (Score: {score:.4f})")
 
-        elif opcao == "5":
+        elif opcao == "6":
             busca.estatisticas_indice()
+            busca.estatisticas_cache()
 
-        elif opcao == "6":
+        elif opcao == "7":
             print("Obrigado por usar o sistema de busca vetorial!")
             break
 
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Sistema de Busca Vetorial Assíncrono (asyncio + AsyncElasticsearch)
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from busca_vetorial import (OpcoesCache, OpcoesInicio, OpcoesMetricas,
+                            busca_por_id, caches_consulta, campos_documento,
+                            chaves_pernas, corpo_combinada, corpo_hibrida,
+                            corpo_lexical, corpo_recomendacao, corpo_vetorial,
+                            documento_encontrado, metricas_do_servico,
+                            rota_categoria)
+from cache_consultas import NormalizadorConsultas
+from fusao_rrf import resposta_rrf
+from inicio_rapido import ModeloPreguicoso, carregar_modelo
+from mapeamento import reranquear, vetor_consulta
+from metricas import METRICAS_NULAS, serializadores_medidos
+from reducao_dimensional import projecao_do_meta
+from respostas_enxutas import FILTRO_BUSCA, garantir_hits, opcoes_cliente
+from servidor_embeddings import ServidorEmbeddings
+from vizinhos_precomputados import INDICE_VIZINHOS, vizinhos_da_entrada
+
+
+class BuscaVetorialAsync:
+    """Versão assíncrona da BuscaVetorial para muitas buscas simultâneas
+
+    O encode do modelo roda em um pool de threads limitado (o PyTorch libera
+    o GIL durante o forward), e as requisições ao Elasticsearch usam o
+    AsyncElasticsearch. `max_concorrencia` limita as buscas em voo e
+    `timeout` limita a duração de cada busca (encode + requisição).
+
+    Cache, métricas e início rápido usam as mesmas opções da BuscaVetorial
+    (OpcoesCache, OpcoesMetricas e OpcoesInicio). O cache de respostas e o
+    aquecimento não existem aqui e são recusados com ValueError.
+    """
+
+    def __init__(self, nome_modelo='all-MiniLM-L6-v2', max_concorrencia=256,
+                 workers_encode=None, timeout=10.0, cache=None, metricas=None,
+                 inicio=None, micro_lotes=False, janela_ms=5.0, max_lote=64,
+                 fator_oversampling=4, arquivo_reducao=None,
+                 respostas_enxutas=False):
+        cache = cache or OpcoesCache()
+        metricas = metricas or OpcoesMetricas()
+        inicio = inicio or OpcoesInicio()
+        if cache.respostas:
+            raise ValueError("BuscaVetorialAsync não tem cache de respostas")
+        if inicio.aquecer:
+            raise ValueError("BuscaVetorialAsync não faz aquecimento")
+
+        self.logger = logging.getLogger(__name__)
+
+        # No início rápido, o modelo carrega em segundo plano (inicio_rapido.py);
+        # o encode roda no pool de threads, então esperar a carga não trava o loop
+        self.nome_modelo = nome_modelo
+        if inicio.rapido:
+            self.logger.info("Carregando modelo SentenceTransformer em segundo plano")
+            self.model = ModeloPreguicoso(nome_modelo)
+        else:
+            self.logger.info("Carregando modelo SentenceTransformer")
+            self.model = carregar_modelo(nome_modelo)
+
+        # Chaves de cache ignoram a caixa só se o tokenizador for uncased
+        self.normalizar_consulta = NormalizadorConsultas(self.model)
+
+        self.servidor_embeddings = None
+        self.codificador = self.model
+        if micro_lotes:
+            self.servidor_embeddings = ServidorEmbeddings(
+                self.model, janela_ms=janela_ms, max_lote=max_lote)
+            self.codificador = self.servidor_embeddings
+
+        # Embeddings de consulta e hits de cada perna da busca RRF (ver
+        # BuscaVetorial.busca_rrf)
+        self.cache_embeddings, self.cache_pernas = caches_consulta(cache)
+
+        self.max_concorrencia = max_concorrencia
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers_encode or os.cpu_count() or 1,
+            thread_name_prefix="encode")
+        self._semaforo = None
+        self.quantizacao = None
+        self.fator_oversampling = fator_oversampling
+        self.arquivo_reducao = arquivo_reducao
+        self.projecao = None
+        self.roteamento = None
+        self.tabela_vizinhos = False
+        self.source_enxuto = False
+        self.respostas_enxutas = respostas_enxutas
+
+        # Mesmas métricas da BuscaVetorial (metricas.py)
+        self.metricas = metricas_do_servico(metricas)
+
+        opcoes = opcoes_cliente(respostas_enxutas)
+        if self.metricas is not METRICAS_NULAS:
+            opcoes["serializers"] = serializadores_medidos(opcoes.get("serializers"))
+        self.es = AsyncElasticsearch(
+            [{'host': 'localhost', 'port': 9200, 'scheme': 'http'}],
+            request_timeout=timeout,
+            connections_per_node=max_concorrencia,
+            **opcoes
+        )
+
+    async def conectar(self):
+        """Verifica a conexão com o Elasticsearch"""
+        # O semáforo é criado aqui para ficar associado ao loop em execução
+        self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+        if not await self.es.ping():
+            raise ConnectionError("Não foi possível conectar ao Elasticsearch")
+        mapeamento = await self.es.indices.get_mapping(index="artigos_vetorial")
+        meta = next(iter(mapeamento.values()))["mappings"].get("_meta", {})
+        self.quantizacao = meta.get("quantizacao")
+        self.roteamento = meta.get("roteamento")
+        self.source_enxuto = bool(meta.get("source_enxuto"))
+        self.projecao = projecao_do_meta(meta, self.arquivo_reducao)
+        self.tabela_vizinhos = bool(await self.es.indices.exists(index=INDICE_VIZINHOS))
+        self.logger.info("Sistema assíncrono pronto para uso")
+
+    async def fechar(self):
+        """Fecha as conexões e o pool de encode"""
+        await self.es.close()
+        self._executor.shutdown(wait=False)
+        if self.servidor_embeddings is not None:
+            self.servidor_embeddings.parar()
+
+    async def __aenter__(self):
+        await self.conectar()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.fechar()
+        return False
+
+    async def _embedding_consulta(self, query):
+        """Gera o embedding da consulta no pool de encode, usando o cache"""
+        chave = (self.nome_modelo, self.normalizar_consulta(query))
+        embedding = self.cache_embeddings.obter(chave)
+        self.metricas.observar_cache("embeddings", embedding is not None)
+        if embedding is None:
+            embedding = await self._codificar(query, "consulta")
+            if self.projecao is not None:
+                embedding = self.projecao.aplicar(embedding)
+            self.cache_embeddings.inserir(chave, embedding)
+        return embedding.tolist()
+
+    async def _codificar(self, texto, origem):
+        """Encode no pool de threads, medido com o rótulo `origem`"""
+        def encode():
+            with self.metricas.medir_encode(origem):
+                return self.codificador.encode(texto)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, encode)
+
+    async def _buscar(self, operacao, **parametros):
+        """es.search no índice, com filter_path no modo de respostas enxutas"""
+        inicio = time.perf_counter()
+        try:
+            response = await self.es.search(
+                index="artigos_vetorial",
+                filter_path=FILTRO_BUSCA if self.respostas_enxutas else None,
+                **parametros)
+        except Exception:
+            self.metricas.observar_erro(operacao)
+            raise
+        # O parse foi feito nesta tarefa, sem ceder o loop desde então
+        response = garantir_hits(response)
+        self.metricas.observar_busca(operacao, time.perf_counter() - inicio, response)
+        return response
+
+    async def _obter(self, operacao, indice, doc_id, **parametros):
+        """es.get medido como as buscas"""
+        inicio = time.perf_counter()
+        try:
+            doc = await self.es.get(index=indice, id=doc_id, **parametros)
+        except NotFoundError:
+            # Documento ausente é uma resposta válida, não um erro
+            self.metricas.observar_busca(operacao, time.perf_counter() - inicio)
+            raise
+        except Exception:
+            self.metricas.observar_erro(operacao)
+            raise
+        self.metricas.observar_busca(operacao, time.perf_counter() - inicio)
+        return doc
+
+    async def _executar(self, coro):
+        """Executa a busca respeitando o limite de concorrência e o timeout"""
+        if self._semaforo is None:
+            # Sem conectar(), o _meta do índice (quantização, roteamento,
+            # projeção) não foi lido e as buscas sairiam com o corpo errado
+            coro.close()
+            raise RuntimeError(
+                "BuscaVetorialAsync não conectada: chame `await conectar()` "
+                "(ou use `async with`) antes de buscar")
+        async with self._semaforo:
+            return await asyncio.wait_for(coro, timeout=self.timeout)
+
+    async def buscar_por_similaridade(self, query, campo="conteudo_embedding", k=5):
+        """Busca por similaridade usando embeddings"""
+        return await self._executar(self._similaridade(query, campo, k))
+
+    async def _similaridade(self, query, campo, k, operacao="similaridade"):
+        """kNN por similaridade sem o semáforo (também é uma perna da busca RRF)"""
+        query_embedding = await self._embedding_consulta(query)
+        response = await self._buscar(
+            operacao,
+            body=corpo_vetorial(query_embedding, campo=campo, k=k,
+                                quantizacao=self.quantizacao,
+                                fator_oversampling=self.fator_oversampling))
+        if self.quantizacao:
+            # Índice quantizado: oversampling e reranqueamento com float32
+            reranquear(response, query_embedding, campo, k, self.quantizacao)
+        return response
+
+    async def busca_hibrida(self, query, categoria=None, k=5):
+        """Busca híbrida combinando vetorial com filtros"""
+        async def busca():
+            query_embedding = vetor_consulta(
+                await self._embedding_consulta(query), self.quantizacao)
+            return await self._buscar(
+                "hibrida",
+                body=corpo_hibrida(query_embedding, categoria=categoria, k=k),
+                routing=rota_categoria(self.roteamento, categoria))
+
+        return await self._executar(busca())
+
+    async def busca_combinada(self, query, boost_vetorial=1.0, boost_textual=1.0, k=10):
+        """Busca combinada (vetorial + textual)"""
+        async def busca():
+            query_embedding = vetor_consulta(
+                await self._embedding_consulta(query), self.quantizacao)
+            return await self._buscar(
+                "combinada",
+                body=corpo_combinada(query, query_embedding,
+                                     boost_vetorial=boost_vetorial,
+                                     boost_textual=boost_textual, k=k))
+
+        return await self._executar(busca())
+
+    async def busca_rrf(self, query, k=10, janela_lexical=50, janela_vetorial=50,
+                        constante_rrf=60, campo="conteudo_embedding"):
+        """Busca híbrida com as pernas textual e vetorial fundidas por RRF
+
+        As duas pernas rodam ao mesmo tempo e são cacheadas separadamente.
+        """
+        async def lexical():
+            response = await self._buscar("rrf_lexical",
+                                          body=corpo_lexical(query, k=janela_lexical))
+            return response["hits"]["hits"]
+
+        async def vetorial():
+            response = await self._similaridade(query, campo, janela_vetorial,
+                                                "rrf_vetorial")
+            return response["hits"]["hits"]
+
+        async def busca():
+            inicio = time.perf_counter()
+            chave_lexical, chave_vetorial = chaves_pernas(
+                query, self.normalizar_consulta(query), self.nome_modelo,
+                janela_lexical, janela_vetorial, campo)
+            hits = await asyncio.gather(self._perna(chave_lexical, lexical),
+                                        self._perna(chave_vetorial, vetorial))
+            return resposta_rrf(dict(zip(("lexical", "vetorial"), hits)), k=k,
+                                constante=constante_rrf,
+                                took=int((time.perf_counter() - inicio) * 1000))
+
+        return await self._executar(busca())
+
+    async def _perna(self, chave, executar):
+        """Hits de uma perna da busca RRF, do cache ou do Elasticsearch"""
+        hits = self.cache_pernas.obter(chave)
+        self.metricas.observar_cache(f"perna_{chave[0]}", hits is not None)
+        if hits is None:
+            hits = await executar()
+            self.cache_pernas.inserir(chave, hits)
+        return hits
+
+    async def recomendar_similar(self, doc_id, k=3):
+        """Recomenda documentos similares baseado em um documento específico"""
+        async def busca():
+            if self.tabela_vizinhos:
+                vizinhos = await self._vizinhos_precomputados(doc_id, k)
+                if vizinhos is not None:
+                    return vizinhos
+
+            campos = campos_documento(self.source_enxuto)
+            if self.roteamento:
+                doc = documento_encontrado(
+                    await self._buscar("documento", **busca_por_id(doc_id, campos)),
+                    doc_id)
+            else:
+                doc = await self._obter("documento", "artigos_vetorial", doc_id,
+                                        source_includes=campos)
+            fonte = doc['_source']
+            if 'conteudo_embedding' in fonte:
+                embedding = fonte['conteudo_embedding']
+            else:
+                embedding = await self._codificar(fonte['conteudo'], "documento")
+                if self.projecao is not None:
+                    embedding = self.projecao.aplicar(embedding)
+                embedding = vetor_consulta(embedding.tolist(), self.quantizacao)
+
+            response = await self._buscar("recomendacao",
+                                          body=corpo_recomendacao(embedding, doc_id, k))
+            return response['hits']['hits'][:k]
+
+        try:
+            return await self._executar(busca())
+        except Exception as e:
+            self.logger.error(f"Erro ao buscar recomendações: {e}")
+            return []
+
+    async def _vizinhos_precomputados(self, doc_id, k):
+        """Vizinhos lidos da tabela (ver TabelaVizinhos.recomendar)"""
+        try:
+            entrada = (await self._obter("vizinhos", INDICE_VIZINHOS, doc_id))["_source"]
+        except NotFoundError:
+            return None
+        return vizinhos_da_entrada(entrada, k)
+
+    async def estatisticas_indice(self):
+        """Retorna estatísticas do índice"""
+        stats, count = await asyncio.gather(
+            self.es.indices.stats(index="artigos_vetorial"),
+            self.es.count(index="artigos_vetorial")
+        )
+        # Com alias, a resposta vem com o nome do índice concreto
+        total = next(iter(stats['indices'].values()))['total']
+        consultas = total['search']['query_total']
+        return {
+            "documentos": count['count'],
+            "tamanho_bytes": total['store']['size_in_bytes'],
+            "consultas": consultas,
+            "tempo_medio_ms": (total['search']['query_time_in_millis'] / consultas
+                               if consultas else 0.0)
+        }
+
+
+async def demonstracao(consultas, repeticoes=50):
+    """Dispara várias buscas simultâneas e mostra a vazão obtida"""
+    async with BuscaVetorialAsync() as busca:
+        tarefas = [busca.buscar_por_similaridade(q)
+                   for q in consultas for _ in range(repeticoes)]
+
+        inicio = time.perf_counter()
+        resultados = await asyncio.gather(*tarefas, return_exceptions=True)
+        duracao = time.perf_counter() - inicio
+
+        erros = sum(isinstance(r, Exception) for r in resultados)
+        print(f"{len(tarefas)} buscas em {duracao:.2f}s "
+              f"({len(tarefas) / duracao:.1f} buscas/s, {erros} erros)")
+        print(f"Taxa de acerto do cache: "
+              f"{busca.cache_embeddings.taxa_acerto():.1%}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    consultas = sys.argv[1:] or ["redes neurais", "culinária italiana",
+                                 "energia renovável"]
+    asyncio.run(demonstracao(consultas))
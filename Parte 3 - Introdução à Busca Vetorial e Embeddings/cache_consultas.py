@@ -0,0 +1,144 @@
+"""
+Cache LRU em Memória para Consultas
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+def normalizar_consulta(texto, minusculas=False):
+    """Normaliza o texto da consulta para uso como chave de cache
+
+    Espaços extras nunca alteram o embedding; a caixa só pode ser ignorada
+    (`minusculas=True`) quando o tokenizador do modelo é uncased.
+    """
+    texto = " ".join(texto.split())
+    return texto.lower() if minusculas else texto
+
+
+def tokenizador_sem_caixa(modelo):
+    """True se o tokenizador do modelo converte o texto para minúsculas
+
+    Retorna None enquanto um ModeloPreguicoso ainda está carregando, para
+    não bloquear a consulta só para decidir a chave de cache.
+    """
+    if hasattr(modelo, "pronto"):
+        if not modelo.pronto():
+            return None
+        modelo = modelo.obter()
+    tokenizador = getattr(modelo, "tokenizer", None)
+    return bool(getattr(tokenizador, "do_lower_case", False))
+
+
+class NormalizadorConsultas:
+    """normalizar_consulta com a caixa decidida pelo tokenizador do modelo
+
+    Com `minusculas=None` o tokenizador é consultado na primeira chamada em
+    que o modelo estiver disponível; até lá a caixa é preservada, o que só
+    custa algumas faltas de cache a mais.
+    """
+
+    def __init__(self, modelo, minusculas=None):
+        self.modelo = modelo
+        self.minusculas = minusculas
+
+    def __call__(self, texto):
+        if self.minusculas is None:
+            self.minusculas = tokenizador_sem_caixa(self.modelo)
+        return normalizar_consulta(texto, minusculas=bool(self.minusculas))
+
+
+def tamanho_aproximado(valor):
+    """Estimativa do tamanho em bytes de um valor armazenado"""
+    nbytes = getattr(valor, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """Cache LRU thread-safe com expiração por TTL e limite de memória"""
+
+    def __init__(self, max_itens=10000, ttl=None, max_bytes=None,
+                 tamanho=tamanho_aproximado):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._tamanho = tamanho
+
+        self.acertos = 0
+        self.faltas = 0
+        self.remocoes = 0
+        self.bytes = 0
+
+        # chave -> (valor, instante de inserção, tamanho em bytes)
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        """Retorna o valor em cache ou None, atualizando a ordem de uso"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.faltas += 1
+                return None
+
+            valor, inserido_em, _ = item
+            if self.ttl is not None and time.monotonic() - inserido_em > self.ttl:
+                self._remover(chave)
+                self.faltas += 1
+                return None
+
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def inserir(self, chave, valor):
+        """Armazena um valor, removendo os menos usados se necessário"""
+        tamanho = self._tamanho(valor)
+        if self.max_bytes is not None and tamanho > self.max_bytes:
+            return
+
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            self._itens[chave] = (valor, time.monotonic(), tamanho)
+            self.bytes += tamanho
+
+            while self._itens and (
+                    len(self._itens) > self.max_itens
+                    or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._remover(next(iter(self._itens)))
+                self.remocoes += 1
+
+    def _remover(self, chave):
+        _, _, tamanho = self._itens.pop(chave)
+        self.bytes -= tamanho
+
+    def limpar(self):
+        """Esvazia o cache (os contadores são mantidos)"""
+        with self._lock:
+            self._itens.clear()
+            self.bytes = 0
+
+    def taxa_acerto(self):
+        """Proporção de consultas atendidas pelo cache"""
+        total = self.acertos + self.faltas
+        return self.acertos / total if total else 0.0
+
+    def estatisticas(self):
+        """Resumo de uso do cache"""
+        return {
+            "itens": len(self._itens),
+            "bytes": self.bytes,
+            "acertos": self.acertos,
+            "faltas": self.faltas,
+            "remocoes": self.remocoes,
+            "taxa_acerto": self.taxa_acerto()
+        }
+
+    def __len__(self):
+        return len(self._itens)
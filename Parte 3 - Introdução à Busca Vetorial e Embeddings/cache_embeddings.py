@@ -0,0 +1,232 @@
+"""
+Cache Persistente de Embeddings em Disco
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+import numpy as np
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_VETORES = "vetores.f32"
+ARQUIVO_CHAVES = "chaves.npy"
+ARQUIVO_META = "meta.json"
+
+# Chave de 16 bytes (blake2b) + linha no arquivo de vetores
+TIPO_INDICE = np.dtype([("chave", "S16"), ("linha", "<i8")])
+
+
+class CacheEmbeddings:
+    """Armazena embeddings endereçados pelo hash do texto e do nome do modelo
+
+    Os vetores ficam em um arquivo float32 mapeado em memória e o índice de
+    chaves em um array compacto (.npy), carregado como dicionário ao abrir.
+    """
+
+    def __init__(self, diretorio, modelo, dims=384, capacidade_inicial=1024):
+        self.diretorio = diretorio
+        self.modelo = modelo
+        self.dims = dims
+
+        self.acertos = 0
+        self.faltas = 0
+
+        self._indice = {}
+        self._usadas = set()
+        self._linhas = 0
+        self._lock = threading.RLock()
+
+        os.makedirs(diretorio, exist_ok=True)
+        caminho_meta = self._caminho(ARQUIVO_META)
+
+        if os.path.exists(caminho_meta):
+            with open(caminho_meta, "r", encoding="utf-8") as arquivo:
+                meta = json.load(arquivo)
+            if meta["dims"] != dims:
+                raise ValueError(
+                    f"Cache em '{diretorio}' tem {meta['dims']} dimensões, "
+                    f"esperado {dims}")
+            self._linhas = meta["linhas"]
+            self._capacidade = meta["capacidade"]
+            registros = np.load(self._caminho(ARQUIVO_CHAVES))
+            self._indice = {bytes(r["chave"]): int(r["linha"]) for r in registros}
+            self._vetores = self._abrir_vetores("r+")
+        else:
+            self._capacidade = capacidade_inicial
+            self._vetores = self._abrir_vetores("w+")
+
+        logger.info(
+            f"Cache de embeddings aberto em '{diretorio}' "
+            f"({len(self._indice)} vetores)")
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, nome)
+
+    def _abrir_vetores(self, modo):
+        return np.memmap(
+            self._caminho(ARQUIVO_VETORES),
+            dtype=np.float32,
+            mode=modo,
+            shape=(self._capacidade, self.dims)
+        )
+
+    def chave(self, texto):
+        """Calcula a chave de conteúdo (hash do modelo + texto)"""
+        dados = f"{self.modelo}\0{texto}".encode("utf-8")
+        return hashlib.blake2b(dados, digest_size=16).digest()
+
+    def codificar(self, textos, funcao_encode):
+        """Retorna os embeddings dos textos, chamando o modelo só para as faltas
+
+        `funcao_encode` recebe uma lista de textos e devolve um array (n, dims).
+        """
+        resultado, pendentes = self.consultar(textos)
+        if pendentes:
+            novos = funcao_encode([textos[p[0]] for p in pendentes.values()])
+            self.completar(resultado, pendentes, novos)
+        return resultado
+
+    def consultar(self, textos):
+        """Preenche os vetores já em cache e lista os textos que faltam
+
+        Retorna (resultado, pendentes), onde `pendentes` mapeia cada chave
+        ausente às posições em que aparece; textos repetidos no mesmo lote
+        são codificados uma única vez. A ordem de `pendentes` é a ordem em
+        que os vetores devem ser entregues a `completar`.
+        """
+        chaves = [self.chave(texto) for texto in textos]
+        resultado = np.empty((len(textos), self.dims), dtype=np.float32)
+
+        pendentes = {}
+        with self._lock:
+            for posicao, chave in enumerate(chaves):
+                self._usadas.add(chave)
+                linha = self._indice.get(chave)
+                if linha is not None:
+                    resultado[posicao] = self._vetores[linha]
+                    self.acertos += 1
+                else:
+                    pendentes.setdefault(chave, []).append(posicao)
+                    self.faltas += 1
+
+        return resultado, pendentes
+
+    def completar(self, resultado, pendentes, vetores):
+        """Grava no cache os vetores calculados para as chaves pendentes"""
+        vetores = np.asarray(vetores, dtype=np.float32)
+        with self._lock:
+            for (chave, posicoes), vetor in zip(pendentes.items(), vetores):
+                # Outro lote em voo pode ter gravado a mesma chave antes
+                if chave not in self._indice:
+                    self._adicionar(chave, vetor)
+                resultado[posicoes] = vetor
+
+    def _adicionar(self, chave, vetor):
+        if self._linhas >= self._capacidade:
+            self._crescer()
+        self._vetores[self._linhas] = vetor
+        self._indice[chave] = self._linhas
+        self._linhas += 1
+
+    def _crescer(self):
+        # Dobra a capacidade do arquivo e remapeia
+        self._vetores.flush()
+        del self._vetores
+        self._capacidade *= 2
+        with open(self._caminho(ARQUIVO_VETORES), "r+b") as arquivo:
+            arquivo.truncate(self._capacidade * self.dims * 4)
+        self._vetores = self._abrir_vetores("r+")
+
+    def taxa_acerto(self):
+        """Proporção de textos atendidos pelo cache"""
+        total = self.acertos + self.faltas
+        return self.acertos / total if total else 0.0
+
+    def estatisticas(self):
+        """Resumo de acertos, faltas e ocupação do cache"""
+        return {
+            "acertos": self.acertos,
+            "faltas": self.faltas,
+            "taxa_acerto": self.taxa_acerto(),
+            "vetores": len(self._indice),
+            "capacidade": self._capacidade
+        }
+
+    def salvar(self):
+        """Persiste vetores, índice de chaves e metadados"""
+        with self._lock:
+            self._salvar()
+
+    def _salvar(self):
+        self._vetores.flush()
+
+        registros = np.empty(len(self._indice), dtype=TIPO_INDICE)
+        registros["chave"] = list(self._indice.keys())
+        registros["linha"] = list(self._indice.values())
+        self._escrever_atomico(
+            ARQUIVO_CHAVES, lambda arquivo: np.save(arquivo, registros), binario=True)
+
+        meta = {
+            "modelo": self.modelo,
+            "dims": self.dims,
+            "linhas": self._linhas,
+            "capacidade": self._capacidade
+        }
+        self._escrever_atomico(
+            ARQUIVO_META, lambda arquivo: json.dump(meta, arquivo))
+
+    def _escrever_atomico(self, nome, escrever, binario=False):
+        destino = self._caminho(nome)
+        temporario = f"{destino}.tmp"
+        with open(temporario, "wb" if binario else "w") as arquivo:
+            escrever(arquivo)
+        os.replace(temporario, destino)
+
+    def coletar_lixo(self, referenciadas=None):
+        """Remove vetores não referenciados e compacta o arquivo
+
+        Sem `referenciadas`, mantém apenas as chaves usadas desde a abertura
+        do cache (ou seja, os textos do corpus processado nesta execução).
+        Retorna o número de vetores removidos.
+        """
+        with self._lock:
+            return self._coletar_lixo(referenciadas)
+
+    def _coletar_lixo(self, referenciadas):
+        manter = self._usadas if referenciadas is None else set(referenciadas)
+        chaves = [c for c in self._indice if c in manter]
+        removidos = len(self._indice) - len(chaves)
+        if not removidos:
+            return 0
+
+        capacidade = max(len(chaves), 1)
+        caminho_novo = self._caminho(f"{ARQUIVO_VETORES}.tmp")
+        novos = np.memmap(caminho_novo, dtype=np.float32, mode="w+",
+                          shape=(capacidade, self.dims))
+        indice = {}
+        for linha, chave in enumerate(chaves):
+            novos[linha] = self._vetores[self._indice[chave]]
+            indice[chave] = linha
+        novos.flush()
+        del novos, self._vetores
+
+        os.replace(caminho_novo, self._caminho(ARQUIVO_VETORES))
+        self._indice = indice
+        self._linhas = len(chaves)
+        self._capacidade = capacidade
+        self._vetores = self._abrir_vetores("r+")
+        self._salvar()
+
+        logger.info(f"Coleta de lixo removeu {removidos} vetores do cache")
+        return removidos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.salvar()
+        return False
@@ -0,0 +1,222 @@
+"""
+Cache de Respostas de Busca com Invalidação por Geração do Índice
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import ConnectionError, ConnectionTimeout
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from cache_consultas import CacheLRU, normalizar_consulta
+
+logger = logging.getLogger(__name__)
+
+
+class GeracaoIndice:
+    """Identifica o estado visível do índice para invalidar respostas em cache
+
+    A geração combina o uuid do índice (recriação), a `geracao` gravada no
+    _meta pela ingestão (registrar_geracao em mapeamento.py) e contadores das
+    cópias primárias. Os de indexação e remoção sobem já na escrita, antes de
+    ela ficar visível; por isso entra também o número de refreshes externos
+    (os que abrem um novo searcher), que muda exatamente quando escritas de
+    qualquer origem passam a aparecer nas buscas. Uma resposta obtida entre a
+    escrita e o refresh fica presa a uma geração que o refresh encerra.
+
+    A consulta ao cluster é feita no máximo a cada `intervalo` segundos;
+    entre duas consultas, a última geração lida é reaproveitada. Ela roda
+    fora do lock: só uma thread a faz por vez e as demais seguem com a
+    geração anterior (ou sem cache, se nenhuma foi lida ainda) em vez de
+    esperar pela rede.
+    """
+
+    def __init__(self, es, indice="artigos_vetorial", intervalo=1.0):
+        self.es = es
+        self.indice = indice
+        self.intervalo = intervalo
+
+        self._geracao = None
+        self._lida_em = None
+        self._atualizando = False
+        self._lock = threading.Lock()
+
+    def atual(self):
+        """Geração atual (hash curto) ou None se o cluster estiver inacessível"""
+        with self._lock:
+            agora = time.monotonic()
+            recente = (self._lida_em is not None
+                       and agora - self._lida_em < self.intervalo)
+            if recente or self._atualizando:
+                return self._geracao
+            self._atualizando = True
+
+        geracao = None
+        try:
+            geracao = self._consultar()
+        except (ConnectionError, ConnectionTimeout) as e:
+            logger.warning(f"Não foi possível ler a geração do índice: {e}")
+        finally:
+            with self._lock:
+                self._geracao = geracao
+                self._lida_em = time.monotonic()
+                self._atualizando = False
+        return geracao
+
+    def _consultar(self):
+        stats = self.es.indices.stats(index=self.indice,
+                                      metric=["docs", "indexing", "refresh"])
+        # A resposta é indexada pelo nome concreto do índice (que pode ser um alias)
+        nome, dados = next(iter(stats["indices"].items()))
+        primarias = dados["primaries"]
+        mapeamento = self.es.indices.get_mapping(index=self.indice)
+        meta = mapeamento[nome]["mappings"].get("_meta", {})
+
+        estado = [
+            dados.get("uuid", nome),
+            meta.get("geracao", 0),
+            primarias["docs"]["count"],
+            primarias["docs"]["deleted"],
+            primarias["indexing"]["index_total"],
+            primarias["indexing"]["delete_total"],
+            primarias["refresh"]["external_total"]
+        ]
+        return hashlib.blake2b(json.dumps(estado).encode("utf-8"),
+                               digest_size=8).hexdigest()
+
+
+class CacheRespostas:
+    """Cache de respostas completas de busca, em memória e opcionalmente em disco
+
+    A chave é o método, a consulta normalizada e os parâmetros da busca. Cada
+    resposta fica associada à geração do índice em que foi obtida e só é
+    servida enquanto a geração não mudar. Com `diretorio`, as respostas também
+    são gravadas em `<diretorio>/<geração>/<chave>.json`, compartilhadas entre
+    processos da mesma máquina; diretórios de gerações antigas são apagados.
+    As respostas ficam serializadas em JSON, então cada acerto devolve uma
+    cópia nova que o chamador pode modificar.
+    """
+
+    def __init__(self, es, indice="artigos_vetorial", max_itens=5000, ttl=None,
+                 max_mb=64, diretorio=None, intervalo_geracao=1.0,
+                 normalizar=normalizar_consulta):
+        self.normalizar = normalizar
+        self.geracao = GeracaoIndice(es, indice, intervalo_geracao)
+        self.memoria = CacheLRU(max_itens=max_itens, ttl=ttl,
+                                max_bytes=max_mb * 1024 * 1024,
+                                tamanho=lambda par: len(par[1]))
+        self.diretorio = diretorio
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.faltas = 0
+        self.invalidacoes = 0
+        self._geracao_vista = None
+        self._lock = threading.Lock()
+
+    def chave(self, metodo, query, **parametros):
+        """Chave da resposta: método, consulta normalizada e parâmetros"""
+        dados = json.dumps([metodo, self.normalizar(query), parametros],
+                           sort_keys=True, ensure_ascii=False)
+        return hashlib.blake2b(dados.encode("utf-8"), digest_size=16).hexdigest()
+
+    def buscar(self, metodo, query, parametros, executar):
+        """Retorna a resposta em cache ou executa a busca e a armazena
+
+        Se a geração do índice não puder ser lida, a busca é executada sem
+        passar pelo cache.
+        """
+        geracao = self.geracao.atual()
+        if geracao is None:
+            return executar()
+        self._verificar_geracao(geracao)
+
+        chave = self.chave(metodo, query, **parametros)
+        resposta = self._obter(geracao, chave)
+        if resposta is not None:
+            return resposta
+
+        resposta = executar()
+        self._inserir(geracao, chave, resposta)
+        return resposta
+
+    def _verificar_geracao(self, geracao):
+        """Descarta as respostas de gerações anteriores"""
+        with self._lock:
+            if geracao == self._geracao_vista:
+                return
+            if self._geracao_vista is not None:
+                self.invalidacoes += 1
+                logger.info(
+                    f"Índice mudou (geração {self._geracao_vista} -> {geracao}): "
+                    f"cache de respostas invalidado")
+            self._geracao_vista = geracao
+
+        self.memoria.limpar()
+        if self.diretorio:
+            for nome in os.listdir(self.diretorio):
+                caminho = os.path.join(self.diretorio, nome)
+                if nome != geracao and os.path.isdir(caminho):
+                    shutil.rmtree(caminho, ignore_errors=True)
+
+    def _obter(self, geracao, chave):
+        item = self.memoria.obter(chave)
+        if item is not None and item[0] == geracao:
+            self.acertos_memoria += 1
+            return json.loads(item[1])
+
+        if self.diretorio:
+            try:
+                with open(self._caminho(geracao, chave), "r", encoding="utf-8") as arquivo:
+                    serializada = arquivo.read()
+            except FileNotFoundError:
+                pass
+            else:
+                self.memoria.inserir(chave, (geracao, serializada))
+                self.acertos_disco += 1
+                return json.loads(serializada)
+
+        self.faltas += 1
+        return None
+
+    def _inserir(self, geracao, chave, resposta):
+        # Respostas do cliente (ObjectApiResponse) guardam o dicionário em `body`
+        serializada = json.dumps(getattr(resposta, "body", resposta))
+        self.memoria.inserir(chave, (geracao, serializada))
+
+        if self.diretorio:
+            destino = self._caminho(geracao, chave)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            # Nome temporário único: outros processos podem gravar a mesma chave
+            temporario = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                arquivo.write(serializada)
+            os.replace(temporario, destino)
+
+    def _caminho(self, geracao, chave):
+        return os.path.join(self.diretorio, geracao, f"{chave}.json")
+
+    def taxa_acerto(self):
+        """Proporção de buscas atendidas pelo cache (memória ou disco)"""
+        acertos = self.acertos_memoria + self.acertos_disco
+        total = acertos + self.faltas
+        return acertos / total if total else 0.0
+
+    def estatisticas(self):
+        """Resumo de uso do cache"""
+        return {
+            "itens_memoria": len(self.memoria),
+            "bytes_memoria": self.memoria.bytes,
+            "acertos_memoria": self.acertos_memoria,
+            "acertos_disco": self.acertos_disco,
+            "faltas": self.faltas,
+            "invalidacoes": self.invalidacoes,
+            "geracao": self._geracao_vista,
+            "taxa_acerto": self.taxa_acerto()
+        }
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Exportação de Vetores com Point-in-Time e search_after
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import Elasticsearch
+from datetime import datetime, timezone
+import numpy as np
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from ingestao import INDICE
+from mapeamento import CAMPOS_VETORES, exigir_vetores_no_source
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_IDS = "ids.txt"
+ARQUIVO_META = "meta.json"
+
+
+def arquivo_vetores(campo):
+    return f"{campo}.f32"
+
+
+def dimensoes_campos(es, indice, campos):
+    """Lê do mapeamento o número de dimensões de cada campo dense_vector"""
+    mapeamento = es.indices.get_mapping(index=indice)
+    # Com alias, a resposta vem com o nome do índice concreto
+    propriedades = next(iter(mapeamento.values()))["mappings"]["properties"]
+    return {campo: propriedades[campo]["dims"] for campo in campos}
+
+
+class ExportadorVetores:
+    """Percorre o índice inteiro e grava os vetores em arquivos mapeados em memória
+
+    Um point-in-time garante uma visão consistente do índice durante toda a
+    exportação; as páginas são lidas com `search_after` sobre `_shard_doc`.
+    Cada campo vira uma matriz float32 (total x dims) pré-alocada em disco e
+    os ids vão para um arquivo texto, uma linha por linha da matriz. Só uma
+    página por fatia fica em memória, qualquer que seja o tamanho do índice.
+    """
+
+    def __init__(self, es, diretorio, indice=INDICE, campos=CAMPOS_VETORES,
+                 tamanho_pagina=1000, fatias=1, keep_alive="5m"):
+        self.es = es
+        self.diretorio = diretorio
+        self.indice = indice
+        self.campos = list(campos)
+        self.tamanho_pagina = tamanho_pagina
+        self.fatias = fatias
+        self.keep_alive = keep_alive
+
+        self.total = 0
+        self.exportados = 0
+        self._vetores = {}
+        self._arquivo_ids = None
+        self._lock = threading.Lock()
+
+    def executar(self):
+        """Exporta todos os documentos e retorna os metadados gravados"""
+        inicio = time.perf_counter()
+        # Sem os vetores no _source, a exportação sairia só com NaN
+        exigir_vetores_no_source(self.es, self.indice, self.campos, "a exportação")
+        os.makedirs(self.diretorio, exist_ok=True)
+        dims = dimensoes_campos(self.es, self.indice, self.campos)
+
+        pit_id = self.es.open_point_in_time(
+            index=self.indice, keep_alive=self.keep_alive)["id"]
+        try:
+            # Total exato na mesma visão do PIT: define o tamanho dos arquivos
+            resposta = self.es.search(
+                pit={"id": pit_id, "keep_alive": self.keep_alive},
+                size=0, track_total_hits=True)
+            self.total = resposta["hits"]["total"]["value"]
+            logger.info(
+                f"Exportando {self.total} documentos de '{self.indice}' "
+                f"em {self.fatias} fatia(s)")
+
+            for campo in self.campos:
+                self._vetores[campo] = np.memmap(
+                    os.path.join(self.diretorio, arquivo_vetores(campo)),
+                    dtype=np.float32, mode="w+",
+                    shape=(max(self.total, 1), dims[campo]))
+
+            with open(os.path.join(self.diretorio, ARQUIVO_IDS), "w",
+                      encoding="utf-8") as self._arquivo_ids:
+                if self.fatias > 1:
+                    with ThreadPoolExecutor(max_workers=self.fatias) as executor:
+                        futuros = [executor.submit(self._exportar_fatia, pit_id, fatia)
+                                   for fatia in range(self.fatias)]
+                        for futuro in futuros:
+                            futuro.result()
+                else:
+                    self._exportar_fatia(pit_id, None)
+        finally:
+            self.es.close_point_in_time(id=pit_id)
+
+        for vetores in self._vetores.values():
+            vetores.flush()
+
+        duracao = time.perf_counter() - inicio
+        meta = {
+            "indice": self.indice,
+            "total": self.exportados,
+            "campos": {campo: {"arquivo": arquivo_vetores(campo), "dims": dims[campo]}
+                       for campo in self.campos},
+            "ids": ARQUIVO_IDS,
+            "data": datetime.now(timezone.utc).isoformat()
+        }
+        with open(os.path.join(self.diretorio, ARQUIVO_META), "w",
+                  encoding="utf-8") as arquivo:
+            json.dump(meta, arquivo, indent=2)
+
+        logger.info(
+            f"Exportação concluída: {self.exportados} documentos em {duracao:.1f}s "
+            f"({self.exportados / duracao if duracao else 0:.0f} docs/s)")
+        return meta
+
+    def _exportar_fatia(self, pit_id, fatia):
+        search_after = None
+        while True:
+            parametros = {
+                "pit": {"id": pit_id, "keep_alive": self.keep_alive},
+                "size": self.tamanho_pagina,
+                "sort": ["_shard_doc"],
+                "source": self.campos,
+                "track_total_hits": False
+            }
+            if fatia is not None:
+                parametros["slice"] = {"id": fatia, "max": self.fatias}
+            if search_after is not None:
+                parametros["search_after"] = search_after
+
+            resposta = self.es.search(**parametros)
+            hits = resposta["hits"]["hits"]
+            if not hits:
+                return
+
+            # O Elasticsearch pode devolver um novo id de PIT a cada página
+            pit_id = resposta.get("pit_id", pit_id)
+            search_after = hits[-1]["sort"]
+            self._gravar_pagina(hits)
+
+    def _gravar_pagina(self, hits):
+        # Reserva as linhas e grava os ids sob o mesmo lock: a ordem do
+        # arquivo de ids é sempre a ordem das linhas das matrizes
+        with self._lock:
+            linha = self.exportados
+            if linha + len(hits) > self.total:
+                raise RuntimeError(
+                    f"O índice devolveu mais documentos que os {self.total} contados")
+            self.exportados += len(hits)
+            self._arquivo_ids.writelines(f"{hit['_id']}\n" for hit in hits)
+
+        # Linhas reservadas são exclusivas desta fatia: sem lock na cópia
+        for campo, vetores in self._vetores.items():
+            valores = [hit["_source"].get(campo) for hit in hits]
+            if all(valor is not None for valor in valores):
+                vetores[linha:linha + len(hits)] = np.asarray(valores, dtype=np.float32)
+                continue
+            for deslocamento, valor in enumerate(valores):
+                # Documentos sem o campo ficam marcados com NaN
+                vetores[linha + deslocamento] = np.nan if valor is None else valor
+
+
+def carregar_exportacao(diretorio, modo="r"):
+    """Abre uma exportação: retorna (ids, {campo: matriz mapeada em memória})"""
+    with open(os.path.join(diretorio, ARQUIVO_META), "r", encoding="utf-8") as arquivo:
+        meta = json.load(arquivo)
+    with open(os.path.join(diretorio, meta["ids"]), "r", encoding="utf-8") as arquivo:
+        ids = arquivo.read().splitlines()
+
+    vetores = {}
+    for campo, info in meta["campos"].items():
+        matriz = np.memmap(os.path.join(diretorio, info["arquivo"]),
+                           dtype=np.float32, mode=modo)
+        vetores[campo] = matriz.reshape(-1, info["dims"])[:meta["total"]]
+    return ids, vetores
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Exporta os vetores do índice para arquivos mapeados em memória")
+    parser.add_argument("--saida", default="exportacao_vetores",
+                        help="Diretório de destino (padrão exportacao_vetores)")
+    parser.add_argument("--indice", default=INDICE)
+    parser.add_argument("--campos", nargs="+", default=list(CAMPOS_VETORES),
+                        help="Campos dense_vector exportados")
+    parser.add_argument("--tamanho-pagina", type=int, default=1000,
+                        help="Documentos por página do search_after (padrão 1000)")
+    parser.add_argument("--fatias", type=int, default=1,
+                        help="Fatias (slices) do PIT lidas em paralelo (padrão 1)")
+    parser.add_argument("--keep-alive", default="5m",
+                        help="Tempo de vida do point-in-time entre páginas (padrão 5m)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    es = Elasticsearch(['http://localhost:9200'])
+    if not es.ping():
+        logger.error("Não foi possível conectar ao Elasticsearch")
+        sys.exit(1)
+
+    exportador = ExportadorVetores(
+        es, args.saida, indice=args.indice, campos=args.campos,
+        tamanho_pagina=args.tamanho_pagina, fatias=args.fatias,
+        keep_alive=args.keep_alive)
+    try:
+        exportador.executar()
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
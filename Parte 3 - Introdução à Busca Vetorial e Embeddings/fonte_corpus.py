@@ -0,0 +1,133 @@
+"""
+Leitura em Streaming do Corpus de Artigos
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+import csv
+import gzip
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+
+CAMPOS_OBRIGATORIOS = ("titulo", "conteudo")
+CAMPOS_OPCIONAIS = ("categoria", "data_publicacao")
+
+logger = logging.getLogger(__name__)
+
+# Conteúdos longos ultrapassam o limite padrão de 128 KB por campo do módulo csv
+csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+
+
+def _abrir(caminho):
+    """Abre o arquivo em modo texto, descompactando gzip de forma transparente"""
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rt", encoding="utf-8", newline="")
+    return open(caminho, "r", encoding="utf-8", newline="")
+
+
+def _formato(caminho):
+    nome = caminho[:-3] if caminho.endswith(".gz") else caminho
+    extensao = os.path.splitext(nome)[1].lower()
+    if extensao in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extensao == ".csv":
+        return "csv"
+    raise ValueError(f"Formato de arquivo não suportado: {caminho}")
+
+
+def ler_corpus(caminho, inicio=0):
+    """Lê o corpus (JSONL, CSV ou .gz) sob demanda, gerando (posição, registro)
+
+    A posição é o número de ordem do registro no arquivo (a partir de 0),
+    e `inicio` permite retomar a leitura a partir de um checkpoint. No JSONL,
+    as linhas anteriores a `inicio` são puladas sem passar pelo json.loads.
+    """
+    formato = _formato(caminho)
+    with _abrir(caminho) as arquivo:
+        if formato == "csv":
+            # Campos entre aspas podem ter quebras de linha: só o leitor de CSV
+            # sabe onde cada registro termina
+            registros = itertools.islice(csv.DictReader(arquivo), inicio, None)
+        else:
+            linhas = itertools.islice(
+                (linha for linha in arquivo if linha.strip()), inicio, None)
+            registros = (json.loads(linha) for linha in linhas)
+
+        for posicao, registro in enumerate(registros, inicio):
+            yield posicao, registro
+
+
+def ler_lista(artigos, inicio=0):
+    """Adapta uma lista em memória (como data.artigos) ao formato de ler_corpus"""
+    for posicao in range(inicio, len(artigos)):
+        yield posicao, artigos[posicao]
+
+
+def validar_documentos(registros):
+    """Filtra registros inválidos, mantendo apenas os campos conhecidos"""
+    invalidos = 0
+    for posicao, registro in registros:
+        faltando = [c for c in CAMPOS_OBRIGATORIOS
+                    if not isinstance(registro.get(c), str) or not registro[c].strip()]
+        if faltando:
+            invalidos += 1
+            logger.warning(
+                f"Registro {posicao} ignorado: campos ausentes {faltando}")
+            continue
+
+        documento = {c: registro[c] for c in CAMPOS_OBRIGATORIOS}
+        for campo in CAMPOS_OPCIONAIS:
+            # Strings vazias (comuns em CSV) quebrariam o mapeamento de datas
+            if registro.get(campo):
+                documento[campo] = registro[campo]
+
+        # Ids explícitos são preservados; senão usa a posição (1..N, como antes)
+        doc_id = registro.get("id") or posicao + 1
+        yield posicao, doc_id, documento
+
+    if invalidos:
+        logger.warning(f"Total de registros inválidos ignorados: {invalidos}")
+
+
+class Checkpoint:
+    """Persiste o deslocamento do último registro indexado para retomar cargas
+
+    Lotes podem terminar fora de ordem quando o envio é concorrente, então o
+    deslocamento salvo só avança sobre intervalos contíguos já concluídos.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.deslocamento = self.carregar()
+        self._concluidos = {}
+        self._lock = threading.Lock()
+
+    def carregar(self):
+        """Lê o deslocamento salvo, ou 0 se não houver checkpoint"""
+        if not self.caminho or not os.path.exists(self.caminho):
+            return 0
+        with open(self.caminho, "r", encoding="utf-8") as arquivo:
+            return int(json.load(arquivo)["deslocamento"])
+
+    def marcar_concluido(self, inicio, fim):
+        """Registra o intervalo [inicio, fim) como indexado"""
+        with self._lock:
+            self._concluidos[inicio] = fim
+            avancou = False
+            while self.deslocamento in self._concluidos:
+                self.deslocamento = self._concluidos.pop(self.deslocamento)
+                avancou = True
+            if avancou:
+                self._salvar()
+
+    def _salvar(self):
+        if not self.caminho:
+            return
+        # Escrita atômica: um crash durante o save não corrompe o checkpoint
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"deslocamento": self.deslocamento}, arquivo)
+        os.replace(temporario, self.caminho)
@@ -0,0 +1,43 @@
+"""
+Fusão de Rankings por Reciprocal Rank Fusion (RRF)
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+
+def fundir_rrf(pernas, k=10, constante=60, pesos=None):
+    """Funde listas ordenadas de hits pela posição de cada documento
+
+    `pernas` mapeia o nome de cada busca (ex.: "lexical", "vetorial") para a
+    sua lista de hits, do melhor para o pior. O score de um documento é a
+    soma de peso / (constante + posição) nas pernas em que ele aparece; só a
+    posição importa, então BM25 e cosseno não precisam estar na mesma escala.
+    Cada hit fundido traz em `_rrf` a posição em cada perna.
+    """
+    pesos = pesos or {}
+    fundidos = {}
+    for nome, hits in pernas.items():
+        peso = pesos.get(nome, 1.0)
+        for posicao, hit in enumerate(hits, 1):
+            fundido = fundidos.get(hit["_id"])
+            if fundido is None:
+                fundido = fundidos[hit["_id"]] = {**hit, "_score": 0.0, "_rrf": {}}
+            fundido["_score"] += peso / (constante + posicao)
+            fundido["_rrf"][nome] = posicao
+
+    # Empates: melhor posição em qualquer perna e, por fim, o id, para que
+    # a mesma consulta produza sempre a mesma ordem
+    return sorted(fundidos.values(),
+                  key=lambda h: (-h["_score"], min(h["_rrf"].values()), h["_id"]))[:k]
+
+
+def resposta_rrf(pernas, k=10, constante=60, pesos=None, took=0):
+    """Resposta no formato do Elasticsearch com os hits fundidos"""
+    hits = fundir_rrf(pernas, k=k, constante=constante, pesos=pesos)
+    return {
+        "took": took,
+        "hits": {
+            "total": {"value": len(hits), "relation": "eq"},
+            "max_score": hits[0]["_score"] if hits else None,
+            "hits": hits
+        }
+    }
@@ -6,13 +6,240 @@ Parte 3: Introdução à Busca Vetorial e Embeddings
 
 from sentence_transformers import SentenceTransformer
 from elasticsearch import Elasticsearch
+import argparse
 import sys
+import time
 import logging
+from contextlib import nullcontext
 
 from data import artigos
+from cache_embeddings import CacheEmbeddings
+from fonte_corpus import ler_corpus, ler_lista, validar_documentos, Checkpoint
+from ingestao import INDICE, gerar_lotes, IndexadorBulk, carga_otimizada
+from mapeamento import MODOS_QUANTIZACAO, garantir_indice, registrar_geracao
+from metricas import METRICAS_NULAS, iniciar_servidor_metricas, metricas_padrao
+from reindexacao import (DetectorAlteracoes, com_hash, e_indice_concreto,
+                         ler_hashes, nome_versionado, remover_documentos,
+                         trocar_alias)
+from reducao_dimensional import ProjecaoPCA
+from ingestao_paralela import PipelineIngestao
+from vizinhos_precomputados import TabelaVizinhos
+
+NOME_MODELO = 'all-MiniLM-L6-v2'
+DIMENSOES = 384
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Gera embeddings e indexa os artigos no Elasticsearch")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Usa o modo de ingestão em lote (_bulk)")
+    parser.add_argument("--tamanho-lote", type=int, default=256,
+                        help="Documentos por lote de embedding/_bulk (padrão 256)")
+    parser.add_argument("--lote-modelo", type=int, default=64,
+                        help="Batch size interno do SentenceTransformer (padrão 64)")
+    parser.add_argument("--concorrencia", type=int, default=2,
+                        help="Requisições _bulk simultâneas (padrão 2)")
+    parser.add_argument("--max-tentativas", type=int, default=5,
+                        help="Tentativas por item rejeitado com 429 (padrão 5)")
+    parser.add_argument("--otimizar-carga", action="store_true",
+                        help="Desativa refresh e réplicas durante a carga "
+                             "(implica --bulk)")
+    parser.add_argument("--entrada",
+                        help="Corpus em JSONL, CSV ou .gz lido em streaming "
+                             "(implica --bulk; padrão: data.artigos)")
+    parser.add_argument("--checkpoint",
+                        help="Arquivo de checkpoint para retomar uma carga "
+                             "interrompida (implica --bulk)")
+    parser.add_argument("--cache-dir",
+                        help="Diretório do cache persistente de embeddings "
+                             "(implica --bulk)")
+    parser.add_argument("--coletar-lixo", action="store_true",
+                        help="Ao final, remove do cache vetores de textos "
+                             "que não estavam no corpus processado")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processos de encode em pipeline com a indexação "
+                             "(implica --bulk; padrão 0 = encode no processo atual)")
+    parser.add_argument("--threads-por-worker", type=int, default=1,
+                        help="Threads do PyTorch em cada processo de encode (padrão 1)")
+    parser.add_argument("--quantizacao", choices=MODOS_QUANTIZACAO,
+                        help="Cria o índice com vetores quantizados: 'byte' (int8 "
+                             "+ cópia float32 para reranquear) ou 'int8_hnsw' "
+                             "(Elasticsearch 8.12+); implica --bulk")
+    parser.add_argument("--reducao",
+                        help="Projeção PCA (.npz de reducao_dimensional.py) aplicada "
+                             "aos vetores antes da indexação; implica --bulk")
+    parser.add_argument("--hnsw-m", type=int,
+                        help="Vizinhos por nó do grafo HNSW ao criar o índice "
+                             "(padrão do Elasticsearch: 16)")
+    parser.add_argument("--hnsw-ef-construction", type=int,
+                        help="Candidatos avaliados na construção do HNSW ao criar "
+                             "o índice (padrão do Elasticsearch: 100)")
+    parser.add_argument("--rotear-por-categoria", action="store_true",
+                        help="Cria o índice com _routing = categoria, para que buscas "
+                             "filtradas consultem um único shard; implica --bulk")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Shards primários ao criar o índice (padrão 1)")
+    parser.add_argument("--source-enxuto", action="store_true",
+                        help="Cria o índice sem os vetores no _source (índice menor, "
+                             "mas os vetores não podem ser lidos de volta)")
+    parser.add_argument("--preload-vetores", action="store_true",
+                        help="Cria o índice com index.store.preload nos arquivos dos "
+                             "vetores e do HNSW (ver inicio_rapido.py para índices existentes)")
+    parser.add_argument("--atualizar-vizinhos", action="store_true",
+                        help="Ao final, atualiza a tabela de vizinhos pré-calculados "
+                             "(vizinhos_precomputados.py) com os documentos novos")
+    parser.add_argument("--porta-metricas", type=int,
+                        help="Expõe métricas do Prometheus (encode, _bulk) em "
+                             "http://localhost:<porta>/metrics durante a carga")
+    reindexacao = parser.add_mutually_exclusive_group()
+    reindexacao.add_argument("--incremental", action="store_true",
+                             help="Só gera embeddings e grava documentos novos ou "
+                                  "alterados (por hash do conteúdo) e apaga os que "
+                                  "saíram do corpus; implica --bulk")
+    reindexacao.add_argument("--reconstruir", action="store_true",
+                             help="Carrega o corpus em um índice versionado novo e "
+                                  "troca o alias artigos_vetorial para ele ao final, "
+                                  "sem interromper as buscas; implica --bulk")
+    parser.add_argument("--manter-anterior", action="store_true",
+                        help="Com --reconstruir, não apaga o índice anterior (rollback)")
+    args = parser.parse_args()
+    # A tabela de vizinhos lê os vetores do _source; no modo "byte" ela usa a
+    # cópia <campo>_float, que continua no _source enxuto
+    if args.source_enxuto and args.atualizar_vizinhos and args.quantizacao != "byte":
+        parser.error("--atualizar-vizinhos lê os vetores do _source e não funciona "
+                     "com --source-enxuto (exceto com --quantizacao byte)")
+    return args
+
+
+def ingestao_sequencial(model, documentos, es, args, cache, checkpoint, logger,
+                        projecao=None, metricas=METRICAS_NULAS, indice=INDICE):
+    """Gera embeddings no processo atual e envia os lotes pelo IndexadorBulk"""
+    lotes = gerar_lotes(
+        model,
+        documentos,
+        inicio=checkpoint.deslocamento,
+        indice=indice,
+        tamanho_lote=args.tamanho_lote,
+        lote_modelo=args.lote_modelo,
+        cache=cache,
+        quantizacao=args.quantizacao,
+        projecao=projecao,
+        roteamento=args.rotear_por_categoria,
+        metricas=metricas
+    )
+
+    with IndexadorBulk(
+            es,
+            concorrencia=args.concorrencia,
+            max_tentativas=args.max_tentativas,
+            metricas=metricas) as indexador:
+        for inicio_lote, fim_lote, acoes in lotes:
+            indexador.enviar(
+                acoes,
+                ao_concluir=lambda a=inicio_lote, b=fim_lote:
+                    checkpoint.marcar_concluido(a, b))
+            logger.info(
+                f"Lote com registros {inicio_lote}-{fim_lote - 1} enviado "
+                f"({len(acoes)} documentos)")
+
+    return indexador
+
+
+def ingestao_pipeline(documentos, es, args, cache, checkpoint, projecao=None,
+                      metricas=METRICAS_NULAS, indice=INDICE):
+    """Sobrepõe encode (pool de processos) e indexação"""
+    pipeline = PipelineIngestao(
+        es,
+        NOME_MODELO,
+        workers=args.workers,
+        threads_por_worker=args.threads_por_worker,
+        lote_modelo=args.lote_modelo,
+        indice=indice,
+        concorrencia=args.concorrencia,
+        max_tentativas=args.max_tentativas,
+        cache=cache,
+        quantizacao=args.quantizacao,
+        projecao=projecao,
+        roteamento=args.rotear_por_categoria,
+        metricas=metricas
+    )
+    try:
+        pipeline.executar(
+            documentos,
+            inicio=checkpoint.deslocamento,
+            tamanho_lote=args.tamanho_lote,
+            ao_concluir_lote=checkpoint.marcar_concluido
+        )
+    finally:
+        pipeline.relatorio()
+    return pipeline.indexador
+
+
+def ingestao_bulk(model, es, args, logger, projecao=None, metricas=METRICAS_NULAS,
+                  indice=INDICE, detector=None):
+    """Indexa o corpus em streaming: leitura, validação, embedding e _bulk
+
+    Com um `detector` (DetectorAlteracoes), só os documentos novos ou
+    alterados seguem para o encode e o _bulk.
+    """
+    checkpoint = Checkpoint(args.checkpoint)
+    checkpoint_inicial = checkpoint.deslocamento
+    if checkpoint.deslocamento:
+        logger.info(f"Retomando a partir do registro {checkpoint.deslocamento}")
+
+    if args.entrada:
+        registros = ler_corpus(args.entrada, inicio=checkpoint.deslocamento)
+    else:
+        registros = ler_lista(artigos, inicio=checkpoint.deslocamento)
+    documentos = validar_documentos(registros)
+    if detector is not None:
+        documentos = detector.filtrar(documentos)
+    else:
+        documentos = com_hash(documentos)
+
+    cache = None
+    if args.cache_dir:
+        cache = CacheEmbeddings(args.cache_dir, NOME_MODELO, dims=DIMENSOES)
+
+    inicio = time.time()
+    contexto = carga_otimizada(es, indice) if args.otimizar_carga else nullcontext()
+    # O cache é salvo ao sair do bloco, mesmo se a carga falhar no meio
+    contexto_cache = cache if cache is not None else nullcontext()
+
+    with contexto_cache, contexto:
+        if args.workers:
+            indexador = ingestao_pipeline(
+                documentos, es, args, cache, checkpoint, projecao, metricas, indice)
+        else:
+            indexador = ingestao_sequencial(
+                model, documentos, es, args, cache, checkpoint, logger, projecao,
+                metricas, indice)
+
+    duracao = time.time() - inicio
+    logger.info(
+        f"Ingestão em lote: {indexador.indexados} indexados, "
+        f"{indexador.falhas} falhas em {duracao:.1f}s "
+        f"({indexador.indexados / max(duracao, 1e-9):.1f} docs/s)")
+
+    if cache is not None:
+        stats = cache.estatisticas()
+        logger.info(
+            f"Cache de embeddings: {stats['acertos']} acertos, "
+            f"{stats['faltas']} faltas (taxa {stats['taxa_acerto']:.1%})")
+        # Uma carga retomada (ou incremental, que pula os inalterados) não viu o
+        # corpus inteiro: não há como saber o que é lixo
+        if args.coletar_lixo and not checkpoint_inicial and detector is None:
+            cache.coletar_lixo()
+        elif args.coletar_lixo:
+            logger.warning("Coleta de lixo ignorada em carga retomada ou incremental")
+
+    return indexador
 
 
 def main():
+    args = parse_args()
+
     # Configurar logging
     logging.basicConfig(
         level=logging.INFO,
@@ -23,9 +250,29 @@ def main():
 
     logger.info("Iniciando pipeline de geração de embeddings")
 
-    # Inicializar modelo e Elasticsearch
-    logger.info("Carregando modelo SentenceTransformer")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    # Cache, checkpoint e otimização da carga só existem no modo em lote
+    modo_bulk = (args.bulk or args.entrada or args.workers or args.quantizacao
+                 or args.reducao or args.rotear_por_categoria or args.incremental
+                 or args.reconstruir or args.cache_dir or args.checkpoint
+                 or args.otimizar_carga)
+
+    # Os dois modos precisam ler o corpus inteiro: o incremental para achar os
+    # removidos, a reconstrução porque o índice novo começa vazio
+    if (args.incremental or args.reconstruir) and args.checkpoint:
+        logger.error("--incremental e --reconstruir não podem ser usados com --checkpoint")
+        sys.exit(1)
+
+    metricas = METRICAS_NULAS
+    if args.porta_metricas:
+        metricas = metricas_padrao()
+        iniciar_servidor_metricas(args.porta_metricas)
+
+    # Inicializar modelo e Elasticsearch (no modo em pipeline, cada worker
+    # carrega o seu próprio modelo)
+    model = None
+    if not args.workers:
+        logger.info("Carregando modelo SentenceTransformer")
+        model = SentenceTransformer(NOME_MODELO)
 
     logger.info("Conectando ao Elasticsearch")
     es = Elasticsearch(['http://localhost:9200'])
@@ -40,6 +287,44 @@ def main():
 
     logger.info("Conexão estabelecida com sucesso")
 
+    # Os vetores indexados têm as dimensões da projeção, se houver
+    projecao, dims, reducao = None, DIMENSOES, None
+    if args.reducao:
+        projecao = ProjecaoPCA.carregar(args.reducao)
+        if projecao.dims_entrada != DIMENSOES:
+            logger.error(
+                f"A projeção espera {projecao.dims_entrada} dimensões, "
+                f"o modelo gera {DIMENSOES}")
+            sys.exit(1)
+        dims, reducao = projecao.dims, projecao.meta(args.reducao)
+        logger.info(f"Reduzindo os vetores de {DIMENSOES} para {dims} dimensões")
+
+    # O índice concreto é apagado na troca pelo alias: verificar antes da carga,
+    # e não depois de reconstruir tudo
+    if args.reconstruir and args.manter_anterior and e_indice_concreto(es, INDICE):
+        logger.error(
+            f"'{INDICE}' ainda é um índice concreto e será apagado quando o alias "
+            f"for criado: --manter-anterior não tem como preservá-lo. Faça uma "
+            f"cópia antes (ex.: _clone ou snapshot) ou rode sem --manter-anterior")
+        sys.exit(1)
+
+    # Na reconstrução, a carga vai para um índice novo; o alias só muda no final
+    indice = nome_versionado(INDICE) if args.reconstruir else INDICE
+    if args.reconstruir:
+        logger.info(f"Reconstruindo em '{indice}'; as buscas seguem no índice atual")
+
+    # Cria o índice com o mapeamento do modo escolhido (ou confere o existente)
+    try:
+        hnsw = {chave: valor for chave, valor in (
+            ("m", args.hnsw_m), ("ef_construction", args.hnsw_ef_construction))
+            if valor is not None}
+        garantir_indice(es, indice, dims, args.quantizacao, reducao, hnsw,
+                        args.rotear_por_categoria, args.shards, args.source_enxuto,
+                        args.preload_vetores)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
     # Dados de exemplo
 
     # Função para gerar embeddings
@@ -48,9 +333,62 @@ def main():
         embedding = model.encode(texto)
         return embedding.tolist()
 
-    logger.info(f"Processando {len(artigos)} documentos")
+    detector = None
+    if args.incremental:
+        hashes = ler_hashes(es, INDICE)
+        logger.info(f"{len(hashes)} documentos já indexados; comparando hashes")
+        detector = DetectorAlteracoes(hashes, args.rotear_por_categoria)
+
+    if modo_bulk:
+        indexador = ingestao_bulk(model, es, args, logger, projecao, metricas,
+                                  indice, detector)
+    else:
+        logger.info(f"Processando {len(artigos)} documentos")
+        indexar_documento_a_documento(gerar_embeddings, es, logger)
+
+    if detector is not None:
+        # Só depois da carga: a leitura do corpus é que revela os removidos
+        apagar = detector.removidos() + detector.obsoletos
+        if apagar:
+            remover_documentos(es, INDICE, apagar)
+        logger.info(f"Reindexação incremental: {detector.resumo()}")
+
+    # Forçar refresh do índice
+    es.indices.refresh(index=indice)
 
-    # Indexar documentos com embeddings
+    if args.reconstruir:
+        if indexador.falhas:
+            logger.error(
+                f"{indexador.falhas} documentos falharam: o alias '{INDICE}' "
+                f"continua no índice anterior e '{indice}' fica para inspeção")
+            sys.exit(1)
+        trocar_alias(es, INDICE, indice, args.manter_anterior)
+
+    # Avisa os caches de respostas de que o conteúdo do índice mudou
+    registrar_geracao(es, INDICE)
+
+    if args.atualizar_vizinhos:
+        tabela = TabelaVizinhos(es, INDICE)
+        if args.reconstruir:
+            # Índice novo: nenhuma lista antiga é confiável
+            tabela.construir()
+        else:
+            tabela.atualizar(modificados=detector.alterados if detector else ())
+
+    logger.info("Pipeline concluído com sucesso")
+    logger.info("Estatísticas do índice:")
+
+    # Mostrar estatísticas
+    stats = es.count(index="artigos_vetorial")
+    logger.info(f"Total de documentos: {stats['count']}")
+
+    # Verificar saúde do índice
+    health = es.cluster.health(index="artigos_vetorial")
+    logger.info(f"Status do índice: {health['status']}")
+
+
+def indexar_documento_a_documento(gerar_embeddings, es, logger):
+    """Indexa os artigos um a um (modo original do tutorial)"""
     for i, artigo in enumerate(artigos, 1):
         logger.info(
             f"Processando documento {i}/{len(artigos)}: {artigo['titulo'][:50]}")
@@ -79,20 +417,6 @@ def main():
         except Exception as e:
             logger.error(f"Erro ao indexar documento {i}: {e}")
 
-    # Forçar refresh do índice
-    es.indices.refresh(index="artigos_vetorial")
-
-    logger.info("Pipeline concluído com sucesso")
-    logger.info("Estatísticas do índice:")
-
-    # Mostrar estatísticas
-    stats = es.count(index="artigos_vetorial")
-    logger.info(f"Total de documentos: {stats['count']}")
-
-    # Verificar saúde do índice
-    health = es.cluster.health(index="artigos_vetorial")
-    logger.info(f"Status do índice: {health['status']}")
-
 
 if __name__ == "__main__":
     main()
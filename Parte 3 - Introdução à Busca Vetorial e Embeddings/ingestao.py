@@ -0,0 +1,240 @@
+"""
+Ingestão em Lote para Elasticsearch
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import helpers
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+import threading
+import logging
+import time
+
+from mapeamento import CAMPO_ROTEAMENTO, campos_vetoriais
+from metricas import METRICAS_NULAS
+
+INDICE = "artigos_vetorial"
+
+logger = logging.getLogger(__name__)
+
+
+def agrupar(iteravel, tamanho):
+    """Agrupa um iterável em listas de até `tamanho` elementos"""
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def gerar_embeddings_lote(model, textos, tamanho_lote=64, cache=None,
+                          metricas=METRICAS_NULAS):
+    """Gera embeddings para uma lista de textos em uma única chamada ao modelo
+
+    Com um `cache` (CacheEmbeddings), só os textos ainda não vistos vão ao modelo.
+    """
+    def encode(lista):
+        with metricas.medir_encode("ingestao"):
+            return model.encode(
+                lista,
+                batch_size=tamanho_lote,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+
+    if cache is not None:
+        return cache.codificar(textos, encode)
+    return encode(textos)
+
+
+def textos_para_embedding(artigos):
+    """Lista os textos a codificar de um lote: todos os títulos, depois os conteúdos"""
+    # Título e conteúdo vão na mesma chamada para aproveitar lotes maiores
+    return [a["titulo"] for a in artigos] + [a["conteudo"] for a in artigos]
+
+
+def montar_acoes(artigos, ids, embeddings, indice=INDICE, quantizacao=None,
+                 projecao=None, roteamento=False):
+    """Monta as ações do _bulk a partir dos embeddings de textos_para_embedding
+
+    `quantizacao` e `roteamento` seguem o mapeamento do índice (ver
+    mapeamento.py) e `projecao` (ProjecaoPCA) reduz as dimensões antes da
+    indexação.
+    """
+    if projecao is not None:
+        embeddings = projecao.aplicar(embeddings)
+    n = len(artigos)
+    acoes = []
+    for j, (artigo, doc_id) in enumerate(zip(artigos, ids)):
+        acao = {
+            "_index": indice,
+            "_id": doc_id,
+            "_source": {
+                **artigo,
+                **campos_vetoriais(embeddings[j], embeddings[n + j], quantizacao)
+            }
+        }
+        if roteamento and artigo.get(CAMPO_ROTEAMENTO):
+            acao["_routing"] = artigo[CAMPO_ROTEAMENTO]
+        acoes.append(acao)
+    return acoes
+
+
+def preparar_acoes(model, artigos, ids, indice=INDICE, tamanho_lote=64,
+                   cache=None, quantizacao=None, projecao=None, roteamento=False,
+                   metricas=METRICAS_NULAS):
+    """Gera os embeddings de um lote de artigos e monta as ações do _bulk"""
+    embeddings = gerar_embeddings_lote(
+        model, textos_para_embedding(artigos), tamanho_lote, cache, metricas)
+    return montar_acoes(artigos, ids, embeddings, indice, quantizacao, projecao,
+                        roteamento)
+
+
+def agrupar_documentos(documentos, inicio=0, tamanho_lote=256):
+    """Agrupa documentos validados e gera (inicio, fim, artigos, ids) por lote
+
+    `documentos` são tuplas (posição, id, documento) como as produzidas por
+    fonte_corpus.validar_documentos; [inicio, fim) cobre as posições lidas.
+    """
+    for lote in agrupar(documentos, tamanho_lote):
+        fim = lote[-1][0] + 1
+        yield (inicio, fim,
+               [documento for _, _, documento in lote],
+               [doc_id for _, doc_id, _ in lote])
+        inicio = fim
+
+
+def gerar_lotes(model, documentos, inicio=0, indice=INDICE,
+                tamanho_lote=256, lote_modelo=64, cache=None, quantizacao=None,
+                projecao=None, roteamento=False, metricas=METRICAS_NULAS):
+    """Gera (inicio, fim, ações) por lote, com os embeddings já calculados"""
+    for inicio_lote, fim, artigos, ids in agrupar_documentos(
+            documentos, inicio, tamanho_lote):
+        acoes = preparar_acoes(model, artigos, ids, indice=indice,
+                               tamanho_lote=lote_modelo, cache=cache,
+                               quantizacao=quantizacao, projecao=projecao,
+                               roteamento=roteamento, metricas=metricas)
+        yield inicio_lote, fim, acoes
+
+
+class IndexadorBulk:
+    """Envia lotes de documentos pela API _bulk com concorrência limitada"""
+
+    def __init__(self, es, concorrencia=2, max_tentativas=5,
+                 backoff_inicial=2, max_erros_registrados=100,
+                 metricas=METRICAS_NULAS):
+        self.es = es
+        self.metricas = metricas
+        self.concorrencia = max(1, concorrencia)
+        self.max_tentativas = max_tentativas
+        self.backoff_inicial = backoff_inicial
+        self.max_erros_registrados = max_erros_registrados
+
+        self.indexados = 0
+        self.falhas = 0
+        self.erros = []
+        # Soma do tempo gasto nas requisições _bulk (todas as threads)
+        self.tempo_envio = 0.0
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concorrencia)
+        self._pendentes = set()
+        self._lock = threading.Lock()
+
+    def enviar(self, acoes, ao_concluir=None):
+        """Agenda o envio de um lote, bloqueando se houver lotes demais em voo
+
+        `ao_concluir` é chamado (na thread de envio) quando o lote termina
+        sem nenhuma falha. Um lote com falhas fica em aberto: o checkpoint
+        não passa dele, e uma carga retomada o envia de novo.
+        """
+        # Limita os lotes em memória a 2x a concorrência (backpressure)
+        while len(self._pendentes) >= 2 * self.concorrencia:
+            concluidos, self._pendentes = wait(
+                self._pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                futuro.result()
+
+        self._pendentes.add(
+            self._executor.submit(self._enviar_lote, acoes, ao_concluir))
+
+    def _enviar_lote(self, acoes, ao_concluir=None):
+        inicio = time.perf_counter()
+        indexados = falhas = 0
+        # streaming_bulk reenvia itens rejeitados com 429 usando backoff exponencial
+        for ok, item in helpers.streaming_bulk(
+            self.es,
+            acoes,
+            chunk_size=len(acoes),
+            max_retries=self.max_tentativas,
+            initial_backoff=self.backoff_inicial,
+            raise_on_error=False,
+            raise_on_exception=False
+        ):
+            with self._lock:
+                if ok:
+                    self.indexados += 1
+                    indexados += 1
+                    continue
+
+                self.falhas += 1
+                falhas += 1
+                operacao, detalhe = next(iter(item.items()))
+                erro = {
+                    "_id": detalhe.get("_id"),
+                    "operacao": operacao,
+                    "status": detalhe.get("status"),
+                    "erro": detalhe.get("error")
+                }
+                if len(self.erros) < self.max_erros_registrados:
+                    self.erros.append(erro)
+                logger.error(
+                    f"Erro ao indexar documento {erro['_id']} "
+                    f"(status {erro['status']}): {erro['erro']}")
+
+        duracao = time.perf_counter() - inicio
+        with self._lock:
+            self.tempo_envio += duracao
+        self.metricas.observar_bulk(duracao, indexados, falhas)
+
+        if ao_concluir and not falhas:
+            ao_concluir()
+
+    def aguardar(self):
+        """Aguarda todos os lotes pendentes e encerra o pool de envio"""
+        for futuro in self._pendentes:
+            futuro.result()
+        self._pendentes = set()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.aguardar()
+        return False
+
+
+@contextmanager
+def carga_otimizada(es, indice=INDICE, replicas=0):
+    """Desativa refresh e réplicas durante a carga e restaura ao final"""
+    chaves = ("index.refresh_interval", "index.number_of_replicas")
+    resposta = es.indices.get_settings(index=indice, flat_settings=True)
+    # A resposta é indexada pelo nome concreto do índice (que pode ser um alias)
+    atuais = next(iter(resposta.values()))["settings"]
+    originais = {chave: atuais.get(chave) for chave in chaves}
+
+    logger.info(f"Relaxando configurações do índice '{indice}' para a carga")
+    es.indices.put_settings(index=indice, settings={
+        "index.refresh_interval": "-1",
+        "index.number_of_replicas": replicas
+    })
+    try:
+        yield
+    finally:
+        # Valores None voltam ao padrão do Elasticsearch
+        logger.info(f"Restaurando configurações do índice '{indice}'")
+        es.indices.put_settings(index=indice, settings=originais)
+        es.indices.refresh(index=indice)
@@ -0,0 +1,202 @@
+"""
+Ingestão em Pipeline com Pool de Processos de Encode
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from ingestao import (INDICE, IndexadorBulk, agrupar_documentos, montar_acoes,
+                      textos_para_embedding)
+from metricas import METRICAS_NULAS
+
+logger = logging.getLogger(__name__)
+
+# Modelo carregado uma única vez em cada processo do pool
+_modelo = None
+
+
+def _inicializar_worker(nome_modelo, threads):
+    global _modelo
+    # Imports pesados ficam no worker: o processo principal não carrega o modelo
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Um processo por núcleo: cada worker usa poucas threads para não competir
+    torch.set_num_threads(threads)
+    _modelo = SentenceTransformer(nome_modelo)
+
+
+def _codificar(textos, lote_modelo):
+    inicio = time.perf_counter()
+    vetores = _modelo.encode(
+        textos,
+        batch_size=lote_modelo,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    return vetores.astype(np.float32, copy=False), time.perf_counter() - inicio
+
+
+class PipelineIngestao:
+    """Sobrepõe o encode (pool de processos) e a indexação (_bulk)
+
+    O processo principal lê e agrupa os documentos e envia os textos ao pool
+    de encoders; uma thread consumidora recebe os lotes codificados, na ordem
+    de leitura, e os entrega ao IndexadorBulk. A fila entre os estágios é
+    limitada: se a indexação ficar lenta, o consumidor bloqueia no
+    IndexadorBulk, a fila enche e a leitura para de submeter novos lotes.
+    """
+
+    def __init__(self, es, nome_modelo, workers=None, threads_por_worker=1,
+                 tamanho_fila=None, lote_modelo=64, indice=INDICE,
+                 concorrencia=2, max_tentativas=5, cache=None, quantizacao=None,
+                 projecao=None, roteamento=False, metricas=METRICAS_NULAS):
+        self.es = es
+        self.nome_modelo = nome_modelo
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_por_worker = threads_por_worker
+        # Lotes já submetidos ao pool (e ainda não indexados): mantém todos
+        # os workers ocupados sem acumular lotes em memória
+        self.tamanho_fila = tamanho_fila or 2 * self.workers
+        self.lote_modelo = lote_modelo
+        self.indice = indice
+        self.concorrencia = concorrencia
+        self.max_tentativas = max_tentativas
+        self.cache = cache
+        self.quantizacao = quantizacao
+        self.projecao = projecao
+        self.roteamento = roteamento
+        self.metricas = metricas
+
+        self.docs_lidos = 0
+        self.docs_codificados = 0
+        self.tempo_leitura = 0.0
+        self.tempo_encode = 0.0
+        self.duracao = 0.0
+        self.indexador = None
+        self._erro = None
+
+    def executar(self, documentos, inicio=0, tamanho_lote=256, ao_concluir_lote=None):
+        """Processa os documentos (posição, id, documento) até o fim
+
+        `ao_concluir_lote(inicio, fim)` é chamado quando um lote é indexado.
+        """
+        inicio_execucao = time.perf_counter()
+        fila = queue.Queue(maxsize=self.tamanho_fila)
+        # "spawn" evita herdar o estado de threads do PyTorch via fork
+        contexto = multiprocessing.get_context("spawn")
+
+        logger.info(
+            f"Iniciando pipeline com {self.workers} encoders "
+            f"({self.threads_por_worker} thread(s) cada)")
+
+        with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=contexto,
+                initializer=_inicializar_worker,
+                initargs=(self.nome_modelo, self.threads_por_worker)) as pool, \
+                IndexadorBulk(self.es, concorrencia=self.concorrencia,
+                              max_tentativas=self.max_tentativas,
+                              metricas=self.metricas) as indexador:
+            self.indexador = indexador
+            consumidor = threading.Thread(
+                target=self._consumir, args=(fila, indexador, ao_concluir_lote),
+                name="pipeline-indexacao")
+            consumidor.start()
+
+            try:
+                lotes = agrupar_documentos(documentos, inicio, tamanho_lote)
+                marca = time.perf_counter()
+                for inicio_lote, fim, artigos, ids in lotes:
+                    if self._erro:
+                        break
+
+                    textos = textos_para_embedding(artigos)
+                    resultado, pendentes = None, None
+                    faltantes = textos
+                    if self.cache is not None:
+                        resultado, pendentes = self.cache.consultar(textos)
+                        faltantes = [textos[p[0]] for p in pendentes.values()]
+
+                    futuro = None
+                    if faltantes:
+                        futuro = pool.submit(_codificar, faltantes, self.lote_modelo)
+
+                    self.docs_lidos += len(artigos)
+                    self.tempo_leitura += time.perf_counter() - marca
+
+                    # Bloqueia quando a fila está cheia (backpressure)
+                    fila.put((inicio_lote, fim, artigos, ids,
+                              resultado, pendentes, futuro))
+                    marca = time.perf_counter()
+            finally:
+                fila.put(None)
+                consumidor.join()
+
+        self.duracao = time.perf_counter() - inicio_execucao
+        if self._erro:
+            raise self._erro
+
+    def _consumir(self, fila, indexador, ao_concluir_lote):
+        while True:
+            item = fila.get()
+            if item is None:
+                return
+            if self._erro:
+                # Continua esvaziando a fila para não travar o produtor
+                continue
+
+            inicio, fim, artigos, ids, resultado, pendentes, futuro = item
+            try:
+                embeddings = resultado
+                if futuro is not None:
+                    vetores, duracao = futuro.result()
+                    self.tempo_encode += duracao
+                    self.metricas.observar_encode("ingestao", duracao)
+                    # Só os textos que faltavam no cache passaram pelo modelo
+                    self.docs_codificados += len(vetores)
+                    if self.cache is not None:
+                        self.cache.completar(resultado, pendentes, vetores)
+                    else:
+                        embeddings = vetores
+
+                acoes = montar_acoes(artigos, ids, embeddings, self.indice,
+                                     self.quantizacao, self.projecao,
+                                     self.roteamento)
+                callback = (partial(ao_concluir_lote, inicio, fim)
+                            if ao_concluir_lote else None)
+                indexador.enviar(acoes, ao_concluir=callback)
+            except Exception as e:
+                logger.error(f"Erro no lote com registros {inicio}-{fim - 1}: {e}")
+                self._erro = e
+
+    def relatorio(self):
+        """Vazão (docs/s) de cada estágio e do pipeline completo
+
+        A vazão dos estágios paralelos considera o tempo ocupado somado de
+        todos os workers dividido pelo número de workers.
+        """
+        def vazao(docs, segundos):
+            return docs / segundos if segundos > 0 else 0.0
+
+        indexados = self.indexador.indexados if self.indexador else 0
+        tempo_envio = self.indexador.tempo_envio if self.indexador else 0.0
+        estagios = {
+            "leitura": vazao(self.docs_lidos, self.tempo_leitura),
+            "encode": vazao(self.docs_codificados,
+                            self.tempo_encode / self.workers),
+            "indexacao": vazao(indexados, tempo_envio / self.concorrencia),
+            "total": vazao(indexados, self.duracao)
+        }
+
+        for estagio, docs_por_s in estagios.items():
+            logger.info(f"Vazão {estagio}: {docs_por_s:.1f} docs/s")
+        return estagios
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Início Rápido: Carga Preguiçosa do Modelo, Aquecimento e Preload do Índice
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from mapeamento import EXTENSOES_PRELOAD
+
+logger = logging.getLogger(__name__)
+
+# Consultas de aquecimento, uma por categoria do corpus de exemplo
+CONSULTAS_AQUECIMENTO = [
+    "inteligência artificial e aprendizado de máquina",
+    "receitas da culinária italiana",
+    "preservação do meio ambiente e energia renovável",
+    "alimentação saudável e exercícios físicos",
+    "mercado financeiro e investimentos",
+    "exposições de arte contemporânea"
+]
+
+# Consultas da medição: diferentes das de aquecimento, para não acertar caches
+CONSULTAS_MEDICAO = ["redes neurais para visão computacional",
+                     "pratos típicos da culinária japonesa"]
+
+MODOS_INICIO = ("padrao", "rapido", "rapido_aquecido")
+
+
+def carregar_modelo(nome_modelo):
+    """Importa sentence_transformers (e o torch) só quando o modelo é necessário"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(nome_modelo)
+
+
+class ModeloPreguicoso:
+    """SentenceTransformer carregado em segundo plano
+
+    A importação do sentence_transformers/torch e a leitura dos pesos rodam
+    em uma thread iniciada na construção; `encode` tem a mesma interface do
+    modelo e só bloqueia se a carga ainda não terminou. Pode substituir o
+    modelo em qualquer lugar que só chame `encode` (inclusive no
+    ServidorEmbeddings).
+    """
+
+    def __init__(self, nome_modelo, iniciar=True):
+        self.nome_modelo = nome_modelo
+        # Instante (time.perf_counter) em que o modelo ficou disponível
+        self.pronto_em = None
+        self.tempo_carga = None
+
+        self._modelo = None
+        self._erro = None
+        self._pronto = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        if iniciar:
+            self.iniciar()
+
+    def iniciar(self):
+        """Dispara a carga em segundo plano (chamadas repetidas são ignoradas)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._carregar, name="carga-modelo", daemon=True)
+                self._thread.start()
+
+    def _carregar(self):
+        inicio = time.perf_counter()
+        try:
+            self._modelo = carregar_modelo(self.nome_modelo)
+        except Exception as e:
+            logger.error(f"Erro ao carregar o modelo {self.nome_modelo}: {e}")
+            self._erro = e
+        finally:
+            self.pronto_em = time.perf_counter()
+            self.tempo_carga = self.pronto_em - inicio
+            self._pronto.set()
+        if self._erro is None:
+            logger.info(f"Modelo {self.nome_modelo} carregado em {self.tempo_carga:.2f}s")
+
+    def pronto(self):
+        """True se o modelo já pode ser usado sem esperar"""
+        return self._pronto.is_set() and self._erro is None
+
+    def obter(self, timeout=None):
+        """O SentenceTransformer, esperando a carga terminar se necessário"""
+        self.iniciar()
+        if not self._pronto.wait(timeout):
+            raise TimeoutError(f"Modelo {self.nome_modelo} ainda carregando")
+        if self._erro is not None:
+            raise self._erro
+        return self._modelo
+
+    def encode(self, *args, **kwargs):
+        return self.obter().encode(*args, **kwargs)
+
+
+def rodada(modo):
+    """Um processo novo: importa, constrói a BuscaVetorial e faz duas consultas
+
+    Os tempos são contados a partir do início desta função, antes de
+    importar busca_vetorial, e impressos em JSON na saída padrão.
+    """
+    inicio = time.perf_counter()
+    from busca_vetorial import BuscaVetorial, OpcoesInicio
+    importacao = time.perf_counter() - inicio
+
+    rapido = modo != "padrao"
+    busca = BuscaVetorial(inicio=OpcoesInicio(rapido=rapido, aquecer=rapido))
+    pronto = time.perf_counter() - inicio
+    if modo == "rapido_aquecido":
+        busca.aguardar_aquecimento()
+
+    latencias = []
+    for consulta in CONSULTAS_MEDICAO:
+        inicio_consulta = time.perf_counter()
+        busca.buscar_por_similaridade(consulta, k=5)
+        latencias.append(time.perf_counter() - inicio_consulta)
+        if len(latencias) == 1:
+            primeira_resposta = time.perf_counter() - inicio
+
+    print(json.dumps({
+        "modo": modo,
+        "importacao": importacao,
+        "pronto": pronto,
+        "primeira_consulta": latencias[0],
+        "segunda_consulta": latencias[1],
+        "primeira_resposta": primeira_resposta,
+        **{f"inicio_{etapa}": tempo for etapa, tempo in busca.tempos_inicio.items()}
+    }))
+
+
+def medir(modos, repeticoes):
+    """Roda `repeticoes` processos por modo e retorna a mediana de cada tempo
+
+    Etapas em segundo plano (modelo, aquecimento) só aparecem nas rodadas em
+    que terminaram: a mediana de cada tempo usa as rodadas que o têm, e
+    `amostras` registra quantas foram.
+    """
+    resumo = []
+    for modo in modos:
+        rodadas = []
+        for i in range(repeticoes):
+            logger.info(f"Modo {modo}: rodada {i + 1}/{repeticoes}")
+            processo = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "rodada", "--modo", modo],
+                capture_output=True, text=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+            if processo.returncode != 0:
+                raise RuntimeError(f"Rodada do modo {modo} falhou:\n{processo.stderr}")
+            rodadas.append(json.loads(processo.stdout.strip().splitlines()[-1]))
+
+        chaves = list(dict.fromkeys(c for r in rodadas for c in r if c != "modo"))
+        valores = {c: [r[c] for r in rodadas if c in r] for c in chaves}
+        resumo.append({"modo": modo, "rodadas": repeticoes,
+                       **{c: statistics.median(v) for c, v in valores.items()},
+                       "amostras": {c: len(v) for c, v in valores.items()}})
+    return resumo
+
+
+def configurar_preload(es, indice, extensoes):
+    """Define index.store.preload em um índice existente
+
+    A configuração é estática: o índice é fechado e reaberto, ficando
+    indisponível por alguns segundos. Depois da reabertura, os arquivos
+    com as extensões dadas são lidos para o page cache antes de os shards
+    aceitarem buscas.
+    """
+    logger.info(f"Fechando '{indice}' para definir o preload de {', '.join(extensoes)}")
+    es.indices.close(index=indice)
+    try:
+        es.indices.put_settings(index=indice,
+                                settings={"index.store.preload": list(extensoes)})
+    finally:
+        es.indices.open(index=indice, wait_for_active_shards="all")
+    logger.info(f"Índice '{indice}' reaberto com preload")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Mede o tempo de início da BuscaVetorial e configura o preload do índice")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    medicao = subparsers.add_parser(
+        "medir", help="Compara tempo até ficar pronto e latência da primeira consulta")
+    medicao.add_argument("--modos", nargs="+", choices=MODOS_INICIO,
+                         default=list(MODOS_INICIO))
+    medicao.add_argument("--repeticoes", type=int, default=3,
+                         help="Processos por modo; vale a mediana (padrão 3)")
+    medicao.add_argument("--saida", help="Grava o resumo em JSON")
+
+    # Usado internamente por "medir": cada rodada é um processo novo
+    unica = subparsers.add_parser("rodada", help=argparse.SUPPRESS)
+    unica.add_argument("--modo", choices=MODOS_INICIO, required=True)
+
+    preload = subparsers.add_parser(
+        "preload", help="Define index.store.preload (fecha e reabre o índice)")
+    preload.add_argument("--indice", default="artigos_vetorial")
+    preload.add_argument("--extensoes", nargs="+", default=list(EXTENSOES_PRELOAD),
+                         help="Extensões dos arquivos do Lucene (padrão: vetores e HNSW)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.comando == "rodada":
+        # Só o JSON vai para a saída padrão; os logs ficam no stderr
+        logging.basicConfig(level=logging.WARNING)
+        rodada(args.modo)
+        return
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    if args.comando == "preload":
+        from elasticsearch import Elasticsearch
+        configurar_preload(Elasticsearch(['http://localhost:9200']), args.indice,
+                           args.extensoes)
+        return
+
+    resumo = medir(args.modos, args.repeticoes)
+    print(f"\n{'modo':<18}{'import':>9}{'pronto':>9}{'modelo':>9}{'aquec.':>9}"
+          f"{'1ª cons.':>10}{'2ª cons.':>10}{'1ª resp.':>10}")
+    def segundos(valor):
+        return f"{valor:>8.2f}s" if valor is not None else f"{'-':>9}"
+
+    for r in resumo:
+        print(f"{r['modo']:<18}{r['importacao']:>8.2f}s{r['pronto']:>8.2f}s"
+              + segundos(r.get("inicio_modelo")) + segundos(r.get("inicio_aquecimento"))
+              + f"{r['primeira_consulta'] * 1000:>8.0f}ms{r['segunda_consulta'] * 1000:>8.0f}ms"
+              f"{r['primeira_resposta']:>9.2f}s")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resumo, arquivo, indent=2, ensure_ascii=False)
+        logger.info(f"Resumo salvo em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
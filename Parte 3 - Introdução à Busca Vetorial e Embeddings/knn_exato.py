@@ -0,0 +1,157 @@
+"""
+Busca kNN Exata Local com NumPy
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import helpers
+import numpy as np
+import logging
+
+from mapeamento import exigir_vetores_no_source
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar(vetores):
+    """Normaliza as linhas para norma 1 (cosseno vira produto escalar)"""
+    vetores = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return vetores / normas
+
+
+def topk_em_blocos(consultas, blocos, k):
+    """Top-k exato por produto escalar, percorrendo a base em blocos
+
+    `blocos` gera (deslocamento, matriz) com partes consecutivas da base.
+    Cada bloco produz uma matriz de similaridades (consultas x bloco) da qual
+    só os k melhores por linha (argpartition) são mesclados ao resultado
+    parcial, então a memória não depende do tamanho da base.
+    Retorna (índices, similaridades) de forma (n_consultas, k), em ordem
+    decrescente de similaridade.
+    """
+    n = len(consultas)
+    melhores_idx = np.empty((n, 0), dtype=np.int64)
+    melhores_sim = np.empty((n, 0), dtype=np.float32)
+
+    for deslocamento, bloco in blocos:
+        sims = consultas @ bloco.T
+        kb = min(k, sims.shape[1])
+        parcial = np.argpartition(-sims, kb - 1, axis=1)[:, :kb]
+
+        candidatos_idx = np.hstack([melhores_idx, parcial + deslocamento])
+        candidatos_sim = np.hstack(
+            [melhores_sim, np.take_along_axis(sims, parcial, axis=1)])
+
+        kk = min(k, candidatos_sim.shape[1])
+        manter = np.argpartition(-candidatos_sim, kk - 1, axis=1)[:, :kk]
+        melhores_idx = np.take_along_axis(candidatos_idx, manter, axis=1)
+        melhores_sim = np.take_along_axis(candidatos_sim, manter, axis=1)
+
+    ordem = np.argsort(-melhores_sim, axis=1)
+    return (np.take_along_axis(melhores_idx, ordem, axis=1),
+            np.take_along_axis(melhores_sim, ordem, axis=1))
+
+
+class KnnExato:
+    """Busca exata por similaridade de cosseno sobre uma matriz em memória
+
+    Os vetores ficam em uma matriz float32 contígua e normalizada. Serve como
+    oráculo de recall para benchmarks e como modo degradado da busca por
+    similaridade quando o Elasticsearch está fora do ar.
+    """
+
+    def __init__(self, ids, vetores, fontes=None, campo="conteudo_embedding",
+                 tamanho_bloco=16384):
+        self.ids = list(ids)
+        self.matriz = np.ascontiguousarray(normalizar(vetores))
+        self.fontes = fontes
+        self.campo = campo
+        self.tamanho_bloco = tamanho_bloco
+
+    @classmethod
+    def carregar_do_indice(cls, es, indice="artigos_vetorial",
+                           campo="conteudo_embedding",
+                           campos_fonte=("titulo", "categoria", "data_publicacao")):
+        """Lê todos os vetores do índice (scroll) para uma matriz em memória
+
+        Guarda também `campos_fonte` de cada documento, para que as respostas
+        do modo degradado possam ser exibidas como as do Elasticsearch.
+        """
+        exigir_vetores_no_source(es, indice, [campo], "o kNN exato")
+        total = es.count(index=indice)["count"]
+        matriz = None
+        ids, fontes = [], []
+
+        for hit in helpers.scan(
+                es, index=indice, size=1000,
+                query={"query": {"match_all": {}},
+                       "_source": [campo, *campos_fonte]}):
+            fonte = hit["_source"]
+            vetor = fonte.pop(campo, None)
+            if vetor is None:
+                continue
+            if matriz is None:
+                matriz = np.empty((total, len(vetor)), dtype=np.float32)
+            if len(ids) >= len(matriz):
+                # Documentos indexados durante a leitura
+                matriz = np.vstack([matriz, np.empty_like(matriz)])
+            matriz[len(ids)] = vetor
+            ids.append(hit["_id"])
+            fontes.append(fonte)
+
+        if matriz is None:
+            raise ValueError(f"Nenhum vetor encontrado em '{indice}.{campo}'")
+
+        logger.info(f"{len(ids)} vetores carregados de '{indice}' para busca exata")
+        return cls(ids, matriz[:len(ids)], fontes=fontes, campo=campo)
+
+    @classmethod
+    def carregar_exportacao(cls, diretorio, campo="conteudo_embedding"):
+        """Monta a matriz a partir de uma exportação de exportar_vetores.py"""
+        from exportar_vetores import carregar_exportacao
+
+        ids, vetores = carregar_exportacao(diretorio)
+        matriz = vetores[campo]
+        # Linhas NaN são documentos exportados sem o campo
+        validas = ~np.isnan(matriz).any(axis=1)
+        return cls([i for i, v in zip(ids, validas) if v], matriz[validas],
+                   campo=campo)
+
+    def _blocos(self):
+        for inicio in range(0, len(self.matriz), self.tamanho_bloco):
+            yield inicio, self.matriz[inicio:inicio + self.tamanho_bloco]
+
+    def buscar_lote(self, consultas, k=10):
+        """Top-k exato para várias consultas (matriz n x dims)
+
+        Retorna (índices, similaridades de cosseno), ambos (n, k).
+        """
+        consultas = normalizar(np.atleast_2d(consultas))
+        return topk_em_blocos(consultas, self._blocos(), min(k, len(self.matriz)))
+
+    def buscar(self, query_vector, k=10):
+        """Top-k exato para uma consulta: lista de (id, similaridade de cosseno)"""
+        indices, sims = self.buscar_lote(query_vector, k)
+        return [(self.ids[i], float(s)) for i, s in zip(indices[0], sims[0])]
+
+    def resposta(self, query_vector, k=10):
+        """Executa a busca e devolve uma resposta no formato do Elasticsearch"""
+        indices, sims = self.buscar_lote(query_vector, k)
+        hits = []
+        for i, sim in zip(indices[0], sims[0]):
+            hits.append({
+                "_id": self.ids[i],
+                # Mesmo score do kNN com similarity "cosine": (1 + cos) / 2
+                "_score": float((1.0 + sim) / 2.0),
+                "_source": dict(self.fontes[i]) if self.fontes else {}
+            })
+        return {
+            "took": 0,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(hits), "relation": "eq"},
+                "max_score": hits[0]["_score"] if hits else None,
+                "hits": hits
+            }
+        }
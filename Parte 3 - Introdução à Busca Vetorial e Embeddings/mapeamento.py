@@ -0,0 +1,288 @@
+"""
+Mapeamento do Índice Vetorial e Modos de Quantização
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import BadRequestError
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_VETORES = ("titulo_embedding", "conteudo_embedding")
+# Campo float32 (sem HNSW) usado para reranquear no modo "byte"
+SUFIXO_PRECISAO_TOTAL = "_float"
+MODOS_QUANTIZACAO = ("byte", "int8_hnsw")
+# Campo usado como _routing quando o índice é roteado por categoria
+CAMPO_ROTEAMENTO = "categoria"
+# Hash do conteúdo de cada documento, comparado na reindexação incremental
+CAMPO_HASH = "hash_conteudo"
+# Arquivos do Lucene com vetores (.vec), grafo HNSW (.vex), metadados (.vem)
+# e, no int8_hnsw, os vetores quantizados (.veq, .vemq)
+EXTENSOES_PRELOAD = ("vec", "vex", "vem", "veq", "vemq")
+
+
+def versao_suporta_int8_hnsw(versao):
+    """int8_hnsw existe a partir do Elasticsearch 8.12"""
+    maior, menor = (int(parte) for parte in versao.split(".")[:2])
+    return (maior, menor) >= (8, 12)
+
+
+def campo_precisao_total(campo, quantizacao):
+    """Campo de onde vêm os vetores float32 para reranquear"""
+    if quantizacao == "byte":
+        return f"{campo}{SUFIXO_PRECISAO_TOTAL}"
+    return campo
+
+
+def mapeamento_indice(dims=384, quantizacao=None, reducao=None, hnsw=None,
+                      roteamento=False, shards=1, source_enxuto=False,
+                      preload=False):
+    """Settings e mappings do índice artigos_vetorial
+
+    - None: vetores float32 com HNSW (mapeamento original)
+    - "byte": vetores int8 com HNSW (4x menos memória) e uma cópia float32
+      sem HNSW em `<campo>_float`, lida só para reranquear os candidatos
+    - "int8_hnsw": vetores float32 com o grafo HNSW quantizado pelo próprio
+      Elasticsearch (8.12+); o float32 original continua no _source
+
+    `reducao` é o registro da projeção aplicada aos vetores (ProjecaoPCA.meta),
+    gravado no _meta para que as consultas usem a mesma projeção. `hnsw`
+    ajusta a construção do grafo, ex.: {"m": 16, "ef_construction": 100}
+    (ver ajuste_hnsw.py na Parte 5). Com `roteamento`, os documentos de uma
+    mesma categoria ficam no mesmo shard (_routing = categoria), e buscas
+    filtradas por categoria consultam só esse shard. Com `source_enxuto`, os
+    vetores indexados no HNSW não são gravados no _source: o índice fica
+    menor e nenhuma leitura de _source carrega 2 x 384 floats, mas os
+    vetores deixam de poder ser lidos de volta (a cópia `<campo>_float` do
+    modo "byte" continua no _source). Com `preload`, os arquivos dos
+    vetores e do grafo são lidos para o page cache quando o shard abre,
+    e as primeiras buscas depois de um restart não pagam leituras do disco.
+    """
+    if quantizacao not in (None, *MODOS_QUANTIZACAO):
+        raise ValueError(f"Modo de quantização desconhecido: {quantizacao}")
+    if source_enxuto and quantizacao == "int8_hnsw":
+        raise ValueError(
+            "int8_hnsw reranqueia com os vetores do _source: use o modo 'byte' "
+            "com source enxuto")
+
+    propriedades = {
+        "titulo": {"type": "text"},
+        "conteudo": {"type": "text"},
+        "categoria": {"type": "keyword"},
+        "data_publicacao": {"type": "date"},
+        # Só lido por docvalue_fields (reindexacao.py), nunca buscado
+        CAMPO_HASH: {"type": "keyword", "index": False}
+    }
+    for campo in CAMPOS_VETORES:
+        vetor = {
+            "type": "dense_vector",
+            "dims": dims,
+            "index": True,
+            "similarity": "cosine"
+        }
+        if quantizacao == "byte":
+            vetor["element_type"] = "byte"
+            propriedades[campo_precisao_total(campo, quantizacao)] = {
+                "type": "dense_vector",
+                "dims": dims,
+                "index": False
+            }
+        if quantizacao == "int8_hnsw":
+            vetor["index_options"] = {"type": "int8_hnsw", **(hnsw or {})}
+        elif hnsw:
+            vetor["index_options"] = {"type": "hnsw", **hnsw}
+        propriedades[campo] = vetor
+
+    mappings = {
+        # Registrado no índice para que as buscas saibam como consultar
+        "_meta": {
+            "quantizacao": quantizacao,
+            "reducao": reducao,
+            "roteamento": CAMPO_ROTEAMENTO if roteamento else None,
+            "source_enxuto": source_enxuto
+        },
+        "properties": propriedades
+    }
+    if source_enxuto:
+        mappings["_source"] = {"excludes": list(CAMPOS_VETORES)}
+
+    settings = {
+        "number_of_shards": shards,
+        "number_of_replicas": 0
+    }
+    if preload:
+        settings["index.store.preload"] = list(EXTENSOES_PRELOAD)
+
+    return {
+        "settings": settings,
+        "mappings": mappings
+    }
+
+
+def meta_do_indice(es, indice):
+    """Lê o _meta do mapeamento (quantização e redução dimensional)"""
+    resposta = es.indices.get_mapping(index=indice)
+    return next(iter(resposta.values()))["mappings"].get("_meta", {})
+
+
+def exigir_vetores_no_source(es, indice, campos, uso):
+    """Falha cedo se algum dos `campos` foi excluído do _source (source enxuto)
+
+    Os vetores continuam no HNSW, mas não podem ser lidos de volta: sem
+    esta checagem, quem lê o _source recebe documentos sem vetor. `uso`
+    descreve quem precisa dos vetores, para a mensagem de erro.
+    """
+    if not meta_do_indice(es, indice).get("source_enxuto"):
+        return
+    excluidos = [campo for campo in campos if campo in CAMPOS_VETORES]
+    if excluidos:
+        raise ValueError(
+            f"O índice '{indice}' foi criado com --source-enxuto: {', '.join(excluidos)} "
+            f"não está no _source e {uso} não tem como ler os vetores. Recrie o "
+            f"índice sem --source-enxuto (generate_embeddings.py --reconstruir)")
+
+
+def quantizacao_do_indice(es, indice):
+    """Lê o modo de quantização registrado no _meta do mapeamento"""
+    return meta_do_indice(es, indice).get("quantizacao")
+
+
+def registrar_geracao(es, indice):
+    """Incrementa a `geracao` do _meta ao fim de uma carga
+
+    Caches de respostas (cache_respostas.py) comparam a geração para
+    descartar resultados anteriores à carga. O _meta é regravado inteiro,
+    preservando quantização, redução e roteamento.
+    """
+    meta = meta_do_indice(es, indice)
+    meta["geracao"] = meta.get("geracao", 0) + 1
+    es.indices.put_mapping(index=indice, meta=meta)
+    logger.info(f"Índice '{indice}' na geração {meta['geracao']}")
+    return meta["geracao"]
+
+
+def garantir_campo_hash(es, indice):
+    """Mapeia o campo de hash em índices criados antes dele existir
+
+    Sem isso, a primeira carga com hash deixaria o mapeamento dinâmico criar
+    um campo text, que não pode ser lido por docvalue_fields nem mudado
+    depois para keyword.
+    """
+    try:
+        es.indices.put_mapping(index=indice, properties={
+            CAMPO_HASH: {"type": "keyword", "index": False}})
+    except BadRequestError as e:
+        raise ValueError(
+            f"O campo '{CAMPO_HASH}' de '{indice}' já existe com outro tipo "
+            f"({e.message}): recrie o índice com --reconstruir") from e
+
+
+def garantir_indice(es, indice, dims=384, quantizacao=None, reducao=None,
+                    hnsw=None, roteamento=False, shards=1, source_enxuto=False,
+                    preload=False):
+    """Cria o índice se não existir e confere quantização e redução se existir
+
+    Num índice existente, também mapeia o campo de hash (garantir_campo_hash)
+    antes que alguma carga o grave.
+    """
+    if not es.indices.exists(index=indice):
+        if quantizacao == "int8_hnsw":
+            versao = es.info()["version"]["number"]
+            if not versao_suporta_int8_hnsw(versao):
+                raise ValueError(
+                    f"int8_hnsw requer Elasticsearch 8.12+ (servidor: {versao}); "
+                    f"use o modo 'byte'")
+        corpo = mapeamento_indice(dims, quantizacao, reducao, hnsw,
+                                  roteamento, shards, source_enxuto, preload)
+        es.indices.create(index=indice, settings=corpo["settings"],
+                          mappings=corpo["mappings"])
+        logger.info(f"Índice '{indice}' criado (quantização: {quantizacao or 'nenhuma'})")
+        return
+
+    meta = meta_do_indice(es, indice)
+    atual = meta.get("quantizacao")
+    if atual != quantizacao:
+        raise ValueError(
+            f"O índice '{indice}' usa quantização '{atual or 'nenhuma'}', "
+            f"mas a carga pediu '{quantizacao or 'nenhuma'}'")
+
+    assinatura = (meta.get("reducao") or {}).get("assinatura")
+    if assinatura != (reducao or {}).get("assinatura"):
+        raise ValueError(
+            f"O índice '{indice}' foi criado com outra redução dimensional "
+            f"(assinatura {assinatura or 'nenhuma'})")
+
+    if bool(meta.get("source_enxuto")) != source_enxuto:
+        raise ValueError(
+            f"O índice '{indice}' {'' if meta.get('source_enxuto') else 'não '}foi "
+            f"criado com --source-enxuto: use a mesma opção ou --reconstruir")
+
+    if bool(meta.get("roteamento")) != roteamento:
+        raise ValueError(
+            f"O índice '{indice}' {'' if meta.get('roteamento') else 'não '}é "
+            f"roteado por {CAMPO_ROTEAMENTO}: documentos iriam para o shard errado")
+
+    garantir_campo_hash(es, indice)
+
+
+def quantizar_byte(vetores):
+    """Converte vetores float para int8, escalando a versão normalizada por 127
+
+    Como a similaridade é de cosseno, só a direção importa: normalizar antes
+    de escalar usa toda a faixa [-127, 127] em cada vetor.
+    """
+    vetores = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return np.clip(np.rint(vetores / normas * 127), -127, 127).astype(np.int8)
+
+
+def campos_vetoriais(titulo_embedding, conteudo_embedding, quantizacao=None):
+    """Campos vetoriais de um documento, no formato do mapeamento escolhido"""
+    campos = {}
+    for campo, embedding in zip(CAMPOS_VETORES, (titulo_embedding, conteudo_embedding)):
+        if quantizacao == "byte":
+            campos[campo] = quantizar_byte(embedding).tolist()
+            campos[campo_precisao_total(campo, quantizacao)] = embedding.tolist()
+        else:
+            campos[campo] = embedding.tolist()
+    return campos
+
+
+def vetor_consulta(query_embedding, quantizacao=None):
+    """Vetor de consulta no tipo do campo (int8 no modo "byte")"""
+    if quantizacao == "byte":
+        return quantizar_byte(query_embedding).tolist()
+    return query_embedding
+
+
+def reranquear(response, query_embedding, campo, k, quantizacao):
+    """Reordena os candidatos pelo cosseno com os vetores float32
+
+    Os candidatos devem trazer `campo_precisao_total` no _source, que é
+    removido depois do cálculo. O score final segue a escala do kNN com
+    similarity "cosine", (1 + cos) / 2; o score da fase quantizada fica em
+    `_score_quantizado`.
+    """
+    hits = response["hits"]["hits"]
+    if not hits:
+        return response
+
+    campo_float = campo_precisao_total(campo, quantizacao)
+    consulta = np.asarray(query_embedding, dtype=np.float32)
+    consulta /= np.linalg.norm(consulta) or 1.0
+    vetores = np.asarray([hit["_source"].pop(campo_float) for hit in hits],
+                         dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=1)
+    normas[normas == 0] = 1.0
+    similaridades = (vetores @ consulta) / normas
+
+    for hit, similaridade in zip(hits, similaridades):
+        hit["_score_quantizado"] = hit["_score"]
+        hit["_score"] = float((1.0 + similaridade) / 2.0)
+
+    hits.sort(key=lambda hit: hit["_score"], reverse=True)
+    del hits[k:]
+    response["hits"]["max_score"] = hits[0]["_score"]
+    return response
@@ -0,0 +1,212 @@
+"""
+Métricas de Latência por Estágio com Prometheus
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+from elasticsearch.serializer import DEFAULT_SERIALIZERS
+
+try:
+    from prometheus_client import Counter, Histogram, start_http_server
+except ImportError:
+    Counter = Histogram = start_http_server = None
+
+logger = logging.getLogger(__name__)
+
+# Limites dos histogramas de tempo, em segundos (de 0,5 ms a 10 s)
+BALDES_TEMPO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                0.5, 1.0, 2.5, 5.0, 10.0)
+BALDES_HITS = (0, 1, 3, 5, 10, 20, 50, 100, 200)
+
+# Tempo do último parse de resposta feito na thread atual
+_parse = threading.local()
+
+
+class SerializadorMedido:
+    """Envolve um serializador do cliente e mede o tempo de `loads`
+
+    O cliente faz o parse da resposta na mesma thread (ou, no cliente
+    assíncrono, na mesma tarefa, sem ceder o loop) que fez a requisição,
+    então o tempo fica em uma variável por thread até ser lido por
+    consumir_tempo_parse logo após a chamada. Só o último parse é
+    guardado, para que requisições não medidas (ping, stats) não somem
+    ao tempo da próxima busca.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.mimetype = base.mimetype
+
+    def loads(self, data):
+        inicio = time.perf_counter()
+        try:
+            return self.base.loads(data)
+        finally:
+            _parse.segundos = time.perf_counter() - inicio
+
+    def dumps(self, data):
+        return self.base.dumps(data)
+
+
+def serializadores_medidos(serializadores=None):
+    """Serializadores padrão do cliente (ou os dados) envolvidos em SerializadorMedido"""
+    todos = {**DEFAULT_SERIALIZERS, **(serializadores or {})}
+    return {mimetype: SerializadorMedido(s) for mimetype, s in todos.items()}
+
+
+def consumir_tempo_parse():
+    """Tempo (s) do último parse feito na thread atual, zerando-o"""
+    segundos = getattr(_parse, "segundos", 0.0)
+    _parse.segundos = 0.0
+    return segundos
+
+
+class Metricas:
+    """Histogramas e contadores de busca e ingestão no registro do Prometheus
+
+    Busca, por `operacao` (similaridade, hibrida, rrf_lexical, ...):
+    duração da requisição vista pelo cliente, `took` do servidor, parse
+    da resposta e hits retornados. Encode do modelo por `origem`
+    (consulta, lote, documento, ingestao), resultados dos caches e, na
+    ingestão, duração das requisições _bulk e documentos indexados.
+    """
+
+    def __init__(self, registro=None, prefixo="busca_vetorial"):
+        opcoes = {"registry": registro} if registro is not None else {}
+
+        def histograma(nome, descricao, rotulos, baldes=BALDES_TEMPO):
+            return Histogram(f"{prefixo}_{nome}", descricao, rotulos,
+                             buckets=baldes, **opcoes)
+
+        def contador(nome, descricao, rotulos):
+            return Counter(f"{prefixo}_{nome}", descricao, rotulos, **opcoes)
+
+        self.encode = histograma(
+            "encode_segundos", "Tempo de encode do modelo", ["origem"])
+        self.requisicao = histograma(
+            "requisicao_segundos", "Duração da requisição vista pelo cliente",
+            ["operacao"])
+        self.took = histograma(
+            "took_segundos", "Tempo de execução no Elasticsearch (took)",
+            ["operacao"])
+        self.parse = histograma(
+            "parse_segundos", "Tempo de parse da resposta no cliente", ["operacao"])
+        self.hits = histograma(
+            "hits", "Hits retornados por busca", ["operacao"], baldes=BALDES_HITS)
+        self.cache = contador(
+            "cache", "Consultas aos caches por resultado", ["cache", "resultado"])
+        self.erros = contador(
+            "erros", "Requisições com erro", ["operacao"])
+        self.bulk = histograma(
+            "ingestao_bulk_segundos", "Duração de cada lote _bulk", [])
+        self.documentos = contador(
+            "ingestao_documentos", "Documentos enviados na ingestão", ["resultado"])
+
+    @contextmanager
+    def medir_encode(self, origem):
+        inicio = time.perf_counter()
+        yield
+        self.observar_encode(origem, time.perf_counter() - inicio)
+
+    def observar_encode(self, origem, duracao):
+        self.encode.labels(origem).observe(duracao)
+
+    def observar_busca(self, operacao, duracao, response=None):
+        """Registra uma requisição de busca já concluída
+
+        Deve ser chamado na mesma thread da requisição, logo depois dela,
+        para atribuir o tempo de parse à operação certa.
+        """
+        parse = consumir_tempo_parse()
+        self.requisicao.labels(operacao).observe(duracao)
+        self.parse.labels(operacao).observe(parse)
+        if response is None:
+            return
+        if "took" in response:
+            self.took.labels(operacao).observe(response["took"] / 1000)
+        hits = response.get("hits", {}).get("hits")
+        if hits is not None:
+            self.hits.labels(operacao).observe(len(hits))
+
+    def observar_msearch(self, operacao, duracao, response):
+        """Registra um _msearch: duração e parse do lote, took e hits de cada item"""
+        self.observar_busca(operacao, duracao)
+        for item in response["responses"]:
+            if "error" in item:
+                self.erros.labels(operacao).inc()
+                continue
+            self.took.labels(operacao).observe(item.get("took", 0) / 1000)
+            self.hits.labels(operacao).observe(len(item.get("hits", {}).get("hits", [])))
+
+    def observar_erro(self, operacao):
+        consumir_tempo_parse()
+        self.erros.labels(operacao).inc()
+
+    def observar_cache(self, cache, acerto):
+        self.cache.labels(cache, "acerto" if acerto else "falta").inc()
+
+    def observar_bulk(self, duracao, indexados, falhas):
+        self.bulk.observe(duracao)
+        self.documentos.labels("indexado").inc(indexados)
+        self.documentos.labels("falha").inc(falhas)
+
+
+class MetricasNulas:
+    """Mesma interface de Metricas sem registrar nada (métricas desativadas)"""
+
+    @contextmanager
+    def medir_encode(self, origem):
+        yield
+
+    def observar_encode(self, origem, duracao):
+        pass
+
+    def observar_busca(self, operacao, duracao, response=None):
+        pass
+
+    def observar_msearch(self, operacao, duracao, response):
+        pass
+
+    def observar_erro(self, operacao):
+        pass
+
+    def observar_cache(self, cache, acerto):
+        pass
+
+    def observar_bulk(self, duracao, indexados, falhas):
+        pass
+
+
+METRICAS_NULAS = MetricasNulas()
+
+_padrao = None
+_lock = threading.Lock()
+
+
+def metricas_padrao():
+    """Métricas no registro global do prometheus_client (criadas uma única vez)
+
+    Sem o prometheus_client instalado, retorna METRICAS_NULAS.
+    """
+    global _padrao
+    if Histogram is None:
+        logger.warning("prometheus_client não instalado: métricas desativadas")
+        return METRICAS_NULAS
+    with _lock:
+        if _padrao is None:
+            _padrao = Metricas()
+        return _padrao
+
+
+def iniciar_servidor_metricas(porta=8000, endereco="0.0.0.0"):
+    """Expõe o registro global em http://<endereco>:<porta>/metrics"""
+    if start_http_server is None:
+        logger.warning("prometheus_client não instalado: /metrics não será exposto")
+        return False
+    start_http_server(porta, addr=endereco)
+    logger.info(f"Métricas disponíveis em http://{endereco}:{porta}/metrics")
+    return True
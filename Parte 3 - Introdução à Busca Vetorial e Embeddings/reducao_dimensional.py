@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Redução Dimensional (PCA) dos Embeddings
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+import numpy as np
+import argparse
+import hashlib
+import logging
+import os
+
+from knn_exato import normalizar, topk_em_blocos
+
+logger = logging.getLogger(__name__)
+
+
+class ProjecaoPCA:
+    """Projeção linear aprendida com PCA sobre uma amostra de embeddings
+
+    `aplicar` centraliza os vetores e projeta nos `dims` componentes de maior
+    variância. A mesma projeção precisa ser usada na ingestão e nas consultas;
+    a `assinatura` (hash dos parâmetros) identifica a projeção no _meta do
+    índice.
+    """
+
+    def __init__(self, media, componentes, variancia_explicada):
+        self.media = np.asarray(media, dtype=np.float32)
+        # (dims originais, dims reduzidas): aplicar é um único matmul
+        self.componentes = np.ascontiguousarray(componentes, dtype=np.float32)
+        self.variancia_explicada = np.asarray(variancia_explicada, dtype=np.float32)
+
+    @property
+    def dims_entrada(self):
+        return self.componentes.shape[0]
+
+    @property
+    def dims(self):
+        return self.componentes.shape[1]
+
+    @property
+    def assinatura(self):
+        dados = self.media.tobytes() + self.componentes.tobytes()
+        return hashlib.blake2b(dados, digest_size=8).hexdigest()
+
+    @classmethod
+    def ajustar(cls, amostra, dims):
+        """Ajusta a PCA com SVD da amostra centralizada"""
+        amostra = np.asarray(amostra, dtype=np.float32)
+        if dims > min(amostra.shape):
+            raise ValueError(
+                f"dims={dims} maior que o permitido pela amostra {amostra.shape}")
+        media = amostra.mean(axis=0)
+        _, valores, vt = np.linalg.svd(amostra - media, full_matrices=False)
+        variancia = valores ** 2
+        return cls(media, vt[:dims].T, variancia[:dims] / variancia.sum())
+
+    def aplicar(self, vetores):
+        """Projeta um vetor (dims_entrada,) ou uma matriz (n, dims_entrada)"""
+        vetores = np.asarray(vetores, dtype=np.float32)
+        return (vetores - self.media) @ self.componentes
+
+    def salvar(self, caminho):
+        np.savez(caminho, media=self.media, componentes=self.componentes,
+                 variancia_explicada=self.variancia_explicada)
+        logger.info(
+            f"Projeção {self.dims_entrada}->{self.dims} salva em '{caminho}' "
+            f"({self.variancia_explicada.sum():.1%} da variância)")
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            return cls(dados["media"], dados["componentes"],
+                       dados["variancia_explicada"])
+
+    def meta(self, caminho):
+        """Registro da projeção no _meta do índice"""
+        return {
+            "tipo": "pca",
+            "arquivo": os.path.abspath(caminho),
+            "dims_entrada": self.dims_entrada,
+            "dims": self.dims,
+            "assinatura": self.assinatura
+        }
+
+
+def projecao_do_meta(meta, caminho=None):
+    """Carrega a projeção registrada no _meta do índice (None se não houver)
+
+    `caminho` substitui o arquivo registrado (ex.: índice criado em outra
+    máquina); a assinatura é conferida em qualquer caso.
+    """
+    reducao = (meta or {}).get("reducao")
+    if not reducao:
+        return None
+
+    projecao = ProjecaoPCA.carregar(caminho or reducao["arquivo"])
+    if projecao.assinatura != reducao["assinatura"]:
+        raise ValueError(
+            f"A projeção em '{caminho or reducao['arquivo']}' não é a usada na "
+            f"indexação (assinatura {projecao.assinatura}, esperado "
+            f"{reducao['assinatura']})")
+    return projecao
+
+
+def recall_reducao(vetores, projecao, n_consultas=200, k=10, seed=42):
+    """Recall@k da busca exata nos vetores reduzidos contra os originais
+
+    As consultas são linhas sorteadas da própria base; o documento da
+    consulta é descartado das duas listas de vizinhos.
+    """
+    vetores = np.asarray(vetores, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    linhas = rng.choice(len(vetores), size=min(n_consultas, len(vetores)), replace=False)
+
+    def vizinhos(base, consultas):
+        base = normalizar(base)
+        blocos = ((i, base[i:i + 16384]) for i in range(0, len(base), 16384))
+        indices, _ = topk_em_blocos(normalizar(consultas), blocos, k + 1)
+        return [[j for j in linha if j != origem][:k]
+                for linha, origem in zip(indices, linhas)]
+
+    exatos = vizinhos(vetores, vetores[linhas])
+    reduzidos = projecao.aplicar(vetores)
+    aproximados = vizinhos(reduzidos, reduzidos[linhas])
+    return float(np.mean([len(set(e) & set(a)) / k
+                          for e, a in zip(exatos, aproximados)]))
+
+
+def avaliar_dimensoes(vetores, dimensoes, amostra=20000, n_consultas=200, k=10, seed=42):
+    """Ajusta uma PCA por dimensão alvo e mede recall@k e variância explicada"""
+    rng = np.random.default_rng(seed)
+    linhas = np.sort(rng.choice(len(vetores), size=min(amostra, len(vetores)),
+                                replace=False))
+    treino = np.asarray(vetores[linhas], dtype=np.float32)
+
+    resultados = []
+    for dims in dimensoes:
+        projecao = ProjecaoPCA.ajustar(treino, dims)
+        recall = recall_reducao(vetores, projecao, n_consultas, k, seed)
+        resultados.append({
+            "dims": dims,
+            "variancia_explicada": float(projecao.variancia_explicada.sum()),
+            "recall": recall,
+            "reducao_memoria": projecao.dims_entrada / dims
+        })
+        logger.info(
+            f"dims={dims}: recall@{k} {recall:.3f}, variância "
+            f"{resultados[-1]['variancia_explicada']:.1%}")
+    return resultados
+
+
+def carregar_vetores(exportacao, campo):
+    from exportar_vetores import carregar_exportacao
+
+    _, vetores = carregar_exportacao(exportacao)
+    matriz = vetores[campo]
+    return matriz[~np.isnan(matriz).any(axis=1)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Ajusta e avalia a redução dimensional dos embeddings")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    for nome, ajuda in (("ajustar", "Ajusta a PCA e salva a projeção (.npz)"),
+                        ("avaliar", "Mede recall@k e variância para várias dimensões")):
+        sub = subparsers.add_parser(nome, help=ajuda)
+        sub.add_argument("--exportacao", required=True,
+                         help="Diretório gerado por exportar_vetores.py")
+        sub.add_argument("--campo", default="conteudo_embedding")
+        sub.add_argument("--amostra", type=int, default=20000,
+                         help="Vetores usados no ajuste (padrão 20000)")
+        sub.add_argument("--seed", type=int, default=42)
+
+    ajustar = subparsers.choices["ajustar"]
+    ajustar.add_argument("--dims", type=int, required=True)
+    ajustar.add_argument("--saida", help="Arquivo .npz (padrão pca_<dims>.npz)")
+
+    avaliar = subparsers.choices["avaliar"]
+    avaliar.add_argument("--dims", type=int, nargs="+", default=[32, 64, 128, 192])
+    avaliar.add_argument("--consultas", type=int, default=200)
+    avaliar.add_argument("--k", type=int, default=10)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    vetores = carregar_vetores(args.exportacao, args.campo)
+    logger.info(f"{len(vetores)} vetores de {vetores.shape[1]} dimensões carregados")
+
+    if args.comando == "ajustar":
+        rng = np.random.default_rng(args.seed)
+        linhas = np.sort(rng.choice(len(vetores), size=min(args.amostra, len(vetores)),
+                                    replace=False))
+        projecao = ProjecaoPCA.ajustar(vetores[linhas], args.dims)
+        projecao.salvar(args.saida or f"pca_{args.dims}.npz")
+        return
+
+    resultados = avaliar_dimensoes(vetores, args.dims, args.amostra,
+                                   args.consultas, args.k, args.seed)
+    print(f"\n{'dims':>6}{'recall@' + str(args.k):>12}{'variância':>12}{'memória':>10}")
+    for r in resultados:
+        print(f"{r['dims']:>6}{r['recall']:>12.3f}{r['variancia_explicada']:>12.1%}"
+              f"{r['reducao_memoria']:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Reindexação Incremental por Hash de Conteúdo e Troca Atômica de Alias
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import NotFoundError, helpers
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+
+from mapeamento import CAMPO_HASH, CAMPO_ROTEAMENTO
+
+logger = logging.getLogger(__name__)
+
+
+def hash_documento(documento):
+    """Hash dos campos do documento (sem vetores): muda se qualquer campo mudar"""
+    dados = json.dumps({c: v for c, v in documento.items() if c != CAMPO_HASH},
+                       sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(dados.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def com_hash(documentos):
+    """Acrescenta o hash a cada documento (posição, id, documento) da carga"""
+    for posicao, doc_id, documento in documentos:
+        documento[CAMPO_HASH] = hash_documento(documento)
+        yield posicao, doc_id, documento
+
+
+def ler_hashes(es, indice):
+    """Lê {id: (hash, routing)} de todos os documentos do índice
+
+    Só o doc value do hash trafega (nada do _source). Documentos indexados
+    antes do campo de hash existir voltam com hash None e são tratados
+    como alterados.
+    """
+    hashes = {}
+    try:
+        for hit in helpers.scan(es, index=indice, size=5000, query={
+                "_source": False, "docvalue_fields": [CAMPO_HASH]}):
+            valores = hit.get("fields", {}).get(CAMPO_HASH)
+            hashes[hit["_id"]] = (valores[0] if valores else None, hit.get("_routing"))
+    except NotFoundError:
+        pass
+    return hashes
+
+
+class DetectorAlteracoes:
+    """Deixa passar só os documentos novos ou alterados desde a última carga
+
+    `filtrar` compara o hash de cada documento do corpus com o hash
+    indexado (ler_hashes). Documentos iguais são descartados antes do
+    encode. Ao fim da leitura, ids indexados que não apareceram no corpus
+    são os removidos. O corpus precisa ser lido inteiro (sem checkpoint),
+    senão documentos não lidos seriam considerados removidos.
+    """
+
+    def __init__(self, hashes, roteamento=False):
+        self.hashes = hashes
+        self.roteamento = roteamento
+
+        self.novos = 0
+        self.inalterados = 0
+        self.alterados = []
+        # Cópias antigas a apagar: (id, routing)
+        self.obsoletos = []
+        self._vistos = set()
+
+    def filtrar(self, documentos):
+        for posicao, doc_id, documento in documentos:
+            chave = str(doc_id)
+            self._vistos.add(chave)
+            documento[CAMPO_HASH] = hash_documento(documento)
+
+            anterior = self.hashes.get(chave)
+            if anterior is None:
+                self.novos += 1
+            elif anterior[0] == documento[CAMPO_HASH]:
+                self.inalterados += 1
+                continue
+            else:
+                self.alterados.append(chave)
+                # Em índice roteado, mudar a categoria muda o shard: a versão
+                # nova não sobrescreve a antiga, que precisa ser apagada
+                if self.roteamento and anterior[1] != documento.get(CAMPO_ROTEAMENTO):
+                    self.obsoletos.append((chave, anterior[1]))
+            yield posicao, doc_id, documento
+
+    def removidos(self):
+        """(id, routing) dos documentos indexados que não estão mais no corpus"""
+        return [(doc_id, routing) for doc_id, (_, routing) in self.hashes.items()
+                if doc_id not in self._vistos]
+
+    def resumo(self):
+        return {
+            "novos": self.novos,
+            "alterados": len(self.alterados),
+            "inalterados": self.inalterados,
+            "removidos": len(self.removidos())
+        }
+
+
+def remover_documentos(es, indice, documentos):
+    """Apaga (id, routing) pela API _bulk; retorna o número de remoções"""
+    acoes = ({"_op_type": "delete", "_index": indice, "_id": doc_id,
+              **({"_routing": routing} if routing else {})}
+             for doc_id, routing in documentos)
+    sucesso, erros = helpers.bulk(es, acoes, raise_on_error=False, stats_only=True)
+    if erros:
+        logger.warning(f"{erros} remoções falharam (documentos já ausentes?)")
+    return sucesso
+
+
+def nome_versionado(alias):
+    """Nome de um índice novo para o alias, ex.: artigos_vetorial-20240115-103000"""
+    return f"{alias}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}"
+
+
+def indices_do_alias(es, alias):
+    """Índices concretos por trás de `alias` ([alias] se for um índice, [] se não existir)"""
+    if es.indices.exists_alias(name=alias):
+        return sorted(es.indices.get_alias(name=alias))
+    if es.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def e_indice_concreto(es, nome):
+    """True se `nome` ainda é um índice, e não um alias (cargas anteriores à troca)"""
+    return indices_do_alias(es, nome) == [nome]
+
+
+def trocar_alias(es, alias, novo, manter_anterior=False):
+    """Aponta `alias` para `novo` em uma única operação atômica
+
+    As buscas passam do índice antigo para o novo sem nenhum instante sem
+    índice. Se `alias` ainda for um índice concreto (cargas anteriores a
+    este modo), ele é apagado na mesma operação, que é o único jeito de
+    criar um alias com o mesmo nome. Os índices antigos são apagados, a
+    menos que `manter_anterior` seja True (para rollback); nesse caso, um
+    índice concreto com o nome do alias não tem como ser mantido e a troca
+    é recusada com ValueError antes de qualquer mudança.
+    """
+    antigos = [indice for indice in indices_do_alias(es, alias) if indice != novo]
+    if manter_anterior and alias in antigos:
+        raise ValueError(
+            f"'{alias}' é um índice concreto e seria apagado na troca: não há "
+            f"como mantê-lo para rollback")
+    acoes = [{"add": {"index": novo, "alias": alias}}]
+    for indice in antigos:
+        if indice == alias:
+            acoes.insert(0, {"remove_index": {"index": indice}})
+        else:
+            acoes.insert(0, {"remove": {"index": indice, "alias": alias}})
+    es.indices.update_aliases(actions=acoes)
+    logger.info(f"Alias '{alias}' agora aponta para '{novo}'")
+
+    for indice in antigos:
+        if indice == alias:
+            continue
+        if manter_anterior:
+            logger.info(f"Índice anterior '{indice}' mantido para rollback")
+        else:
+            es.indices.delete(index=indice)
+            logger.info(f"Índice anterior '{indice}' apagado")
+    return antigos
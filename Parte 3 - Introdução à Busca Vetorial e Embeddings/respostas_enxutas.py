@@ -0,0 +1,57 @@
+"""
+Respostas Enxutas: filter_path e Serialização JSON Rápida
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+try:
+    # Só existe no elastic-transport quando o orjson está instalado
+    from elastic_transport import OrjsonSerializer
+except ImportError:
+    OrjsonSerializer = None
+
+# Partes da resposta de _search que as buscas realmente leem
+FILTRO_BUSCA = [
+    "took",
+    "hits.total",
+    "hits.max_score",
+    "hits.hits._id",
+    "hits.hits._score",
+    "hits.hits._source"
+]
+# O mesmo para cada item do _msearch, mais o erro de sub-consultas com falha
+FILTRO_MSEARCH = [f"responses.{filtro}" for filtro in FILTRO_BUSCA] + [
+    "responses.error",
+    "responses.status"
+]
+
+
+def serializadores_rapidos():
+    """Serializadores JSON com orjson para Elasticsearch(serializers=...)
+
+    O orjson gera e lê JSON várias vezes mais rápido que o módulo json,
+    principalmente para listas longas de floats como os vetores. Sem o
+    orjson instalado, retorna {} e o cliente usa o serializador padrão.
+    """
+    if OrjsonSerializer is None:
+        return {}
+    serializador = OrjsonSerializer()
+    # O Elasticsearch 8 responde com o mimetype de compatibilidade
+    return {
+        "application/json": serializador,
+        "application/vnd.elasticsearch+json": serializador
+    }
+
+
+def opcoes_cliente(respostas_enxutas):
+    """Argumentos extras do construtor do cliente no modo enxuto"""
+    if not respostas_enxutas:
+        return {}
+    serializadores = serializadores_rapidos()
+    return {"serializers": serializadores} if serializadores else {}
+
+
+def garantir_hits(response):
+    """Recoloca `hits.hits` vazio, que o filter_path remove quando não há hits"""
+    corpo = getattr(response, "body", response)
+    corpo.setdefault("hits", {}).setdefault("hits", [])
+    return response
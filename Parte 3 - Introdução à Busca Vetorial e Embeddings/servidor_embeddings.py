@@ -0,0 +1,148 @@
+"""
+Servidor Local de Embeddings com Micro-Lotes
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from concurrent.futures import Future
+import numpy as np
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_PARAR = object()
+
+
+class ServidorEmbeddings:
+    """Agrupa pedidos de encode simultâneos em um único forward do modelo
+
+    Os pedidos entram em uma fila; uma thread dedicada coleta o que chegar
+    em até `janela_ms` (ou até `max_lote` textos), chama o modelo uma única
+    vez e devolve a cada chamador o seu vetor. Expõe `encode` com a mesma
+    interface do SentenceTransformer, podendo substituí-lo diretamente.
+    """
+
+    def __init__(self, model, janela_ms=5.0, max_lote=64, max_fila=10000):
+        self.model = model
+        self.janela = janela_ms / 1000.0
+        self.max_lote = max_lote
+
+        self.lotes = 0
+        self.itens = 0
+        self.maior_fila = 0
+        # Histograma de tamanhos de lote em faixas de potência de 2 (1, 2, 4, ...)
+        self.histograma_lotes = {}
+
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._lock = threading.Lock()
+        # Serializa a entrada na fila com o parar(): nenhum pedido entra
+        # depois do sinal de parada
+        self._lock_entrada = threading.Lock()
+        self._parado = False
+        self._thread = threading.Thread(
+            target=self._laco, name="servidor-embeddings", daemon=True)
+        self._thread.start()
+
+    def encode(self, textos, **_):
+        """Gera embeddings (um texto -> vetor, lista -> matriz)"""
+        unico = isinstance(textos, str)
+        lista = [textos] if unico else list(textos)
+
+        futuros = []
+        with self._lock_entrada:
+            if self._parado:
+                raise RuntimeError("ServidorEmbeddings já foi parado")
+            for texto in lista:
+                futuro = Future()
+                self._fila.put((texto, futuro))
+                futuros.append(futuro)
+
+        with self._lock:
+            self.maior_fila = max(self.maior_fila, self._fila.qsize())
+
+        vetores = [futuro.result() for futuro in futuros]
+        return vetores[0] if unico else np.stack(vetores)
+
+    def _laco(self):
+        while True:
+            item = self._fila.get()
+            if item is _PARAR:
+                return
+
+            lote = [item]
+            parar = False
+            prazo = time.monotonic() + self.janela
+            while len(lote) < self.max_lote:
+                restante = prazo - time.monotonic()
+                try:
+                    item = (self._fila.get(timeout=restante) if restante > 0
+                            else self._fila.get_nowait())
+                except queue.Empty:
+                    break
+                if item is _PARAR:
+                    parar = True
+                    break
+                lote.append(item)
+
+            self._processar(lote)
+            if parar:
+                return
+
+    def _processar(self, lote):
+        textos = [texto for texto, _ in lote]
+        try:
+            vetores = self.model.encode(
+                textos, batch_size=len(textos), show_progress_bar=False)
+        except Exception as e:
+            logger.error(f"Erro no encode de um lote de {len(textos)} textos: {e}")
+            for _, futuro in lote:
+                futuro.set_exception(e)
+            return
+
+        for (_, futuro), vetor in zip(lote, vetores):
+            futuro.set_result(vetor)
+
+        faixa = 1 << (len(lote) - 1).bit_length()
+        with self._lock:
+            self.lotes += 1
+            self.itens += len(lote)
+            self.histograma_lotes[faixa] = self.histograma_lotes.get(faixa, 0) + 1
+
+    def estatisticas(self):
+        """Profundidade da fila e distribuição dos tamanhos de lote"""
+        with self._lock:
+            return {
+                "profundidade_fila": self._fila.qsize(),
+                "maior_fila": self.maior_fila,
+                "lotes": self.lotes,
+                "itens": self.itens,
+                "media_lote": self.itens / self.lotes if self.lotes else 0.0,
+                "histograma_lotes": dict(sorted(self.histograma_lotes.items()))
+            }
+
+    def parar(self):
+        """Processa os pedidos pendentes e encerra a thread do servidor
+
+        Pedidos que ainda estiverem na fila quando a thread terminar são
+        processados aqui mesmo; chamadas a `encode` depois de `parar` falham
+        com RuntimeError.
+        """
+        with self._lock_entrada:
+            if self._parado:
+                return
+            self._parado = True
+            self._fila.put(_PARAR)
+        self._thread.join()
+
+        restantes = []
+        while True:
+            try:
+                item = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _PARAR:
+                restantes.append(item)
+        for i in range(0, len(restantes), self.max_lote):
+            self._processar(restantes[i:i + self.max_lote])
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Tabela de Vizinhos Pré-calculados para Recomendações
+Parte 3: Introdução à Busca Vetorial e Embeddings
+"""
+
+from elasticsearch import Elasticsearch, NotFoundError, helpers
+from datetime import datetime, timezone
+import numpy as np
+import argparse
+import logging
+import sys
+import time
+
+from ingestao import INDICE
+from knn_exato import KnnExato
+from mapeamento import campo_precisao_total, meta_do_indice
+
+logger = logging.getLogger(__name__)
+
+INDICE_VIZINHOS = "artigos_vizinhos"
+# Campos de exibição de cada vizinho, guardados junto dos ids na tabela; o
+# kNN de recomendação da BuscaVetorial devolve os mesmos campos
+CAMPOS_EXIBICAO = ("titulo", "categoria", "data_publicacao")
+
+
+def mapeamento_vizinhos(n_vizinhos, campo):
+    """Índice lateral só para leitura por id: nada além da data é indexado"""
+    return {
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 0
+        },
+        "mappings": {
+            "_meta": {"n_vizinhos": n_vizinhos, "campo": campo},
+            "dynamic": False,
+            "properties": {
+                "atualizado_em": {"type": "date"}
+            }
+        }
+    }
+
+
+def vizinhos_da_entrada(entrada, k):
+    """Hits (_id, _score, _source) dos k primeiros vizinhos de uma entrada da tabela
+
+    None se a entrada é de uma tabela anterior aos campos de exibição
+    (sem `fontes`): quem chama segue pelo kNN até a tabela ser reconstruída.
+    """
+    if "fontes" not in entrada:
+        return None
+    return [{"_id": i, "_score": s, "_source": fonte}
+            for i, s, fonte in zip(entrada["ids"][:k], entrada["scores"][:k],
+                                   entrada["fontes"][:k])]
+
+
+def score_knn(similaridades):
+    """Cosseno na escala do kNN com similarity "cosine": (1 + cos) / 2"""
+    return (1.0 + np.asarray(similaridades)) / 2.0
+
+
+class TabelaVizinhos:
+    """Top-N vizinhos de cada documento, calculados offline com kNN exato
+
+    Cada documento de `indice_vizinhos` tem o mesmo _id do artigo e guarda,
+    do mais para o menos similar, os ids (`ids`), os scores (`scores`) e os
+    campos de exibição (`fontes`, ver CAMPOS_EXIBICAO) dos seus vizinhos,
+    para que uma recomendação seja uma única leitura por id. A tabela fica
+    em um índice lateral para que atualizá-la não reescreva os documentos
+    do índice principal (e o seu grafo HNSW).
+    """
+
+    def __init__(self, es, indice=INDICE, indice_vizinhos=INDICE_VIZINHOS,
+                 n_vizinhos=20, campo="conteudo_embedding", tamanho_lote=1024):
+        self.es = es
+        self.indice = indice
+        self.indice_vizinhos = indice_vizinhos
+        self.n_vizinhos = n_vizinhos
+        self.campo = campo
+        self.tamanho_lote = tamanho_lote
+
+    def carregar_vetores(self):
+        """Lê os vetores (float32, mesmo no modo "byte") e os campos de exibição"""
+        quantizacao = meta_do_indice(self.es, self.indice).get("quantizacao")
+        return KnnExato.carregar_do_indice(
+            self.es, self.indice, campo_precisao_total(self.campo, quantizacao),
+            campos_fonte=CAMPOS_EXIBICAO)
+
+    def _fontes(self, knn):
+        """{id: campos de exibição}, do KnnExato ou, se ele não os tiver
+        (vetores de uma exportação), de uma leitura do índice sem vetores"""
+        if knn.fontes:
+            return dict(zip(knn.ids, knn.fontes))
+        return {hit["_id"]: hit["_source"] for hit in helpers.scan(
+            self.es, index=self.indice, size=1000,
+            query={"_source": list(CAMPOS_EXIBICAO)})}
+
+    def _vizinhos_de(self, knn, linhas):
+        """Top-N de cada linha da matriz, sem o próprio documento"""
+        indices, sims = knn.buscar_lote(knn.matriz[linhas], self.n_vizinhos + 1)
+        tabela = {}
+        for linha, idx, sim in zip(linhas, indices, sims):
+            manter = idx != linha
+            tabela[knn.ids[linha]] = (
+                [knn.ids[i] for i in idx[manter][:self.n_vizinhos]],
+                score_knn(sim[manter][:self.n_vizinhos]).tolist())
+        return tabela
+
+    def _acoes(self, tabela, fontes):
+        agora = datetime.now(timezone.utc).isoformat()
+        for doc_id, (ids, scores) in tabela.items():
+            yield {
+                "_index": self.indice_vizinhos,
+                "_id": doc_id,
+                "_source": {
+                    "ids": ids,
+                    "scores": [round(s, 5) for s in scores],
+                    "fontes": [fontes.get(i, {}) for i in ids],
+                    "atualizado_em": agora
+                }
+            }
+
+    def _gravar(self, tabela, fontes):
+        sucesso, _ = helpers.bulk(self.es, self._acoes(tabela, fontes), chunk_size=1000)
+        return sucesso
+
+    def construir(self, knn=None):
+        """Recria a tabela inteira a partir dos vetores do índice principal"""
+        knn = knn or self.carregar_vetores()
+        fontes = self._fontes(knn)
+        inicio = time.time()
+
+        if self.es.indices.exists(index=self.indice_vizinhos):
+            self.es.indices.delete(index=self.indice_vizinhos)
+        corpo = mapeamento_vizinhos(self.n_vizinhos, self.campo)
+        self.es.indices.create(index=self.indice_vizinhos,
+                               settings=corpo["settings"],
+                               mappings=corpo["mappings"])
+
+        gravados = 0
+        for inicio_lote in range(0, len(knn.ids), self.tamanho_lote):
+            linhas = np.arange(inicio_lote,
+                               min(inicio_lote + self.tamanho_lote, len(knn.ids)))
+            gravados += self._gravar(self._vizinhos_de(knn, linhas), fontes)
+            logger.info(f"Vizinhos calculados para {gravados}/{len(knn.ids)} documentos")
+
+        self.es.indices.refresh(index=self.indice_vizinhos)
+        logger.info(
+            f"Tabela '{self.indice_vizinhos}' construída: {gravados} documentos, "
+            f"{self.n_vizinhos} vizinhos cada, em {time.time() - inicio:.1f}s")
+        return gravados
+
+    def _ler_tabela(self):
+        tabela = {}
+        for hit in helpers.scan(self.es, index=self.indice_vizinhos, size=1000,
+                                query={"_source": ["ids", "scores"]}):
+            tabela[hit["_id"]] = (hit["_source"]["ids"], hit["_source"]["scores"])
+        return tabela
+
+    def atualizar(self, knn=None, modificados=()):
+        """Atualiza a tabela só com o efeito dos documentos novos e removidos
+
+        Documentos novos recebem o seu top-N completo. Para os existentes,
+        basta comparar com os novos: um documento novo só entra na lista se
+        superar o pior vizinho atual (ou se a lista estiver incompleta).
+        Vizinhos removidos do índice saem das listas; essas listas só voltam
+        a ser exatas na próxima construção completa. Os ids em `modificados`
+        (documentos reindexados com outro conteúdo, ver reindexacao.py) saem
+        das listas como os removidos e voltam a entrar como novos, com os
+        campos de exibição atuais.
+        """
+        if not self.es.indices.exists(index=self.indice_vizinhos):
+            return self.construir(knn)
+
+        knn = knn or self.carregar_vetores()
+        tabela = self._ler_tabela()
+        atuais = set(knn.ids)
+        removidos = set(tabela) - atuais
+        descartados = removidos | (set(map(str, modificados)) & set(tabela))
+        for doc_id in descartados:
+            del tabela[doc_id]
+        novos = np.array([i for i, doc_id in enumerate(knn.ids) if doc_id not in tabela],
+                         dtype=np.int64)
+        if not len(novos) and not removidos:
+            logger.info("Tabela de vizinhos já está atualizada")
+            return 0
+
+        alterados = {}
+        if descartados:
+            for doc_id, (ids, scores) in tabela.items():
+                if descartados.intersection(ids):
+                    pares = [(i, s) for i, s in zip(ids, scores) if i not in descartados]
+                    tabela[doc_id] = alterados[doc_id] = (
+                        [i for i, _ in pares], [s for _, s in pares])
+
+        if len(novos):
+            alterados.update(self._incluir_novos(knn, tabela, novos))
+            for inicio_lote in range(0, len(novos), self.tamanho_lote):
+                alterados.update(self._vizinhos_de(
+                    knn, novos[inicio_lote:inicio_lote + self.tamanho_lote]))
+
+        if removidos:
+            helpers.bulk(self.es, ({"_op_type": "delete", "_index": self.indice_vizinhos,
+                                    "_id": doc_id} for doc_id in removidos),
+                         raise_on_error=False)
+        gravados = self._gravar(alterados, self._fontes(knn))
+        self.es.indices.refresh(index=self.indice_vizinhos)
+        logger.info(
+            f"Tabela de vizinhos atualizada: {len(novos)} novos, {len(removidos)} "
+            f"removidos, {gravados} listas regravadas")
+        return gravados
+
+    def _incluir_novos(self, knn, tabela, novos):
+        """Listas dos documentos existentes que passam a incluir algum novo"""
+        # Cosseno mínimo para entrar na lista de cada linha (-inf se incompleta)
+        limiares = np.full(len(knn.ids), -np.inf, dtype=np.float32)
+        existentes = np.zeros(len(knn.ids), dtype=bool)
+        for linha, doc_id in enumerate(knn.ids):
+            entrada = tabela.get(doc_id)
+            if entrada is not None:
+                existentes[linha] = True
+                if len(entrada[0]) >= self.n_vizinhos:
+                    limiares[linha] = 2.0 * entrada[1][-1] - 1.0
+
+        alterados = {}
+        for inicio_lote in range(0, len(novos), self.tamanho_lote):
+            lote = novos[inicio_lote:inicio_lote + self.tamanho_lote]
+            ids_lote = [knn.ids[i] for i in lote]
+            matriz_lote = knn.matriz[lote]
+
+            for inicio in range(0, len(knn.matriz), knn.tamanho_bloco):
+                sims = knn.matriz[inicio:inicio + knn.tamanho_bloco] @ matriz_lote.T
+                fim = inicio + len(sims)
+                candidatas = np.flatnonzero(
+                    existentes[inicio:fim] & (sims.max(axis=1) > limiares[inicio:fim]))
+
+                for c in candidatas:
+                    linha = inicio + c
+                    doc_id = knn.ids[linha]
+                    ids, scores = tabela[doc_id]
+                    pares = list(zip(ids, scores)) + [
+                        (novo, float(score_knn(s)))
+                        for novo, s in zip(ids_lote, sims[c]) if s > limiares[linha]]
+                    pares.sort(key=lambda par: par[1], reverse=True)
+                    pares = pares[:self.n_vizinhos]
+                    tabela[doc_id] = alterados[doc_id] = (
+                        [i for i, _ in pares], [s for _, s in pares])
+                    if len(pares) >= self.n_vizinhos:
+                        limiares[linha] = 2.0 * pares[-1][1] - 1.0
+
+        return alterados
+
+    def recomendar(self, doc_id, k=3):
+        """Vizinhos de `doc_id` lidos da tabela (None se o documento não estiver nela)
+
+        Uma única leitura por id: ids, scores e campos de exibição estão na
+        mesma entrada, e nenhum vetor trafega. Documentos removidos do índice
+        continuam nas listas até a próxima atualização da tabela.
+        """
+        try:
+            entrada = self.es.get(index=self.indice_vizinhos, id=doc_id)["_source"]
+        except NotFoundError:
+            return None
+        return vizinhos_da_entrada(entrada, k)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Calcula offline os vizinhos mais próximos de cada documento")
+    parser.add_argument("comando", choices=["construir", "atualizar"],
+                        help="construir: recria a tabela; atualizar: só novos e removidos")
+    parser.add_argument("--indice", default=INDICE)
+    parser.add_argument("--indice-vizinhos", default=INDICE_VIZINHOS)
+    parser.add_argument("--n-vizinhos", type=int, default=20,
+                        help="Vizinhos guardados por documento (padrão 20)")
+    parser.add_argument("--campo", default="conteudo_embedding")
+    parser.add_argument("--tamanho-lote", type=int, default=1024,
+                        help="Documentos por lote de kNN exato (padrão 1024)")
+    parser.add_argument("--exportacao",
+                        help="Lê os vetores de uma exportação (exportar_vetores.py) "
+                             "em vez do índice")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    es = Elasticsearch(['http://localhost:9200'])
+    if not es.ping():
+        logger.error("Não foi possível conectar ao Elasticsearch")
+        sys.exit(1)
+
+    tabela = TabelaVizinhos(es, args.indice, args.indice_vizinhos,
+                            args.n_vizinhos, args.campo, args.tamanho_lote)
+    knn = None
+    if args.exportacao:
+        knn = KnnExato.carregar_exportacao(args.exportacao, args.campo)
+
+    try:
+        if args.comando == "construir":
+            tabela.construir(knn)
+        else:
+            tabela.atualizar(knn)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# ajuste_hnsw.py
+
+import argparse
+import itertools
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from benchmark_knn import (INDICE_PADRAO, adicionar_argumentos_conexao, conectar,
+                           executar_benchmark, gerar_consultas, ground_truth_local,
+                           preparar_indice, salvar_relatorio)
+
+# ==============================================================================
+# SEÇÃO 1: CONSTRUÇÃO E MEDIÇÃO DE CADA CONFIGURAÇÃO
+# ==============================================================================
+
+def estatisticas_indice(client: Elasticsearch, index_name: str) -> dict:
+    """Número de segmentos e tamanho em disco das cópias primárias."""
+    stats = client.indices.stats(index=index_name, metric=["segments", "store"])
+    primarias = stats["indices"][index_name]["primaries"]
+    return {
+        "segmentos": primarias["segments"]["count"],
+        "disco_bytes": primarias["store"]["size_in_bytes"]
+    }
+
+
+def construir_configuracao(client: Elasticsearch, index_name: str, m: int, ef_construction: int,
+                           n_docs: int, dims: int, seed: int, vetores_base, shards: int) -> dict:
+    """
+    Indexa o corpus com os parâmetros HNSW dados e mede a construção:
+    vazão de indexação, segmentos/tamanho antes e depois do force merge e o
+    tempo do force merge.
+    """
+    preparo = preparar_indice(
+        client, index_name, n_docs, dims, seed, vetores_base,
+        index_options={"type": "hnsw", "m": m, "ef_construction": ef_construction},
+        shards=shards, force_merge=False)
+    antes = estatisticas_indice(client, index_name)
+
+    inicio = time.perf_counter()
+    client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+    client.indices.refresh(index=index_name)
+    tempo_merge = time.perf_counter() - inicio
+    depois = estatisticas_indice(client, index_name)
+
+    return {
+        "m": m,
+        "ef_construction": ef_construction,
+        "tempo_indexacao_s": preparo["tempo_indexacao_s"],
+        "docs_por_s": n_docs / preparo["tempo_indexacao_s"],
+        "tempo_force_merge_s": tempo_merge,
+        "segmentos_antes_merge": antes["segmentos"],
+        "disco_antes_merge_bytes": antes["disco_bytes"],
+        "segmentos": depois["segmentos"],
+        "disco_bytes": depois["disco_bytes"]
+    }
+
+
+# ==============================================================================
+# SEÇÃO 2: FRONTEIRA DE PARETO
+# ==============================================================================
+
+# Objetivos: (campo, +1 para maximizar / -1 para minimizar)
+OBJETIVOS = (
+    ("recall", 1),
+    ("cliente_p95_ms", -1),
+    ("tempo_construcao_s", -1),
+    ("disco_bytes", -1),
+)
+
+
+def domina(a: dict, b: dict) -> bool:
+    """`a` domina `b` se não é pior em nenhum objetivo e é melhor em algum."""
+    melhor_em_algum = False
+    for campo, sentido in OBJETIVOS:
+        diferenca = sentido * (a[campo] - b[campo])
+        if diferenca < 0:
+            return False
+        if diferenca > 0:
+            melhor_em_algum = True
+    return melhor_em_algum
+
+
+def fronteira_pareto(linhas: list) -> list:
+    """Configurações que nenhuma outra domina, ordenadas por recall."""
+    otimas = [l for l in linhas if not any(domina(outra, l) for outra in linhas)]
+    return sorted(otimas, key=lambda l: (-l["recall"], l["cliente_p95_ms"]))
+
+
+def imprimir_tabela(linhas: list, titulo: str) -> None:
+    print(f"\n{titulo}")
+    print(f"{'m':>4}{'ef_c':>6}{'cands':>7}{'recall':>8}{'p50':>8}{'p95':>8}"
+          f"{'docs/s':>9}{'merge s':>9}{'segs':>6}{'disco MB':>10}")
+    for l in linhas:
+        print(f"{l['m']:>4}{l['ef_construction']:>6}{l['num_candidates']:>7}{l['recall']:>8.3f}"
+              f"{l['cliente_p50_ms']:>8.1f}{l['cliente_p95_ms']:>8.1f}{l['docs_por_s']:>9.0f}"
+              f"{l['tempo_force_merge_s']:>9.1f}{l['segmentos_antes_merge']:>6}"
+              f"{l['disco_bytes'] / 2**20:>10.1f}")
+
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Varre m x ef_construction do HNSW e mostra as configurações Pareto-ótimas")
+    adicionar_argumentos_conexao(parser)
+    parser.add_argument("--indice", default=INDICE_PADRAO, help="Prefixo dos índices de teste")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--vetores", help="Arquivo .npy com embeddings reais para usar como corpus")
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--ef-construction", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--consultas", type=int, default=50)
+    parser.add_argument("--aquecimento", type=int, default=2)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--manter-indices", action="store_true",
+                        help="Não apaga os índices de teste ao final")
+    parser.add_argument("--saida", default="relatorio_hnsw.json", help="Relatório (.json ou .csv)")
+    args = parser.parse_args()
+
+    client = conectar(args)
+    versao = client.info()["version"]["number"]
+
+    vetores_base = None
+    if args.vetores:
+        vetores_base = np.load(args.vetores, mmap_mode="r")
+        args.docs = min(args.docs, len(vetores_base))
+        args.dims = vetores_base.shape[1]
+
+    consultas = gerar_consultas(args.consultas, args.dims, args.seed, vetores_base)
+    print("1. Calculando os vizinhos exatos localmente...")
+    ground_truth = ground_truth_local(consultas, args.docs, args.dims, args.seed,
+                                      vetores_base, args.k)
+
+    grade = list(itertools.product(args.m, args.ef_construction))
+    linhas = []
+    for i, (m, ef) in enumerate(grade, 1):
+        index_name = f"{args.indice}-m{m}-ef{ef}"
+        print(f"2.{i}/{len(grade)} m={m}, ef_construction={ef}: indexando {args.docs} vetores...")
+        construcao = construir_configuracao(client, index_name, m, ef, args.docs, args.dims,
+                                            args.seed, vetores_base, args.shards)
+        construcao["tempo_construcao_s"] = (construcao["tempo_indexacao_s"]
+                                            + construcao["tempo_force_merge_s"])
+        print(f"   -> {construcao['docs_por_s']:.0f} docs/s, force merge "
+              f"{construcao['tempo_force_merge_s']:.1f}s, "
+              f"{construcao['disco_bytes'] / 2**20:.1f} MB")
+
+        resultados = executar_benchmark(client, index_name, consultas, [args.k],
+                                        args.num_candidates, args.aquecimento,
+                                        args.repeticoes, verbose=False,
+                                        ground_truth=ground_truth)
+        linhas += [{**construcao, **resultado} for resultado in resultados]
+
+        if not args.manter_indices:
+            client.indices.delete(index=index_name)
+
+    imprimir_tabela(linhas, "TODAS AS CONFIGURAÇÕES")
+    otimas = fronteira_pareto(linhas)
+    imprimir_tabela(otimas, "FRONTEIRA DE PARETO (recall x p95 x tempo de construção x disco)")
+
+    for linha in linhas:
+        linha["pareto"] = any(linha is otima for otima in otimas)
+    salvar_relatorio(linhas, args.saida, {
+        "versao_elasticsearch": versao,
+        "data": datetime.now(timezone.utc).isoformat(),
+        "docs": args.docs,
+        "dims": args.dims,
+        "shards": args.shards,
+        "k": args.k,
+        "consultas": args.consultas
+    })
+
+
+if __name__ == "__main__":
+    main()
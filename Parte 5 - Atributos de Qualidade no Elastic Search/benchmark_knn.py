@@ -0,0 +1,403 @@
+# benchmark_knn.py
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+# Os benchmarks reaproveitam os módulos da Parte 3 (kNN exato, mapeamento)
+# em vez de manter cópias: a pasta entra no sys.path uma única vez, aqui
+PASTA_PARTE_3 = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                             "Parte 3 - Introdução à Busca Vetorial e Embeddings")
+if PASTA_PARTE_3 not in sys.path:
+    sys.path.append(PASTA_PARTE_3)
+
+from knn_exato import normalizar, topk_em_blocos
+from mapeamento import quantizar_byte
+
+# ==============================================================================
+# SEÇÃO 1: PREPARAÇÃO DO CORPUS E DO ÍNDICE DE TESTE
+# ==============================================================================
+
+INDICE_PADRAO = "indice-vetorial-benchmark"
+
+
+def gerar_vetores(n: int, dims: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Gera `n` vetores aleatórios normalizados (float32).
+    Usa distribuição normal, que espalha os vetores de forma uniforme na esfera.
+    """
+    vetores = rng.standard_normal((n, dims)).astype(np.float32)
+    vetores /= np.linalg.norm(vetores, axis=1, keepdims=True)
+    return vetores
+
+
+def gerar_corpus(n_docs: int, dims: int, seed: int, vetores_base=None, lote: int = 1000):
+    """
+    Gera o corpus em lotes de (ids, vetores), sem materializá-lo inteiro em memória.
+    Com `vetores_base` (ex.: embeddings reais exportados em .npy), usa as primeiras linhas.
+    """
+    rng = np.random.default_rng(seed)
+    for inicio in range(0, n_docs, lote):
+        fim = min(inicio + lote, n_docs)
+        if vetores_base is not None:
+            vetores = np.asarray(vetores_base[inicio:fim], dtype=np.float32)
+        else:
+            vetores = gerar_vetores(fim - inicio, dims, rng)
+        yield [str(i) for i in range(inicio, fim)], vetores
+
+
+def gerar_consultas(n: int, dims: int, seed: int, vetores_base=None) -> np.ndarray:
+    """
+    Gera os vetores de consulta. Com um corpus real, sorteia documentos e
+    adiciona um pequeno ruído, imitando consultas próximas aos dados.
+    """
+    rng = np.random.default_rng(seed + 1)
+    if vetores_base is None:
+        return gerar_vetores(n, dims, rng)
+
+    linhas = rng.choice(len(vetores_base), size=n, replace=False)
+    consultas = np.asarray(vetores_base[np.sort(linhas)], dtype=np.float32)
+    consultas += 0.05 * rng.standard_normal(consultas.shape).astype(np.float32)
+    consultas /= np.linalg.norm(consultas, axis=1, keepdims=True)
+    return consultas
+
+
+def mapeamento_vetorial(dims: int, index_options=None, element_type: str = "float",
+                        campo_float: bool = False) -> dict:
+    """
+    Mapeamento do índice de teste. `index_options` permite ajustar o HNSW
+    (ex.: {"type": "hnsw", "m": 16, "ef_construction": 100}). Com
+    `campo_float`, guarda também uma cópia float32 sem HNSW em `vetor_float`,
+    usada para reranquear buscas em índices quantizados.
+    """
+    vetor = {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": "cosine"
+    }
+    if element_type != "float":
+        vetor["element_type"] = element_type
+    if index_options:
+        vetor["index_options"] = index_options
+    propriedades = {"vetor": vetor}
+    if campo_float:
+        propriedades["vetor_float"] = {"type": "dense_vector", "dims": dims, "index": False}
+    return {"properties": propriedades}
+
+
+def preparar_indice(client: Elasticsearch, index_name: str, n_docs: int, dims: int,
+                    seed: int = 42, vetores_base=None, index_options=None,
+                    shards: int = 1, force_merge: bool = True, element_type: str = "float",
+                    campo_float: bool = False) -> dict:
+    """
+    Recria o índice de teste e indexa o corpus via _bulk.
+    Retorna o tempo de indexação e de force merge (em segundos).
+    """
+    if client.indices.exists(index=index_name):
+        client.indices.delete(index=index_name)
+
+    client.indices.create(
+        index=index_name,
+        settings={
+            "number_of_shards": shards,
+            "number_of_replicas": 0,
+            "refresh_interval": "-1"
+        },
+        mappings=mapeamento_vetorial(dims, index_options, element_type, campo_float)
+    )
+
+    inicio = time.perf_counter()
+    for ids, vetores in gerar_corpus(n_docs, dims, seed, vetores_base):
+        indexados = quantizar_byte(vetores) if element_type == "byte" else vetores
+        acoes = []
+        for doc_id, vetor, original in zip(ids, indexados, vetores):
+            fonte = {"vetor": vetor.tolist()}
+            if campo_float:
+                fonte["vetor_float"] = original.tolist()
+            acoes.append({"_index": index_name, "_id": doc_id, "_source": fonte})
+        helpers.bulk(client, acoes, chunk_size=1000)
+    client.indices.refresh(index=index_name)
+    tempo_indexacao = time.perf_counter() - inicio
+
+    tempo_merge = 0.0
+    if force_merge:
+        # Um único segmento deixa as medições de latência estáveis entre rodadas
+        inicio = time.perf_counter()
+        client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+        client.indices.refresh(index=index_name)
+        tempo_merge = time.perf_counter() - inicio
+
+    return {"tempo_indexacao_s": tempo_indexacao, "tempo_force_merge_s": tempo_merge}
+
+
+# ==============================================================================
+# SEÇÃO 2: CONSULTAS E MEDIÇÕES
+# ==============================================================================
+
+def busca_ann(client: Elasticsearch, index_name: str, query_vector, k: int, num_candidates: int) -> dict:
+    """Busca aproximada (HNSW) com a API knn."""
+    return client.search(
+        index=index_name,
+        knn={
+            "field": "vetor",
+            "query_vector": query_vector,
+            "k": k,
+            "num_candidates": num_candidates
+        },
+        size=k,
+        source=False
+    )
+
+
+def busca_exata(client: Elasticsearch, index_name: str, query_vector, k: int) -> dict:
+    """Busca exata (força bruta) com script_score e cosineSimilarity."""
+    return client.search(
+        index=index_name,
+        query={
+            "script_score": {
+                "query": {"match_all": {}},
+                "script": {
+                    "source": "cosineSimilarity(params.query_vector, 'vetor') + 1.0",
+                    "params": {"query_vector": query_vector}
+                }
+            }
+        },
+        size=k,
+        source=False
+    )
+
+
+def ground_truth_local(consultas: np.ndarray, n_docs: int, dims: int, seed: int,
+                       vetores_base=None, k: int = 10) -> list:
+    """
+    Vizinhos exatos calculados localmente, sem carga no cluster, com o kNN
+    exato da Parte 3 (knn_exato.topk_em_blocos) como oráculo de recall.
+    O corpus é gerado em lotes (o mesmo do índice), então a memória não
+    depende do número de documentos.
+    """
+    # Os ids do corpus são as posições (0..n_docs-1): o deslocamento de cada
+    # lote é o seu primeiro id
+    blocos = ((int(ids[0]), normalizar(vetores))
+              for ids, vetores in gerar_corpus(n_docs, dims, seed, vetores_base, lote=8192))
+    indices, _ = topk_em_blocos(normalizar(consultas), blocos, k)
+    return [[str(i) for i in linha] for linha in indices]
+
+
+def ids_resposta(resposta: dict) -> list:
+    return [hit["_id"] for hit in resposta["hits"]["hits"]]
+
+
+def recall_at_k(ids_ann: list, ids_exatos: list, k: int) -> float:
+    """Fração dos k vizinhos exatos que a busca aproximada encontrou."""
+    exatos = set(ids_exatos[:k])
+    if not exatos:
+        return 0.0
+    return len(exatos.intersection(ids_ann[:k])) / len(exatos)
+
+
+def percentis(amostras_ms: list) -> dict:
+    """p50/p95/p99, média e máximo de uma lista de latências em ms."""
+    valores = np.asarray(amostras_ms, dtype=np.float64)
+    if valores.size == 0:
+        return {"p50": None, "p95": None, "p99": None, "media": None, "max": None}
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "media": float(valores.mean()),
+        "max": float(valores.max())
+    }
+
+
+def medir(executar, consultas: list, aquecimento: int, repeticoes: int):
+    """
+    Executa `executar(query_vector)` para cada consulta: primeiro `aquecimento`
+    rodadas descartadas, depois `repeticoes` rodadas medidas. Retorna as
+    latências do cliente e do servidor (`took`) em ms e a última resposta de
+    cada consulta.
+    """
+    for _ in range(aquecimento):
+        for query_vector in consultas:
+            executar(query_vector)
+
+    latencias_cliente, latencias_servidor = [], []
+    respostas = [None] * len(consultas)
+    for _ in range(repeticoes):
+        for i, query_vector in enumerate(consultas):
+            inicio = time.perf_counter()
+            resposta = executar(query_vector)
+            latencias_cliente.append((time.perf_counter() - inicio) * 1000)
+            latencias_servidor.append(resposta["took"])
+            respostas[i] = resposta
+
+    return latencias_cliente, latencias_servidor, respostas
+
+
+def linha_resultado(metodo: str, k: int, num_candidates, recall, cliente: list, servidor: list) -> dict:
+    linha = {"metodo": metodo, "k": k, "num_candidates": num_candidates, "recall": recall}
+    for prefixo, amostras in (("cliente", cliente), ("servidor", servidor)):
+        for nome, valor in percentis(amostras).items():
+            linha[f"{prefixo}_{nome}_ms"] = valor
+    return linha
+
+
+def executar_benchmark(client: Elasticsearch, index_name: str, consultas: np.ndarray,
+                       ks=(10,), num_candidates=(50, 100), aquecimento: int = 2,
+                       repeticoes: int = 5, verbose: bool = True, ground_truth=None) -> list:
+    """
+    Varre `k` x `num_candidates` e mede latência (p50/p95/p99) e recall@k da
+    busca ANN contra a busca exata com script_score (ou contra `ground_truth`,
+    uma lista com os ids exatos ordenados de cada consulta).
+    """
+    vetores = [q.tolist() for q in consultas]
+    k_max = max(ks)
+    linhas = []
+
+    if ground_truth is None:
+        # A busca exata também é medida: é a referência de latência sem HNSW
+        cliente, servidor, respostas = medir(
+            lambda qv: busca_exata(client, index_name, qv, k_max), vetores, aquecimento, repeticoes)
+        ground_truth = [ids_resposta(r) for r in respostas]
+        linhas.append(linha_resultado("exato", k_max, None, 1.0, cliente, servidor))
+        if verbose:
+            print(f"   exato k={k_max}: p50 {linhas[-1]['cliente_p50_ms']:.1f} ms")
+
+    for k in ks:
+        for nc in num_candidates:
+            if nc < k:
+                continue  # num_candidates precisa ser >= k
+            cliente, servidor, respostas = medir(
+                lambda qv: busca_ann(client, index_name, qv, k, nc), vetores, aquecimento, repeticoes)
+            recall = float(np.mean([
+                recall_at_k(ids_resposta(r), exatos, k) for r, exatos in zip(respostas, ground_truth)
+            ]))
+            linhas.append(linha_resultado("ann", k, nc, recall, cliente, servidor))
+            if verbose:
+                print(f"   ann k={k} num_candidates={nc}: recall {recall:.3f}, "
+                      f"p50 {linhas[-1]['cliente_p50_ms']:.1f} ms, p99 {linhas[-1]['cliente_p99_ms']:.1f} ms")
+
+    return linhas
+
+
+# ==============================================================================
+# SEÇÃO 3: RELATÓRIO
+# ==============================================================================
+
+def salvar_relatorio(linhas: list, caminho: str, metadados: dict) -> None:
+    """Salva o relatório em JSON (com metadados) ou CSV, conforme a extensão."""
+    if caminho.endswith(".csv"):
+        with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+            campos = list(metadados.keys()) + list(linhas[0].keys())
+            escritor = csv.DictWriter(arquivo, fieldnames=campos)
+            escritor.writeheader()
+            for linha in linhas:
+                escritor.writerow({**metadados, **linha})
+    else:
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            json.dump({"metadados": metadados, "resultados": linhas}, arquivo, indent=2)
+    print(f"-> Relatório salvo em '{caminho}'.")
+
+
+def imprimir_resumo(linhas: list) -> None:
+    """Tabela resumida no terminal."""
+    print(f"\n{'método':<8}{'k':>5}{'cands':>7}{'recall':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'took p50':>10}")
+    for l in linhas:
+        cands = "-" if l["num_candidates"] is None else l["num_candidates"]
+        print(f"{l['metodo']:<8}{l['k']:>5}{cands:>7}{l['recall']:>8.3f}"
+              f"{l['cliente_p50_ms']:>9.1f}{l['cliente_p95_ms']:>9.1f}{l['cliente_p99_ms']:>9.1f}"
+              f"{l['servidor_p50_ms']:>10.1f}")
+
+
+def conectar(args, **opcoes) -> Elasticsearch:
+    """Cria o cliente a partir dos argumentos de linha de comando (e `opcoes` extras)."""
+    senha = args.senha or os.environ.get("ELASTIC_PASSWORD")
+    if senha:
+        return Elasticsearch(args.host, basic_auth=(args.usuario, senha),
+                             verify_certs=False, request_timeout=120, **opcoes)
+    return Elasticsearch(args.host, request_timeout=120, **opcoes)
+
+
+def adicionar_argumentos_conexao(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--host", default="http://localhost:9200")
+    parser.add_argument("--usuario", default="elastic")
+    parser.add_argument("--senha", help="Senha (padrão: variável ELASTIC_PASSWORD)")
+
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recall vs latência da busca kNN")
+    adicionar_argumentos_conexao(parser)
+    parser.add_argument("--indice", default=INDICE_PADRAO)
+    parser.add_argument("--docs", type=int, default=10000, help="Tamanho do corpus")
+    parser.add_argument("--dims", type=int, default=384, help="Dimensões (384 = all-MiniLM-L6-v2)")
+    parser.add_argument("--vetores", help="Arquivo .npy com embeddings reais para usar como corpus")
+    parser.add_argument("--consultas", type=int, default=50)
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[50, 100, 200, 500, 1000])
+    parser.add_argument("--aquecimento", type=int, default=2, help="Rodadas de aquecimento descartadas")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Rodadas medidas por consulta")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reusar-indice", action="store_true", help="Não recria o índice")
+    parser.add_argument("--oraculo", choices=["local", "script_score"], default="local",
+                        help="Referência de recall: kNN exato com NumPy ou script_score no cluster")
+    parser.add_argument("--saida", default="relatorio_knn.json", help="Relatório (.json ou .csv)")
+    args = parser.parse_args()
+
+    client = conectar(args)
+    versao = client.info()["version"]["number"]
+
+    vetores_base = None
+    if args.vetores:
+        vetores_base = np.load(args.vetores, mmap_mode="r")
+        args.docs = min(args.docs, len(vetores_base))
+        args.dims = vetores_base.shape[1]
+
+    preparo = {}
+    if not args.reusar_indice:
+        print(f"1. Indexando {args.docs} vetores de {args.dims} dimensões em '{args.indice}'...")
+        preparo = preparar_indice(client, args.indice, args.docs, args.dims, args.seed,
+                                  vetores_base, shards=args.shards)
+        print(f"-> Indexação: {preparo['tempo_indexacao_s']:.1f}s, "
+              f"force merge: {preparo['tempo_force_merge_s']:.1f}s")
+
+    print(f"2. Executando {args.consultas} consultas ({args.aquecimento} aquecimentos, "
+          f"{args.repeticoes} repetições)...")
+    consultas = gerar_consultas(args.consultas, args.dims, args.seed, vetores_base)
+    ground_truth = None
+    if args.oraculo == "local":
+        ground_truth = ground_truth_local(consultas, args.docs, args.dims, args.seed,
+                                          vetores_base, max(args.k))
+    linhas = executar_benchmark(client, args.indice, consultas, args.k, args.num_candidates,
+                                args.aquecimento, args.repeticoes, ground_truth=ground_truth)
+
+    imprimir_resumo(linhas)
+    metadados = {
+        "versao_elasticsearch": versao,
+        "data": datetime.now(timezone.utc).isoformat(),
+        "indice": args.indice,
+        "docs": args.docs,
+        "dims": args.dims,
+        "shards": args.shards,
+        "consultas": args.consultas,
+        "repeticoes": args.repeticoes,
+        "oraculo": args.oraculo,
+        **preparo
+    }
+    salvar_relatorio(linhas, args.saida, metadados)
+
+
+if __name__ == "__main__":
+    main()
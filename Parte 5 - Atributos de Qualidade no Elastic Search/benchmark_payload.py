@@ -0,0 +1,245 @@
+# benchmark_payload.py
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+from elasticsearch.serializer import CompatibilityModeJsonSerializer, JsonSerializer
+
+from benchmark_knn import (INDICE_PADRAO, adicionar_argumentos_conexao, conectar, gerar_consultas,
+                           gerar_corpus, percentis, salvar_relatorio)
+from benchmark_quantizacao import tamanho_indice
+from busca_vetorial import CAMPOS_RETORNO
+from mapeamento import CAMPOS_VETORES, mapeamento_indice
+from respostas_enxutas import FILTRO_BUSCA
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ==============================================================================
+# SEÇÃO 1: ÍNDICES COMPARADOS (SOURCE COMPLETO x SOURCE ENXUTO)
+# ==============================================================================
+
+PALAVRAS = ("busca vetorial embeddings elasticsearch índice consulta documento modelo "
+            "similaridade cosseno grafo vizinhos latência memória shard réplica cluster "
+            "texto semântica ranking relevância categoria dados artigo rede neural").split()
+
+
+def gerar_texto(rng: np.random.Generator, n_palavras: int) -> str:
+    return " ".join(rng.choice(PALAVRAS, size=n_palavras))
+
+
+def mapeamento_artigos(dims: int, source_enxuto: bool) -> dict:
+    """Mapeamento do artigos_vetorial (Parte 3), com ou sem os vetores no _source."""
+    return mapeamento_indice(dims, source_enxuto=source_enxuto)["mappings"]
+
+
+def preparar_indice_artigos(client: Elasticsearch, index_name: str, n_docs: int, dims: int,
+                            seed: int, source_enxuto: bool) -> float:
+    """Recria o índice e indexa artigos sintéticos com dois vetores cada. Retorna o tempo (s)."""
+    if client.indices.exists(index=index_name):
+        client.indices.delete(index=index_name)
+    client.indices.create(
+        index=index_name,
+        settings={"number_of_shards": 1, "number_of_replicas": 0, "refresh_interval": "-1"},
+        mappings=mapeamento_artigos(dims, source_enxuto)
+    )
+
+    rng = np.random.default_rng(seed + 4)
+    inicio = time.perf_counter()
+    for (ids, titulos), (_, conteudos) in zip(gerar_corpus(n_docs, dims, seed),
+                                              gerar_corpus(n_docs, dims, seed + 5)):
+        acoes = [{
+            "_index": index_name,
+            "_id": doc_id,
+            "_source": {
+                "titulo": gerar_texto(rng, 6),
+                "conteudo": gerar_texto(rng, 60),
+                "categoria": f"cat{rng.integers(10)}",
+                "data_publicacao": "2024-01-15",
+                **dict(zip(CAMPOS_VETORES, (vt.tolist(), vc.tolist())))
+            }
+        } for doc_id, vt, vc in zip(ids, titulos, conteudos)]
+        helpers.bulk(client, acoes, chunk_size=500)
+    client.indices.refresh(index=index_name)
+    client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+    client.indices.refresh(index=index_name)
+    return time.perf_counter() - inicio
+
+
+# ==============================================================================
+# SEÇÃO 2: REQUISIÇÕES BRUTAS E TEMPO DE (DE)SERIALIZAÇÃO
+# ==============================================================================
+
+class SerializadorBruto(JsonSerializer):
+    """Serializa os pedidos como o cliente, mas devolve a resposta em bytes, sem parse."""
+
+    def loads(self, data: bytes) -> bytes:
+        return data
+
+
+def cliente_bruto(args) -> Elasticsearch:
+    """Cliente cujas respostas JSON chegam como bytes (BinaryApiResponse)."""
+    bruto = SerializadorBruto()
+    return conectar(args, serializers={
+        JsonSerializer.mimetype: bruto,
+        CompatibilityModeJsonSerializer.mimetype: bruto
+    })
+
+
+def requisicao_bruta(client: Elasticsearch, metodo: str, caminho: str, corpo: dict = None,
+                     params: dict = None) -> bytes:
+    """
+    Envia a requisição pelo cliente e devolve o corpo da resposta sem
+    decodificar, para medir os bytes e o parse no cliente separadamente.
+    """
+    headers = {"accept": "application/json"}
+    if corpo is not None:
+        headers["content-type"] = "application/json"
+    return client.perform_request(metodo, caminho, params=params, headers=headers,
+                                  body=corpo).body
+
+
+def tempo_minimo_us(funcao, repeticoes: int) -> float:
+    """Menor tempo de `repeticoes` chamadas, em microssegundos (descarta ruído do SO)."""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1e6
+
+
+def medir_variante(client: Elasticsearch, nome: str, index_name: str, requisicoes: list,
+                   repeticoes: int) -> dict:
+    """
+    Executa cada requisição (método, caminho, corpo, params) e mede os bytes
+    da resposta, o took e o tempo de serialização do pedido e de parse da
+    resposta com json e com orjson.
+    """
+    bytes_resposta, took = [], []
+    dumps_json, dumps_orjson, loads_json, loads_orjson = [], [], [], []
+    for metodo, caminho, corpo, params in requisicoes:
+        bruta = requisicao_bruta(client, metodo, caminho, corpo, params)
+        bytes_resposta.append(len(bruta))
+        took.append(json.loads(bruta).get("took", 0))
+
+        loads_json.append(tempo_minimo_us(lambda: json.loads(bruta), repeticoes))
+        if corpo is not None:
+            dumps_json.append(tempo_minimo_us(lambda: json.dumps(corpo), repeticoes))
+        if orjson is not None:
+            loads_orjson.append(tempo_minimo_us(lambda: orjson.loads(bruta), repeticoes))
+            if corpo is not None:
+                dumps_orjson.append(tempo_minimo_us(lambda: orjson.dumps(corpo), repeticoes))
+
+    def mediana(valores):
+        return float(np.median(valores)) if valores else None
+
+    linha = {
+        "indice": index_name,
+        "variante": nome,
+        "bytes_resposta_media": float(np.mean(bytes_resposta)),
+        "servidor_p50_ms": percentis(took)["p50"],
+        "parse_json_us": mediana(loads_json),
+        "parse_orjson_us": mediana(loads_orjson),
+        "dumps_json_us": mediana(dumps_json),
+        "dumps_orjson_us": mediana(dumps_orjson)
+    }
+    print(f"   {nome:<34} {linha['bytes_resposta_media']:>10.0f} B, parse json "
+          f"{linha['parse_json_us']:.0f} µs"
+          + (f", orjson {linha['parse_orjson_us']:.0f} µs" if orjson is not None else ""))
+    return linha
+
+
+def variantes(index_name: str, consultas: np.ndarray, ids_docs: list, k: int) -> list:
+    """Requisições de cada variante: leitura por id e kNN, do formato antigo ao enxuto."""
+    def knn(qv, **extra):
+        return {"knn": {"field": "conteudo_embedding", "query_vector": qv.tolist(), "k": k,
+                        "num_candidates": max(50, k)}, "size": k, **extra}
+
+    return [
+        ("get: _source inteiro",
+         [("GET", f"/{index_name}/_doc/{i}", None, None) for i in ids_docs]),
+        ("get: só conteudo_embedding",
+         [("GET", f"/{index_name}/_doc/{i}", None, {"_source_includes": "conteudo_embedding"})
+          for i in ids_docs]),
+        ("knn: _source inteiro",
+         [("POST", f"/{index_name}/_search", knn(qv), None) for qv in consultas]),
+        ("knn: _source filtrado",
+         [("POST", f"/{index_name}/_search", knn(qv, _source=CAMPOS_RETORNO), None)
+          for qv in consultas]),
+        ("knn: _source filtrado + filter_path",
+         [("POST", f"/{index_name}/_search", knn(qv, _source=CAMPOS_RETORNO),
+           {"filter_path": ",".join(FILTRO_BUSCA)}) for qv in consultas]),
+    ]
+
+
+def imprimir_resumo(linhas: list, tamanhos: dict) -> None:
+    print(f"\n{'índice':<28}{'disco MB':>9}  {'variante':<36}{'bytes':>10}"
+          f"{'json µs':>9}{'orjson µs':>10}")
+    for l in linhas:
+        orjson_us = "-" if l["parse_orjson_us"] is None else f"{l['parse_orjson_us']:.0f}"
+        print(f"{l['indice']:<28}{tamanhos[l['indice']] / 2**20:>9.1f}  {l['variante']:<36}"
+              f"{l['bytes_resposta_media']:>10.0f}{l['parse_json_us']:>9.0f}{orjson_us:>10}")
+
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mede tamanho do índice, bytes das respostas e parse no cliente, "
+                    "com e sem os vetores no _source")
+    adicionar_argumentos_conexao(parser)
+    parser.add_argument("--indice", default=INDICE_PADRAO, help="Prefixo dos índices de teste")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--consultas", type=int, default=30)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeticoes", type=int, default=20,
+                        help="Repetições de cada (de)serialização; vale o menor tempo")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default="relatorio_payload.json")
+    args = parser.parse_args()
+
+    client = conectar(args)
+    bruto = cliente_bruto(args)
+    versao = client.info()["version"]["number"]
+    if orjson is None:
+        print("-> orjson não instalado: só o parse com json será medido.")
+
+    consultas = gerar_consultas(args.consultas, args.dims, args.seed)
+    rng = np.random.default_rng(args.seed + 6)
+    ids_docs = [str(i) for i in rng.choice(args.docs, size=args.consultas, replace=False)]
+
+    linhas, tamanhos = [], {}
+    for passo, source_enxuto in ((1, False), (2, True)):
+        index_name = f"{args.indice}-{'source-enxuto' if source_enxuto else 'source-completo'}"
+        print(f"{passo}. Indexando {args.docs} artigos em '{index_name}'...")
+        tempo = preparar_indice_artigos(client, index_name, args.docs, args.dims, args.seed,
+                                        source_enxuto)
+        tamanhos[index_name] = tamanho_indice(client, index_name)
+        print(f"   -> {tempo:.1f}s, {tamanhos[index_name] / 2**20:.1f} MB em disco")
+        for nome, requisicoes in variantes(index_name, consultas, ids_docs, args.k):
+            linhas.append(medir_variante(bruto, nome, index_name, requisicoes, args.repeticoes))
+
+    imprimir_resumo(linhas, tamanhos)
+    salvar_relatorio(linhas, args.saida, {
+        "versao_elasticsearch": versao,
+        "data": datetime.now(timezone.utc).isoformat(),
+        "docs": args.docs,
+        "dims": args.dims,
+        "k": args.k,
+        "consultas": args.consultas,
+        "disco_bytes": tamanhos
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# benchmark_quantizacao.py
+
+import argparse
+from datetime import datetime, timezone
+
+import numpy as np
+from elasticsearch import Elasticsearch
+
+from benchmark_knn import (INDICE_PADRAO, adicionar_argumentos_conexao, conectar, gerar_consultas,
+                           ground_truth_local, ids_resposta, linha_resultado, medir,
+                           preparar_indice, recall_at_k, salvar_relatorio)
+from mapeamento import versao_suporta_int8_hnsw, vetor_consulta
+
+# ==============================================================================
+# SEÇÃO 1: MAPEAMENTOS COMPARADOS
+# ==============================================================================
+
+# Cada modo: element_type, index_options e o campo com os vetores float32
+# usados no reranqueamento (None = sem reranqueamento)
+MODOS = {
+    "float": {"element_type": "float", "index_options": None, "campo_float": None},
+    "byte": {"element_type": "byte", "index_options": None, "campo_float": "vetor_float"},
+    "int8_hnsw": {"element_type": "float", "index_options": {"type": "int8_hnsw"},
+                  "campo_float": "vetor"},
+}
+
+
+def memoria_estimada(n_docs: int, dims: int, modo: str, m: int = 16) -> int:
+    """
+    Memória (page cache) que o HNSW precisa para ficar todo em RAM, pela
+    fórmula da documentação do Elasticsearch: vetores + grafo (4 bytes x m
+    vizinhos por vetor). O float32 extra do modo "byte" não entra: ele só é
+    lido para os poucos candidatos reranqueados.
+    """
+    if modo == "byte":
+        vetores = n_docs * dims
+    elif modo == "int8_hnsw":
+        vetores = n_docs * (dims + 4)
+    else:
+        vetores = n_docs * dims * 4
+    return vetores + n_docs * 4 * m
+
+
+def tamanho_indice(client: Elasticsearch, index_name: str) -> int:
+    """Tamanho em disco das cópias primárias do índice, em bytes."""
+    stats = client.indices.stats(index=index_name, metric="store")
+    return stats["indices"][index_name]["primaries"]["store"]["size_in_bytes"]
+
+
+# ==============================================================================
+# SEÇÃO 2: BUSCAS (DIRETA E EM DUAS FASES)
+# ==============================================================================
+
+def busca_direta(client: Elasticsearch, index_name: str, query_vector: np.ndarray,
+                 modo: str, k: int, num_candidates: int) -> dict:
+    """Busca kNN sem reranqueamento: ranking do próprio HNSW (quantizado ou não)."""
+    return client.search(
+        index=index_name,
+        knn={"field": "vetor", "query_vector": vetor_consulta(query_vector.tolist(), modo),
+             "k": k, "num_candidates": num_candidates},
+        size=k,
+        source=False
+    )
+
+
+def busca_reranqueada(client: Elasticsearch, index_name: str, query_vector: np.ndarray,
+                      modo: str, k: int, fator: int, num_candidates: int) -> dict:
+    """
+    Fase 1: pede k x fator candidatos ao HNSW quantizado.
+    Fase 2: reordena os candidatos pelo cosseno com os vetores float32 e fica com os k melhores.
+    """
+    campo_float = MODOS[modo]["campo_float"]
+    candidatos = k * fator
+    resposta = client.search(
+        index=index_name,
+        knn={"field": "vetor", "query_vector": vetor_consulta(query_vector.tolist(), modo),
+             "k": candidatos, "num_candidates": max(num_candidates, candidatos)},
+        size=candidatos,
+        source=[campo_float]
+    )
+    hits = resposta["hits"]["hits"]
+    if hits:
+        vetores = np.asarray([hit["_source"][campo_float] for hit in hits], dtype=np.float32)
+        similaridades = vetores @ query_vector / np.linalg.norm(vetores, axis=1)
+        ordem = np.argsort(-similaridades)[:k]
+        hits = [hits[i] for i in ordem]
+    return {"took": resposta["took"], "hits": {"hits": hits}}
+
+
+# ==============================================================================
+# SEÇÃO 3: EXECUÇÃO
+# ==============================================================================
+
+def avaliar_modo(client: Elasticsearch, index_name: str, modo: str, consultas: np.ndarray,
+                 ground_truth: list, ks: list, fatores: list, num_candidates: int,
+                 aquecimento: int, repeticoes: int) -> list:
+    """Recall@k e latência da busca direta e, se quantizado, da busca reranqueada."""
+    linhas = []
+
+    def registrar(metodo, k, fator, executar):
+        cliente, servidor, respostas = medir(executar, list(consultas), aquecimento, repeticoes)
+        recall = float(np.mean([
+            recall_at_k(ids_resposta(r), exatos, k) for r, exatos in zip(respostas, ground_truth)
+        ]))
+        linha = linha_resultado(metodo, k, num_candidates, recall, cliente, servidor)
+        linha.update({"mapeamento": modo, "fator_oversampling": fator})
+        linhas.append(linha)
+        print(f"   {modo:<10} {metodo:<12} k={k} fator={fator or '-'}: recall {recall:.3f}, "
+              f"p50 {linha['cliente_p50_ms']:.1f} ms")
+
+    for k in ks:
+        registrar("ann", k, None,
+                  lambda qv: busca_direta(client, index_name, qv, modo, k, num_candidates))
+        if MODOS[modo]["campo_float"] is None:
+            continue
+        for fator in fatores:
+            registrar("ann+rerank", k, fator,
+                      lambda qv: busca_reranqueada(client, index_name, qv, modo, k, fator,
+                                                   num_candidates))
+    return linhas
+
+
+def imprimir_resumo(linhas: list, tamanhos: dict) -> None:
+    """Tabela resumida no terminal."""
+    print(f"\n{'mapeamento':<11}{'disco MB':>10}{'RAM MB':>9}  {'método':<12}{'k':>4}"
+          f"{'fator':>6}{'recall':>8}{'p50':>8}{'p99':>8}")
+    for l in linhas:
+        t = tamanhos[l["mapeamento"]]
+        fator = "-" if l["fator_oversampling"] is None else l["fator_oversampling"]
+        print(f"{l['mapeamento']:<11}{t['disco_bytes'] / 2**20:>10.1f}"
+              f"{t['memoria_estimada_bytes'] / 2**20:>9.1f}  {l['metodo']:<12}{l['k']:>4}"
+              f"{fator:>6}{l['recall']:>8.3f}{l['cliente_p50_ms']:>8.1f}{l['cliente_p99_ms']:>8.1f}")
+
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compara tamanho, memória e recall@k de mapeamentos float e quantizados")
+    adicionar_argumentos_conexao(parser)
+    parser.add_argument("--indice", default=INDICE_PADRAO, help="Prefixo dos índices de teste")
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--vetores", help="Arquivo .npy com embeddings reais para usar como corpus")
+    parser.add_argument("--consultas", type=int, default=50)
+    parser.add_argument("--k", type=int, nargs="+", default=[10])
+    parser.add_argument("--num-candidates", type=int, default=100)
+    parser.add_argument("--fator-oversampling", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Candidatos reranqueados = k x fator")
+    parser.add_argument("--aquecimento", type=int, default=2)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default="relatorio_quantizacao.json")
+    args = parser.parse_args()
+
+    client = conectar(args)
+    versao = client.info()["version"]["number"]
+    modos = ["float", "byte"]
+    if versao_suporta_int8_hnsw(versao):
+        modos.append("int8_hnsw")
+    else:
+        print(f"-> Elasticsearch {versao}: int8_hnsw requer 8.12+, comparando só float e byte.")
+
+    vetores_base = None
+    if args.vetores:
+        vetores_base = np.load(args.vetores, mmap_mode="r")
+        args.docs = min(args.docs, len(vetores_base))
+        args.dims = vetores_base.shape[1]
+
+    consultas = gerar_consultas(args.consultas, args.dims, args.seed, vetores_base)
+    print("1. Calculando os vizinhos exatos localmente...")
+    ground_truth = ground_truth_local(consultas, args.docs, args.dims, args.seed,
+                                      vetores_base, max(args.k))
+
+    linhas, tamanhos = [], {}
+    for i, modo in enumerate(modos, 2):
+        index_name = f"{args.indice}-{modo}"
+        config = MODOS[modo]
+        print(f"{i}. Mapeamento '{modo}': indexando {args.docs} vetores em '{index_name}'...")
+        preparo = preparar_indice(
+            client, index_name, args.docs, args.dims, args.seed, vetores_base,
+            index_options=config["index_options"], element_type=config["element_type"],
+            campo_float=config["campo_float"] == "vetor_float")
+        tamanhos[modo] = {
+            "disco_bytes": tamanho_indice(client, index_name),
+            "memoria_estimada_bytes": memoria_estimada(args.docs, args.dims, modo),
+            **preparo
+        }
+        linhas += avaliar_modo(client, index_name, modo, consultas, ground_truth, args.k,
+                               args.fator_oversampling, args.num_candidates,
+                               args.aquecimento, args.repeticoes)
+
+    imprimir_resumo(linhas, tamanhos)
+    metadados = {
+        "versao_elasticsearch": versao,
+        "data": datetime.now(timezone.utc).isoformat(),
+        "docs": args.docs,
+        "dims": args.dims,
+        "consultas": args.consultas,
+        "num_candidates": args.num_candidates
+    }
+    if args.saida.endswith(".csv"):
+        for linha in linhas:
+            linha.update(tamanhos[linha["mapeamento"]])
+        salvar_relatorio(linhas, args.saida, metadados)
+    else:
+        salvar_relatorio(linhas, args.saida, {**metadados, "indices": tamanhos})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmark_roteamento.py
+
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+
+from benchmark_knn import (INDICE_PADRAO, adicionar_argumentos_conexao, conectar, gerar_consultas,
+                           gerar_corpus, ids_resposta, linha_resultado, mapeamento_vetorial, medir,
+                           recall_at_k, salvar_relatorio)
+
+# ==============================================================================
+# SEÇÃO 1: CORPUS COM CATEGORIAS E ÍNDICES (HASH x ROTEADO)
+# ==============================================================================
+
+def gerar_categorias(n_docs: int, n_categorias: int, seed: int) -> np.ndarray:
+    """
+    Categoria de cada documento, com distribuição de Zipf (poucas categorias
+    grandes e muitas pequenas), como costuma acontecer em catálogos reais.
+    """
+    rng = np.random.default_rng(seed + 2)
+    pesos = 1.0 / np.arange(1, n_categorias + 1)
+    return rng.choice(n_categorias, size=n_docs, p=pesos / pesos.sum())
+
+
+def preparar_indice_categorias(client: Elasticsearch, index_name: str, n_docs: int, dims: int,
+                               seed: int, categorias: np.ndarray, shards: int,
+                               roteado: bool, vetores_base=None) -> float:
+    """
+    Recria o índice com `shards` shards e indexa o corpus com a categoria de
+    cada documento. Com `roteado`, usa _routing = categoria: cada categoria
+    fica inteira em um único shard. Retorna o tempo de indexação (s).
+    """
+    if client.indices.exists(index=index_name):
+        client.indices.delete(index=index_name)
+
+    mapeamento = mapeamento_vetorial(dims)
+    mapeamento["properties"]["categoria"] = {"type": "keyword"}
+    client.indices.create(
+        index=index_name,
+        settings={"number_of_shards": shards, "number_of_replicas": 0, "refresh_interval": "-1"},
+        mappings=mapeamento
+    )
+
+    inicio = time.perf_counter()
+    for ids, vetores in gerar_corpus(n_docs, dims, seed, vetores_base):
+        acoes = []
+        for doc_id, vetor in zip(ids, vetores):
+            categoria = f"cat{categorias[int(doc_id)]}"
+            acao = {"_index": index_name, "_id": doc_id,
+                    "_source": {"vetor": vetor.tolist(), "categoria": categoria}}
+            if roteado:
+                acao["_routing"] = categoria
+            acoes.append(acao)
+        helpers.bulk(client, acoes, chunk_size=1000)
+    client.indices.refresh(index=index_name)
+    client.options(request_timeout=3600).indices.forcemerge(index=index_name, max_num_segments=1)
+    client.indices.refresh(index=index_name)
+    return time.perf_counter() - inicio
+
+
+def ground_truth_filtrado(consultas: np.ndarray, categorias_consulta: np.ndarray,
+                          categorias: np.ndarray, n_docs: int, dims: int, seed: int, k: int,
+                          vetores_base=None) -> list:
+    """
+    Vizinhos exatos de cada consulta entre os documentos da sua categoria,
+    calculados com NumPy percorrendo o corpus em lotes.
+    """
+    n = len(consultas)
+    melhores_ids = np.empty((n, 0), dtype=np.int64)
+    melhores_sim = np.empty((n, 0), dtype=np.float32)
+
+    for ids, vetores in gerar_corpus(n_docs, dims, seed, vetores_base, lote=8192):
+        linhas = np.asarray(ids, dtype=np.int64)
+        vetores = vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+        sims = consultas @ vetores.T
+        # Documentos de outras categorias nunca entram no top-k
+        sims[categorias_consulta[:, None] != categorias[linhas][None, :]] = -np.inf
+        sims = np.hstack([melhores_sim, sims])
+        candidatos = np.hstack([melhores_ids, np.broadcast_to(linhas, (n, len(linhas)))])
+        kk = min(k, sims.shape[1])
+        manter = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        melhores_ids = np.take_along_axis(candidatos, manter, axis=1)
+        melhores_sim = np.take_along_axis(sims, manter, axis=1)
+
+    ordem = np.argsort(-melhores_sim, axis=1)
+    melhores_ids = np.take_along_axis(melhores_ids, ordem, axis=1)
+    melhores_sim = np.take_along_axis(melhores_sim, ordem, axis=1)
+    return [[str(i) for i, s in zip(linha, sims) if np.isfinite(s)]
+            for linha, sims in zip(melhores_ids, melhores_sim)]
+
+
+# ==============================================================================
+# SEÇÃO 2: ESTRATÉGIAS DE BUSCA FILTRADA
+# ==============================================================================
+
+def busca_pos_filtro(client, index_name, query_vector, categoria, k, num_candidates) -> dict:
+    """Filtro como `query` ao lado do kNN (formato antigo da busca_hibrida)."""
+    return client.search(
+        index=index_name,
+        knn={"field": "vetor", "query_vector": query_vector, "k": k,
+             "num_candidates": num_candidates},
+        query={"bool": {"filter": [{"term": {"categoria": categoria}}]}},
+        size=k,
+        source=False
+    )
+
+
+def busca_pre_filtro(client, index_name, query_vector, categoria, k, num_candidates,
+                     routing=None) -> dict:
+    """Filtro dentro do kNN; com `routing`, só o shard da categoria é consultado."""
+    return client.search(
+        index=index_name,
+        knn={"field": "vetor", "query_vector": query_vector, "k": k,
+             "num_candidates": num_candidates,
+             "filter": {"term": {"categoria": categoria}}},
+        size=k,
+        source=False,
+        routing=routing
+    )
+
+
+def avaliar_estrategia(nome: str, executar, consultas: np.ndarray, categorias_consulta,
+                       ground_truth: list, k: int, num_candidates: int, aquecimento: int,
+                       repeticoes: int) -> dict:
+    """Latência, recall@k, média de hits e shards consultados de uma estratégia."""
+    entradas = list(zip([q.tolist() for q in consultas], categorias_consulta))
+    cliente, servidor, respostas = medir(lambda e: executar(*e), entradas, aquecimento, repeticoes)
+    recall = float(np.mean([
+        recall_at_k(ids_resposta(r), exatos, k) for r, exatos in zip(respostas, ground_truth)
+    ]))
+    linha = linha_resultado(nome, k, num_candidates, recall, cliente, servidor)
+    linha["media_hits"] = float(np.mean([len(r["hits"]["hits"]) for r in respostas]))
+    linha["consultas_com_menos_de_k"] = int(sum(len(r["hits"]["hits"]) < k for r in respostas))
+    linha["shards_consultados"] = float(np.mean([r["_shards"]["total"] for r in respostas]))
+    print(f"   {nome:<26} recall {recall:.3f}, hits {linha['media_hits']:.1f}/{k}, "
+          f"shards {linha['shards_consultados']:.1f}, p50 {linha['cliente_p50_ms']:.1f} ms, "
+          f"p99 {linha['cliente_p99_ms']:.1f} ms")
+    return linha
+
+
+def imprimir_resumo(linhas: list) -> None:
+    print(f"\n{'estratégia':<28}{'recall':>8}{'hits':>7}{'<k':>5}{'shards':>8}"
+          f"{'p50':>8}{'p95':>8}{'p99':>8}")
+    for l in linhas:
+        print(f"{l['metodo']:<28}{l['recall']:>8.3f}{l['media_hits']:>7.1f}"
+              f"{l['consultas_com_menos_de_k']:>5}{l['shards_consultados']:>8.1f}"
+              f"{l['cliente_p50_ms']:>8.1f}{l['cliente_p95_ms']:>8.1f}{l['cliente_p99_ms']:>8.1f}")
+
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compara kNN filtrado por categoria: pós-filtro, pré-filtro e pré-filtro roteado")
+    adicionar_argumentos_conexao(parser)
+    parser.add_argument("--indice", default=INDICE_PADRAO, help="Prefixo dos índices de teste")
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--vetores", help="Arquivo .npy com embeddings reais para usar como corpus")
+    parser.add_argument("--shards", type=int, default=6)
+    parser.add_argument("--categorias", type=int, default=20)
+    parser.add_argument("--consultas", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-candidates", type=int, default=100)
+    parser.add_argument("--aquecimento", type=int, default=2)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default="relatorio_roteamento.json")
+    args = parser.parse_args()
+
+    client = conectar(args)
+    versao = client.info()["version"]["number"]
+
+    vetores_base = None
+    if args.vetores:
+        vetores_base = np.load(args.vetores, mmap_mode="r")
+        args.docs = min(args.docs, len(vetores_base))
+        args.dims = vetores_base.shape[1]
+
+    categorias = gerar_categorias(args.docs, args.categorias, args.seed)
+    consultas = gerar_consultas(args.consultas, args.dims, args.seed, vetores_base)
+    # Cada consulta filtra por uma categoria sorteada com o mesmo peso dos documentos
+    rng = np.random.default_rng(args.seed + 3)
+    categorias_consulta = categorias[rng.integers(0, args.docs, size=args.consultas)]
+
+    print("1. Calculando os vizinhos exatos de cada categoria localmente...")
+    ground_truth = ground_truth_filtrado(consultas, categorias_consulta, categorias, args.docs,
+                                         args.dims, args.seed, args.k, vetores_base)
+    nomes_categoria = [f"cat{c}" for c in categorias_consulta]
+
+    indices = {}
+    for passo, roteado in ((2, False), (3, True)):
+        index_name = f"{args.indice}-{'roteado' if roteado else 'hash'}"
+        print(f"{passo}. Indexando {args.docs} vetores em '{index_name}' "
+              f"({args.shards} shards, {'_routing = categoria' if roteado else 'roteamento por _id'})...")
+        indices[index_name] = preparar_indice_categorias(
+            client, index_name, args.docs, args.dims, args.seed, categorias, args.shards,
+            roteado, vetores_base)
+
+    hash_idx, roteado_idx = f"{args.indice}-hash", f"{args.indice}-roteado"
+    k, nc = args.k, args.num_candidates
+    estrategias = [
+        ("pos-filtro (query)", lambda qv, c: busca_pos_filtro(client, hash_idx, qv, c, k, nc)),
+        ("pre-filtro (knn.filter)", lambda qv, c: busca_pre_filtro(client, hash_idx, qv, c, k, nc)),
+        ("pre-filtro + routing", lambda qv, c: busca_pre_filtro(client, roteado_idx, qv, c, k, nc,
+                                                               routing=c)),
+    ]
+
+    print("4. Executando as consultas filtradas...")
+    linhas = [avaliar_estrategia(nome, executar, consultas, nomes_categoria, ground_truth, k, nc,
+                                 args.aquecimento, args.repeticoes)
+              for nome, executar in estrategias]
+
+    imprimir_resumo(linhas)
+    salvar_relatorio(linhas, args.saida, {
+        "versao_elasticsearch": versao,
+        "data": datetime.now(timezone.utc).isoformat(),
+        "docs": args.docs,
+        "dims": args.dims,
+        "shards": args.shards,
+        "categorias": args.categorias,
+        "consultas": args.consultas,
+        "tempo_indexacao_hash_s": indices[hash_idx],
+        "tempo_indexacao_roteado_s": indices[roteado_idx]
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 # gerenciar_elastic.py
 
+import importlib.util
 import os
 from getpass import getpass
 from elasticsearch import Elasticsearch, ApiError
@@ -71,69 +72,31 @@ def setup_security_and_user(admin_client: Elasticsearch):
 
 def run_performance_tests(admin_client: Elasticsearch):
     """
-    Compara o tempo de resposta de uma busca vetorial otimizada (ANN)
-    com uma busca não-otimizada (kNN exato com script_score).
+    Compara a busca vetorial otimizada (ANN com HNSW) com a busca exata
+    (script_score) usando a suíte de benchmark_knn.py: vetores de 384
+    dimensões, aquecimento, várias repetições com p50/p95/p99 e recall@k da
+    ANN em relação ao resultado exato. Para corpora maiores e varreduras
+    completas, execute `python benchmark_knn.py --help`.
     """
+    from benchmark_knn import (preparar_indice, gerar_consultas, executar_benchmark,
+                               imprimir_resumo, salvar_relatorio)
+
     print("\n--- INICIANDO TESTES DE PERFORMANCE ---")
     index_name = "indice-vetorial-teste"
-    vector_dim = 4
+    n_docs, vector_dim = 1000, 384
 
     # 2.1: Preparar o ambiente de teste
-    print(f"1. Preparando o índice '{index_name}' para o teste...")
-    if admin_client.indices.exists(index=index_name):
-        admin_client.indices.delete(index=index_name)
-    
-    admin_client.indices.create(
-        index=index_name,
-        mappings={
-            "properties": {
-                "vetor": {
-                    "type": "dense_vector",
-                    "dims": vector_dim,
-                    "index": "true",       # Habilita a indexação HNSW
-                    "similarity": "cosine"
-                }
-            }
-        }
-    )
-    # Indexa 1000 documentos com vetores aleatórios
-    for i in range(1000):
-        admin_client.index(index=index_name, document={"vetor": list(np.random.rand(vector_dim))})
-    admin_client.indices.refresh(index=index_name)
-    print("-> Índice preparado com 1000 documentos.")
-
-    query_vector = list(np.random.rand(vector_dim))
-    print(f"2. Usando vetor de consulta aleatório.")
-
-    # 2.2: Teste com otimização (Busca ANN com HNSW)
-    print("\n-> Executando busca VETORIAL OTIMIZADA (ANN)...")
-    response_ann = admin_client.search(
-        index=index_name,
-        knn={
-            "field": "vetor",
-            "query_vector": query_vector,
-            "k": 10,
-            "num_candidates": 100
-        }
-    )
-    print(f"   Resultado: {response_ann['took']} ms")
-
-    # 2.3: Teste sem otimização (Busca kNN Exata com script_score)
-    print("-> Executando busca VETORIAL NÃO-OTIMIZADA (kNN Exato)...")
-    response_exact = admin_client.search(
-        index=index_name,
-        query={
-            "script_score": {
-                "query": {"match_all": {}},
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'vetor') + 1.0",
-                    "params": {"query_vector": query_vector}
-                }
-            }
-        },
-        size=10
-    )
-    print(f"   Resultado: {response_exact['took']} ms")
+    print(f"1. Preparando o índice '{index_name}' com {n_docs} vetores de {vector_dim} dimensões...")
+    preparar_indice(admin_client, index_name, n_docs, vector_dim)
+
+    # 2.2: ANN (HNSW) vs kNN exato (script_score)
+    print("2. Executando buscas ANN e exatas...")
+    consultas = gerar_consultas(20, vector_dim, seed=42)
+    linhas = executar_benchmark(admin_client, index_name, consultas,
+                                ks=(10,), num_candidates=(10, 50, 100))
+    imprimir_resumo(linhas)
+    salvar_relatorio(linhas, "relatorio_performance.json",
+                     {"indice": index_name, "docs": n_docs, "dims": vector_dim})
 
 
 # ==============================================================================
@@ -160,9 +123,8 @@ if __name__ == "__main__":
     
     # [cite_start]Executa os testes de performance [cite: 50]
     # É necessário numpy para gerar os dados do teste
-    try:
-        import numpy as np
+    if importlib.util.find_spec("numpy") is not None:
         run_performance_tests(client)
-    except ImportError:
+    else:
         print("\nAVISO: A biblioteca 'numpy' não está instalada. Testes de performance não serão executados.")
         print("Para rodar os testes, instale com: pip install numpy")
\ No newline at end of file
@@ -0,0 +1,329 @@
+# teste_carga.py
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import Elasticsearch
+
+from benchmark_knn import percentis, adicionar_argumentos_conexao, conectar
+from busca_vetorial import corpo_combinada, corpo_hibrida, corpo_vetorial, rota_categoria
+from mapeamento import meta_do_indice, vetor_consulta
+from reducao_dimensional import projecao_do_meta
+
+# ==============================================================================
+# SEÇÃO 1: LOG DE CONSULTAS REPRODUZÍVEL
+# ==============================================================================
+
+INDICE_PADRAO = "artigos_vetorial"
+
+CONSULTAS_EXEMPLO = [
+    ("inteligência artificial", "tecnologia"),
+    ("redes neurais profundas", "tecnologia"),
+    ("algoritmos de ordenação", "tecnologia"),
+    ("receitas de massa italiana", "gastronomia"),
+    ("pratos tradicionais", "gastronomia"),
+    ("exercícios aeróbicos", "saude"),
+    ("saúde do coração", "saude"),
+    ("energia renovável", "meio_ambiente"),
+    ("mudanças climáticas", "meio_ambiente"),
+    ("arte do renascimento", None),
+]
+
+
+def gerar_log(n: int, seed: int, tipos=("knn", "hibrida", "combinada")) -> list:
+    """
+    Gera um log sintético com distribuição de Zipf sobre as consultas de
+    exemplo (poucas consultas concentram a maior parte do tráfego).
+    """
+    rng = random.Random(seed)
+    pesos = [1 / (i + 1) for i in range(len(CONSULTAS_EXEMPLO))]
+    log = []
+    for _ in range(n):
+        query, categoria = rng.choices(CONSULTAS_EXEMPLO, weights=pesos)[0]
+        tipo = rng.choice(tipos)
+        entrada = {"tipo": tipo, "query": query, "k": 5}
+        if tipo == "hibrida" and categoria:
+            entrada["categoria"] = categoria
+        log.append(entrada)
+    return log
+
+
+def carregar_log(caminho: str) -> list:
+    with open(caminho, "r", encoding="utf-8") as arquivo:
+        return [json.loads(linha) for linha in arquivo if linha.strip()]
+
+
+def salvar_log(log: list, caminho: str) -> None:
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        for entrada in log:
+            arquivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+
+
+def completar_vetores(log: list, nome_modelo: str = "all-MiniLM-L6-v2") -> None:
+    """
+    Gera `query_vector` para as entradas que não o têm (uma vez por consulta
+    distinta). O encode acontece antes do teste, para que a carga medida seja
+    apenas a do cluster.
+    """
+    faltantes = sorted({e["query"] for e in log if "query_vector" not in e})
+    if not faltantes:
+        return
+    from sentence_transformers import SentenceTransformer
+    print(f"-> Gerando embeddings para {len(faltantes)} consultas distintas...")
+    model = SentenceTransformer(nome_modelo)
+    vetores = dict(zip(faltantes, model.encode(faltantes).tolist()))
+    for entrada in log:
+        entrada.setdefault("query_vector", vetores.get(entrada["query"]))
+
+
+def corpo_consulta(entrada: dict, meta: dict, projecao=None) -> dict:
+    """
+    Monta a requisição com os mesmos construtores da BuscaVetorial (Parte 3),
+    respeitando o _meta do índice: projeção PCA, vetor int8 no modo "byte" e
+    _routing por categoria. Retorna {"tipo", "body", "routing"}.
+    """
+    k = entrada.get("k", 5)
+    quantizacao = meta.get("quantizacao")
+    embedding = entrada["query_vector"]
+    if projecao is not None:
+        embedding = projecao.aplicar(embedding).tolist()
+
+    rota = None
+    if entrada["tipo"] == "knn":
+        # No modo quantizado, a BuscaVetorial ainda reranqueia no cliente;
+        # aqui só a requisição (com oversampling) é medida
+        body = corpo_vetorial(embedding, k=k, quantizacao=quantizacao,
+                              fator_oversampling=4)
+    elif entrada["tipo"] == "hibrida":
+        categoria = entrada.get("categoria")
+        body = corpo_hibrida(vetor_consulta(embedding, quantizacao), categoria=categoria, k=k)
+        rota = rota_categoria(meta.get("roteamento"), categoria)
+    elif entrada["tipo"] == "combinada":
+        body = corpo_combinada(entrada["query"], vetor_consulta(embedding, quantizacao),
+                               boost_vetorial=entrada.get("boost_vetorial", 1.0),
+                               boost_textual=entrada.get("boost_textual", 1.0), k=k)
+    else:
+        raise ValueError(f"Tipo de consulta desconhecido: {entrada['tipo']}")
+    return {"tipo": entrada["tipo"], "body": body, "routing": rota}
+
+
+def preparar_consultas(log: list, meta: dict, projecao=None) -> list:
+    """Monta todas as requisições antes do teste (o cliente não entra na medição)."""
+    return [corpo_consulta(entrada, meta, projecao) for entrada in log]
+
+
+# ==============================================================================
+# SEÇÃO 2: GERAÇÃO DE CARGA (MALHA FECHADA E MALHA ABERTA)
+# ==============================================================================
+
+def _executar_uma(client, indice, consulta, t0, agendado=None) -> tuple:
+    """
+    Executa uma consulta e retorna (instante relativo, latência ms, ok, tipo).
+    Na malha aberta a latência conta a partir do instante agendado, para não
+    esconder a espera causada por um servidor saturado (coordinated omission).
+    """
+    inicio = agendado if agendado is not None else time.perf_counter()
+    try:
+        client.search(index=indice, body=consulta["body"], routing=consulta["routing"])
+        ok = True
+    except Exception:
+        ok = False
+    fim = time.perf_counter()
+    return (inicio - t0, (fim - inicio) * 1000, ok, consulta["tipo"])
+
+
+def malha_fechada(client, indice, consultas, clientes: int, duracao: float, t0: float) -> list:
+    """N clientes simultâneos, cada um enviando a próxima consulta ao receber a resposta."""
+    proxima = itertools.cycle(consultas)
+    trava = threading.Lock()
+    amostras = []
+
+    def cliente():
+        locais = []
+        while time.perf_counter() - t0 < duracao:
+            with trava:
+                consulta = next(proxima)
+            locais.append(_executar_uma(client, indice, consulta, t0))
+        with trava:
+            amostras.extend(locais)
+
+    threads = [threading.Thread(target=cliente) for _ in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return amostras
+
+
+def malha_aberta(client, indice, consultas, qps: float, duracao: float, t0: float, max_em_voo: int) -> list:
+    """Chegadas em taxa fixa (QPS alvo), independentemente do tempo de resposta."""
+    futuros = []
+    intervalo = 1.0 / qps
+    with ThreadPoolExecutor(max_workers=max_em_voo) as pool:
+        for i, consulta in enumerate(itertools.cycle(consultas)):
+            agendado = t0 + i * intervalo
+            if agendado - t0 >= duracao:
+                break
+            espera = agendado - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            futuros.append(pool.submit(_executar_uma, client, indice, consulta, t0, agendado))
+    return [f.result() for f in futuros]
+
+
+def trabalhador(config: dict, indice_processo: int) -> list:
+    """Executa a carga de um processo (cada processo tem o próprio cliente)."""
+    consultas = config["consultas"]
+    # Cada processo começa em um ponto diferente do log
+    deslocamento = (indice_processo * len(consultas)) // config["processos"]
+    consultas = consultas[deslocamento:] + consultas[:deslocamento]
+
+    conexoes = config["clientes"] if config["modo"] == "fechada" else config["max_em_voo"]
+    if config["senha"]:
+        client = Elasticsearch(config["host"], basic_auth=(config["usuario"], config["senha"]),
+                               verify_certs=False, connections_per_node=conexoes)
+    else:
+        client = Elasticsearch(config["host"], connections_per_node=conexoes)
+
+    # Todos os processos usam o mesmo relógio de referência (início combinado)
+    t0 = time.perf_counter() + max(0.0, config["inicio_epoch"] - time.time())
+    while time.perf_counter() < t0:
+        time.sleep(0.001)
+
+    if config["modo"] == "fechada":
+        return malha_fechada(client, config["indice"], consultas, config["clientes"], config["duracao"], t0)
+    return malha_aberta(client, config["indice"], consultas, config["qps"] / config["processos"],
+                        config["duracao"], t0, config["max_em_voo"])
+
+
+# ==============================================================================
+# SEÇÃO 3: LINHA DO TEMPO E RELATÓRIO
+# ==============================================================================
+
+def linha_do_tempo(amostras: list, janela: float = 1.0) -> list:
+    """Vazão, taxa de erro e percentis de latência por janela de tempo."""
+    janelas = {}
+    for inicio, latencia, ok, _ in amostras:
+        janelas.setdefault(int(inicio // janela), []).append((latencia, ok))
+
+    linhas = []
+    for indice in sorted(janelas):
+        registros = janelas[indice]
+        erros = sum(1 for _, ok in registros if not ok)
+        lat = percentis([l for l, ok in registros if ok])
+        linhas.append({
+            "t": indice * janela,
+            "requisicoes": len(registros),
+            "qps": len(registros) / janela,
+            "taxa_erro": erros / len(registros),
+            "p50_ms": lat["p50"],
+            "p95_ms": lat["p95"],
+            "p99_ms": lat["p99"]
+        })
+    return linhas
+
+
+def resumo(amostras: list, duracao: float) -> dict:
+    """Totais do teste, no geral e por tipo de consulta."""
+    def calcular(registros):
+        erros = sum(1 for r in registros if not r[2])
+        return {
+            "requisicoes": len(registros),
+            "qps": len(registros) / duracao,
+            "taxa_erro": erros / len(registros) if registros else 0.0,
+            **{f"{k}_ms": v for k, v in percentis([r[1] for r in registros if r[2]]).items()}
+        }
+
+    por_tipo = {}
+    for amostra in amostras:
+        por_tipo.setdefault(amostra[3], []).append(amostra)
+    return {"geral": calcular(amostras), **{tipo: calcular(r) for tipo, r in por_tipo.items()}}
+
+
+def salvar_resultado(caminho: str, config: dict, total: dict, tempo: list) -> None:
+    if caminho.endswith(".csv"):
+        with open(caminho, "w", newline="", encoding="utf-8") as arquivo:
+            escritor = csv.DictWriter(arquivo, fieldnames=list(tempo[0].keys()))
+            escritor.writeheader()
+            escritor.writerows(tempo)
+    else:
+        with open(caminho, "w", encoding="utf-8") as arquivo:
+            json.dump({"configuracao": config, "resumo": total, "linha_do_tempo": tempo},
+                      arquivo, indent=2, ensure_ascii=False)
+    print(f"-> Resultado salvo em '{caminho}'.")
+
+
+# ==============================================================================
+# FUNÇÃO PRINCIPAL
+# ==============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para as buscas da BuscaVetorial")
+    adicionar_argumentos_conexao(parser)
+    parser.add_argument("--indice", default=INDICE_PADRAO)
+    parser.add_argument("--arquivo-reducao",
+                        help="Projeção PCA (.npz) no lugar da registrada no _meta do índice")
+    parser.add_argument("--modo", choices=["fechada", "aberta"], default="fechada",
+                        help="fechada: N clientes simultâneos; aberta: QPS alvo fixo")
+    parser.add_argument("--clientes", type=int, default=8, help="Clientes por processo (malha fechada)")
+    parser.add_argument("--qps", type=float, default=50.0, help="QPS alvo total (malha aberta)")
+    parser.add_argument("--max-em-voo", type=int, default=256, help="Requisições simultâneas por processo (malha aberta)")
+    parser.add_argument("--processos", type=int, default=1)
+    parser.add_argument("--duracao", type=float, default=30.0, help="Duração em segundos")
+    parser.add_argument("--log", help="Log de consultas (JSONL) a reproduzir")
+    parser.add_argument("--gerar-log", type=int, default=1000, help="Tamanho do log sintético")
+    parser.add_argument("--salvar-log", help="Salva o log usado (com vetores) para reprodução")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", default="carga.json", help="Resultado (.json ou .csv com a linha do tempo)")
+    args = parser.parse_args()
+
+    log = carregar_log(args.log) if args.log else gerar_log(args.gerar_log, args.seed)
+    completar_vetores(log)
+    if args.salvar_log:
+        salvar_log(log, args.salvar_log)
+
+    # O _meta é lido uma vez: as requisições saem prontas para todos os processos
+    meta = meta_do_indice(conectar(args), args.indice)
+    consultas = preparar_consultas(log, meta, projecao_do_meta(meta, args.arquivo_reducao))
+
+    config = {
+        "host": args.host, "usuario": args.usuario, "indice": args.indice,
+        "senha": args.senha or os.environ.get("ELASTIC_PASSWORD"),
+        "modo": args.modo, "clientes": args.clientes, "qps": args.qps, "max_em_voo": args.max_em_voo,
+        "processos": args.processos, "duracao": args.duracao, "consultas": consultas,
+        "inicio_epoch": time.time() + 1.0
+    }
+
+    print(f"1. Executando carga em malha {args.modo} por {args.duracao:.0f}s "
+          f"com {args.processos} processo(s)...")
+    if args.processos == 1:
+        amostras = trabalhador(config, 0)
+    else:
+        with multiprocessing.get_context("spawn").Pool(args.processos) as pool:
+            config["inicio_epoch"] = time.time() + 5.0  # tempo para os processos subirem
+            partes = pool.starmap(trabalhador, [(config, i) for i in range(args.processos)])
+        amostras = [a for parte in partes for a in parte]
+
+    total = resumo(amostras, args.duracao)
+    tempo = linha_do_tempo(amostras)
+
+    print("\n2. Resumo:")
+    for nome, valores in total.items():
+        print(f"   {nome:<10} {valores['qps']:>8.1f} QPS  erro {valores['taxa_erro']:.2%}  "
+              f"p50 {valores['p50_ms'] or 0:.1f} ms  p99 {valores['p99_ms'] or 0:.1f} ms")
+
+    config_relatorio = {c: v for c, v in config.items() if c not in ("consultas", "senha")}
+    config_relatorio["tamanho_log"] = len(log)
+    salvar_resultado(args.saida, config_relatorio, total, tempo)
+
+
+if __name__ == "__main__":
+    main()